@@ -0,0 +1,55 @@
+"""Benchmark how long queries block the event loop.
+
+Run with ``python benchmarks/aio.py``.
+"""
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+
+from tree import make_tree
+
+import gramps_ql as gql
+
+QUERY = "class = person and event_ref_list.any.ref.get_event.description ~ farm"
+
+
+async def longest_pause(scan: Callable[[], Awaitable[int]]) -> tuple[float, float, int]:
+    """Return the run time, the longest pause of a ticker and the matches."""
+    pauses = []
+
+    async def tick() -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            pauses.append(time.perf_counter() - start)
+
+    ticker = asyncio.create_task(tick())
+    await asyncio.sleep(0.01)
+    start = time.perf_counter()
+    count = await scan()
+    seconds = time.perf_counter() - start
+    # let the ticker record the pause of a blocking scan
+    await asyncio.sleep(0.01)
+    ticker.cancel()
+    return seconds, max(pauses), count
+
+
+def main(people: int = 20000) -> None:
+    """Print the run time and the longest pause of the event loop."""
+    db = make_tree(people)
+
+    async def blocking() -> int:
+        return sum(1 for _ in gql.iter_objects(QUERY, db))
+
+    async def threaded() -> int:
+        return sum([1 async for _ in gql.aiter_objects(QUERY, db)])
+
+    for name, scan in [("iter_objects", blocking), ("aiter_objects", threaded)]:
+        seconds, pause, count = asyncio.run(longest_pause(scan))
+        print(f"{seconds:7.4f}s {pause:7.4f}s {count:6d}  {name}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
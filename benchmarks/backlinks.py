@@ -0,0 +1,57 @@
+"""Benchmark matching ``get_*`` and ``backlinks`` conditions in SQLite.
+
+Run with ``python benchmarks/backlinks.py``. Reports the time of each
+query with the ``get_*`` filters only translated per row and with them
+also inverted into the objects referring to the matching ones, which the
+planner only does if the looked up objects can be found with an index.
+"""
+
+import timeit
+from typing import Any
+
+from tree import make_tree
+
+from gramps_ql import sql
+from gramps_ql.gql import GQLQuery
+from gramps_ql.index import create_index
+
+QUERIES = [
+    "class = person and event_ref_list.any.ref.get_event.description = farmer",
+    "class = person and event_ref_list.any.ref.get_event.date.dateval[2] = 1750",
+    "class = family and father_handle.get_person.gramps_id = I0042",
+    "class = family and father_handle.get_person.primary_name.first_name = anna",
+    "class = family and child_ref_list.all.ref.get_person.gender = 0",
+    "class = event and backlinks.length > 1",
+    "class = note and backlinks.any.class = person",
+]
+
+
+def run(query: str, db: Any) -> int:
+    """Return the number of matching objects."""
+    return sum(1 for _ in GQLQuery(query, db=db).iter_objects())
+
+
+def measure(query: str, db: Any) -> float:
+    """Return the run time of a query."""
+    return min(timeit.repeat(lambda: run(query, db), number=1, repeat=3))
+
+
+def main(people: int = 20000) -> None:
+    """Print the run times of each query without and with the inversion."""
+    db = make_tree(people)
+    create_index(db, "event", "date.dateval[2]")
+    create_index(db, "event", "description")
+    referred = sql.Translator.referred
+    print("  per row  inverted  matches  query")
+    for query in QUERIES:
+        sql.Translator.referred = lambda *args: []
+        per_row = measure(query, db)
+        sql.Translator.referred = referred
+        inverted = measure(query, db)
+        matches = run(query, db)
+        print(f"{per_row:8.4f}s {inverted:8.4f}s {matches:8d}  {query}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
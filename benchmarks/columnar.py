@@ -0,0 +1,64 @@
+"""Benchmark matching in Python row by row and with the columnar engine.
+
+Run with ``python benchmarks/columnar.py`` (needs NumPy). Reports the
+time to match objects already in memory and to scan the database
+without SQLite, as for proxy databases, where decoding the JSON data of
+the objects takes most of the time.
+"""
+
+import timeit
+from typing import Any
+
+from tree import make_tree
+
+from gramps_ql import columnar, sql
+from gramps_ql.gql import GQLQuery
+
+QUERIES = [
+    "class = event and change > 0 and date.sortval > 2375000",
+    "class = event and date.sortval > 2375000 and date.modifier = 0 and private",
+    "class = person and (gender = 1 or private) and change > 0",
+    "class = event and description = farmer",
+    "class = event and date.sortval > 2375000 and description ~ farm",
+]
+
+
+def best(function: Any, repeat: int = 3) -> float:
+    """Return the best run time of a function."""
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def measure(query: str, db: Any, objects: list[Any]) -> list[float]:
+    """Return the run times row by row and columnar, in memory and scanning."""
+    rows = GQLQuery(query, db=db)
+    columns = GQLQuery(query, db=db, columnar=True)
+
+    def match_columnar() -> None:
+        for batch in columnar.batched(objects, columnar.BATCH_SIZE):
+            columnar.evaluate_batch(columns.root, batch, columns._evaluate)
+
+    return [
+        best(lambda: [rows.match(obj) for obj in objects]),
+        best(match_columnar),
+        best(lambda: sum(1 for _ in rows._matches_python())),
+        best(lambda: sum(1 for _ in columns._matches_python())),
+    ]
+
+
+def main(people: int = 20000) -> None:
+    """Print the run times of each query row by row and columnar."""
+    db = make_tree(people)
+    objects = list(GQLQuery("handle", db=db).iter_objects(as_dict=True))
+    print("       in memory              scan")
+    print("    rows  columnar      rows  columnar")
+    connect = sql.connect
+    sql.connect = lambda db: None
+    for query in QUERIES:
+        seconds = measure(query, db, objects)
+        print(" ".join(f"{second:8.4f}s" for second in seconds), "", query)
+    sql.connect = connect
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Benchmark point and range queries with and without indexes.
+
+Run with ``python benchmarks/index.py``.
+"""
+
+import time
+
+from tree import make_tree
+
+from gramps_ql import index, sql
+from gramps_ql.gql import GQLQuery
+
+QUERIES = [
+    "gramps_id = i0042",
+    "class = event and date.sortval > 2375000 and date.sortval < 2375100",
+    "class = event and description = Teacher",
+]
+
+
+def run(gq: GQLQuery, repeat: int = 5) -> tuple[float, int]:
+    """Return the best run time and the number of matches."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = sum(1 for _ in gq.iter_objects(as_dict=True))
+        best = min(best, time.perf_counter() - start)
+    return best, count
+
+
+def main(people: int = 20000) -> None:
+    """Print the run time of each query without and with indexes."""
+    db = make_tree(people)
+    index.create_index(db, "event", "date.sortval")
+    index.create_index(db, "event", "description")
+    indexes = sql.indexes
+    for query in QUERIES:
+        gq = GQLQuery(query, db=db)
+        # without any indexes, including the ones of Gramps
+        sql.indexes = lambda connection: {}
+        seconds, count = run(gq)
+        sql.indexes = indexes
+        indexed, _count = run(gq)
+        print(f"{seconds:7.4f}s {indexed:7.4f}s {count:6d}  {query}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Benchmark updating a live query against running the query again.
+
+Run with ``python benchmarks/live.py``.
+"""
+
+import time
+
+from gramps.gen.db import DbTxn
+from tree import make_tree
+
+from gramps_ql.gql import GQLQuery
+from gramps_ql.live import LiveQuery
+
+QUERIES = [
+    "class = person and gender = 1",
+    "class = person and event_ref_list.any.ref.get_event.description ~ farm",
+]
+
+
+def main(people: int = 20000, edits: int = 20) -> None:
+    """Print the time of a full run and of an edit followed by an update."""
+    db = make_tree(people)
+    handles = list(db.get_event_handles())[:edits]
+    for query in QUERIES:
+        start = time.perf_counter()
+        sum(1 for _ in GQLQuery(query, db=db).iter_objects(as_dict=True))
+        full = time.perf_counter() - start
+        live = LiveQuery(query, db)
+        start = time.perf_counter()
+        live.connect()
+        initial = time.perf_counter() - start
+        start = time.perf_counter()
+        for handle in handles:
+            with DbTxn("Edit", db) as trans:
+                event = db.get_event_from_handle(handle)
+                event.set_description("farmer")
+                db.commit_event(event, trans)
+        edit = (time.perf_counter() - start) / edits
+        live.disconnect()
+        print(f"{full:7.4f}s {initial:7.4f}s {edit:7.4f}s {len(live):6d}  {query}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
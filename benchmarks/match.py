@@ -0,0 +1,61 @@
+"""Benchmark the per-object cost of matching a compiled query.
+
+Run with ``python benchmarks/match.py``.
+"""
+
+import timeit
+
+from gramps.gen.lib import (
+    Date,
+    Event,
+    EventRef,
+    MediaRef,
+    Name,
+    Person,
+    Surname,
+)
+
+from gramps_ql.gql import GQLQuery, to_dict
+
+QUERIES = [
+    "class = person",
+    "class = person and private",
+    "primary_name.surname_list[0].surname = Smith",
+    "class = person and primary_name.first_name ~ ann or gramps_id = I0001",
+    "event_ref_list.any.role.value = 1 and media_list.length < 10",
+    "(class = family or class = person) and event_ref_list.all.private",
+]
+
+
+def make_person() -> Person:
+    """Return a person with a few nested properties."""
+    person = Person()
+    person.set_gramps_id("I0042")
+    surname = Surname()
+    surname.set_surname("Smith")
+    name = Name()
+    name.set_first_name("Anna")
+    name.add_surname(surname)
+    name.set_date_object(Date(1900, 1, 1))
+    person.set_primary_name(name)
+    for i in range(5):
+        event = Event()
+        event.set_handle(f"event{i:03d}")
+        ref = EventRef()
+        ref.set_reference_handle(event.handle)
+        person.add_event_ref(ref)
+    person.add_media_reference(MediaRef())
+    return person
+
+
+def main(number: int = 2000) -> None:
+    """Print the average time per object for each query."""
+    obj = to_dict(make_person())
+    for query in QUERIES:
+        gq = GQLQuery(query)
+        seconds = timeit.timeit(lambda gq=gq: gq.match(obj), number=number)
+        print(f"{seconds / number * 1e6:9.1f} µs/object  {query}")
+
+
+if __name__ == "__main__":
+    main()
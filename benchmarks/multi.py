@@ -0,0 +1,39 @@
+"""Benchmark matching several queries in one pass.
+
+Run with ``python benchmarks/multi.py``.
+"""
+
+import time
+
+from tree import make_tree
+
+import gramps_ql as gql
+
+QUERIES = {
+    "anna": "class = person and primary_name.first_name ~ ann",
+    "women": "class = person and gender = 0",
+    "private women": "class = person and gender = 0 and private",
+    "farmers": "event_ref_list.any.ref.get_event.description ~ farmer",
+    "female farmers": (
+        "gender = 0 and event_ref_list.any.ref.get_event.description ~ farmer"
+    ),
+    "farm events": "class = event and description ~ farm",
+}
+
+
+def main(people: int = 20000) -> None:
+    """Print the run time of separate queries and of a single pass."""
+    db = make_tree(people)
+    start = time.perf_counter()
+    separate = sum(
+        sum(1 for _ in gql.iter_objects(query, db)) for query in QUERIES.values()
+    )
+    print(f"separate  {time.perf_counter() - start:6.3f}s  {separate:6d} matches")
+    start = time.perf_counter()
+    combined = sum(len(ids) for _obj, ids in gql.iter_matches(QUERIES, db))
+    print(f"one pass  {time.perf_counter() - start:6.3f}s  {combined:6d} matches")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Benchmark ordered queries against sorting all matches in Python.
+
+Run with ``python benchmarks/order.py``.
+"""
+
+import time
+import tracemalloc
+from collections.abc import Callable
+from functools import partial
+from typing import Any
+
+from tree import make_tree
+
+from gramps_ql import sql
+from gramps_ql.gql import GQLQuery
+
+QUERIES = [
+    "class = person order by change desc",
+    "class = person and gender = 1 order by primary_name.first_name, gramps_id",
+    "class = event and description ~ farm order by date.sortval desc",
+]
+
+
+def run(function: Callable[[], list[Any]], repeat: int = 3) -> tuple[float, int]:
+    """Return the best run time and the peak memory in bytes."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    _size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def sort_python(query: str, db: Any, limit: int) -> list[Any]:
+    """Return the first matches of a query, sorting all of them in Python."""
+    condition, order = query.split(" order by ")
+    key = order.split(",")[0].split()[0]
+    values = GQLQuery(condition, db=db).iter_values([key, "handle"], as_dict=True)
+    return sorted(values, key=lambda value: value[key] or 0)[:limit]
+
+
+def sort_query(gq: GQLQuery, limit: int) -> list[Any]:
+    """Return the first matches of an ordered query."""
+    return list(gq.iter_objects(as_dict=True, limit=limit))
+
+
+def main(people: int = 20000, limit: int = 50) -> None:
+    """Print the time and memory of sorting in Python, SQLite and a heap."""
+    db = make_tree(people)
+    connect = sql.connect
+    for query in QUERIES:
+        gq = GQLQuery(query, db=db)
+        results = [
+            run(partial(sort_python, query, db, limit)),
+            run(partial(sort_query, gq, limit)),
+        ]
+        # the bounded heap, without SQLite
+        sql.connect = lambda db: None
+        results.append(run(partial(sort_query, gq, limit)))
+        sql.connect = connect
+        timings = " ".join(f"{s:7.4f}s {peak / 1e6:6.1f}MB" for s, peak in results)
+        print(f"{timings}  {query}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""Benchmark matching in worker processes.
+
+Run with ``python benchmarks/parallel.py [workers ...]``.
+"""
+
+import sys
+import time
+
+from tree import make_tree
+
+from gramps_ql.gql import GQLQuery
+
+QUERIES = [
+    "class = person and primary_name.first_name ~ ann",
+    "event_ref_list.any.ref.get_event.description ~ farmer",
+    "description ~ farm or gender = 1",
+]
+
+
+def main(people: int = 20000, workers: tuple[int, ...] = (2, 4, 8)) -> None:
+    """Print the serial and parallel run time of each query."""
+    db = make_tree(people)
+    for query in QUERIES:
+        gq = GQLQuery(query, db=db)
+        start = time.perf_counter()
+        count = sum(1 for _ in gq.iter_objects())
+        times = [f"serial {time.perf_counter() - start:6.3f}s"]
+        for number in workers:
+            start = time.perf_counter()
+            sum(1 for _ in gq.iter_objects_parallel(workers=number))
+            times.append(f"{number}: {time.perf_counter() - start:6.3f}s")
+        print(f"{'  '.join(times)}  {count:6d}  {query}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main(workers=tuple(int(arg) for arg in sys.argv[1:]) or (2, 4, 8))
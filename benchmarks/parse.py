@@ -0,0 +1,75 @@
+"""Benchmark parsing queries and importing the parser.
+
+Run with ``python benchmarks/parse.py``. Compares the pyparsing grammar
+(``parse``) with the hand-written parser (``parse_query``).
+"""
+
+import subprocess
+import sys
+import timeit
+
+from gramps_ql.gql import parse
+from gramps_ql.parser import parse_query
+
+
+def long_query(conditions: int = 200) -> str:
+    """Return a machine-generated query with nested parentheses."""
+    parts = [
+        f"(gramps_id = I{i:04d} or primary_name.first_name ~ 'name {i}')"
+        for i in range(conditions)
+    ]
+    return "class = person and (" + " or ".join(parts) + ")"
+
+
+QUERIES = {
+    "short": "class = person",
+    "readme": (
+        "class = family and child_ref_list.all.ref.get_person.gender = 0"
+        " and child_ref_list.length = 3"
+    ),
+    "nested": "(" * 12
+    + "class=person or name='John Doe'"
+    + ")" * 6
+    + " and a"
+    + ")" * 6,
+    "long": long_query(),
+}
+
+IMPORT = (
+    "import time, {module}; t = time.perf_counter(); import {target}; "
+    "print(time.perf_counter() - t)"
+)
+
+
+def import_time(module: str, target: str, repeat: int = 5) -> float:
+    """Return the best time to import a module after another one in a new process."""
+    code = IMPORT.format(module=module, target=target)
+    return min(
+        float(
+            subprocess.run(
+                [sys.executable, "-c", code], capture_output=True, text=True, check=True
+            ).stdout
+        )
+        for _ in range(repeat)
+    )
+
+
+def main(number: int = 100) -> None:
+    """Print the parse times per query and the import times."""
+    for name, query in QUERIES.items():
+        assert parse_query(query) == parse(query).as_list()
+        # the packrat cache is reset for every parse_string call
+        legacy = timeit.timeit(lambda q=query: parse(q), number=number)
+        new = timeit.timeit(lambda q=query: parse_query(q), number=number)
+        print(
+            f"{legacy / number * 1e6:10.1f} µs {new / number * 1e6:8.1f} µs  "
+            f"{name} ({len(query)} characters)"
+        )
+    grammar = import_time("gramps_ql", "gramps_ql.grammar")
+    parser = import_time("gramps", "gramps_ql")
+    print(f"importing the pyparsing grammar: {grammar * 1e3:.1f} ms (now lazy)")
+    print(f"importing gramps_ql (after gramps): {parser * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Benchmark prefetching the objects followed by ``get_*`` steps.
+
+Run with ``python benchmarks/prefetch.py``. Matching happens in Python
+(as it does for proxy databases or during a transaction), with and
+without bulk fetching the referenced objects.
+"""
+
+import time
+
+from tree import make_tree
+
+from gramps_ql.cache import HandleCache
+from gramps_ql.gql import GQLQuery
+
+QUERIES = [
+    "class = person and event_ref_list.any.ref.get_event.description ~ farmer",
+    "class = person and event_ref_list.all.ref.get_event.date.dateval[2] > 1800",
+    "class = family and child_ref_list.all.ref.get_person.gender = 0",
+    (
+        "class = family and child_ref_list.any.ref.get_person.event_ref_list.any"
+        ".ref.get_event.description = baker"
+    ),
+    "note_list.any.get_note.text.string ~ David",
+]
+
+
+def run(gq: GQLQuery, prefetch: int, repeat: int = 3) -> tuple[float, int]:
+    """Return the best run time and the number of matches."""
+    best = float("inf")
+    for _ in range(repeat):
+        gq.cache = HandleCache(maxsize=100000)
+        start = time.perf_counter()
+        count = sum(1 for _ in gq._matches_python(prefetch=prefetch))
+        best = min(best, time.perf_counter() - start)
+    return best, count
+
+
+def main(people: int = 5000, prefetch: int = 200) -> None:
+    """Print the run time of each query without and with prefetching."""
+    db = make_tree(people)
+    for query in QUERIES:
+        gq = GQLQuery(query, db=db)
+        seconds, count = run(gq, 0)
+        prefetched, _count = run(gq, prefetch)
+        print(f"{seconds:7.3f}s {prefetched:7.3f}s {count:6d}  {query}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
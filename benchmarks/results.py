@@ -0,0 +1,56 @@
+"""Benchmark re-running traversal queries with and without a result cache.
+
+Run with ``python benchmarks/results.py``. Reports the time of the first
+run, which matches the objects and stores their handles, and of a
+repeated run on the unchanged database, which loads the stored matches.
+"""
+
+import os
+import tempfile
+import timeit
+from typing import Any
+
+from tree import make_tree
+
+from gramps_ql.cache import ResultCache
+from gramps_ql.gql import GQLQuery
+
+QUERIES = [
+    "class = person and event_ref_list.any.ref.get_event.description = farmer",
+    (
+        "class = person and event_ref_list.any.ref.get_event.place.get_place"
+        ".name.value ~ York"
+    ),
+    "class = family and child_ref_list.all.ref.get_person.gender = 0",
+    "note_list.any.get_note.text.string ~ David",
+]
+
+
+def run(query: str, db: Any, results: ResultCache | None) -> int:
+    """Return the number of matching objects."""
+    return sum(1 for _ in GQLQuery(query, db=db, results=results).iter_objects())
+
+
+def measure(query: str, db: Any, results: ResultCache) -> list[float]:
+    """Return the run times uncached, storing the result and served by it."""
+    uncached = min(timeit.repeat(lambda: run(query, db, None), number=1))
+    results.clear()
+    first = timeit.timeit(lambda: run(query, db, results), number=1)
+    repeated = min(timeit.repeat(lambda: run(query, db, results), number=1))
+    return [uncached, first, repeated]
+
+
+def main(people: int = 20000) -> None:
+    """Print the run times of each query without and with the result cache."""
+    db = make_tree(people)
+    results = ResultCache(os.path.join(tempfile.mkdtemp(), "results.db"))
+    print("  uncached     first  repeated  matches  query")
+    for query in QUERIES:
+        seconds = measure(query, db, results)
+        matches = run(query, db, results)
+        print("".join(f"{second:9.4f}s" for second in seconds), f"{matches:8d}", query)
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
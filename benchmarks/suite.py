@@ -0,0 +1,150 @@
+"""Benchmark a corpus of representative queries on a generated tree.
+
+Run with ``python benchmarks/suite.py``. For every query, reports the
+time to parse and compile it, the time to match one object, the scan
+throughput of ``iter_objects`` (objects of the target classes per
+second) and the peak memory of the scan. With ``--output``, the
+results are stored as JSON, and ``--compare`` prints the ratio to
+stored results, e.g. of the main branch.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import timeit
+import tracemalloc
+from typing import Any
+
+from tree import make_tree
+
+from gramps_ql import query_cache
+from gramps_ql.gql import GRAMPS_OBJECT_NAMES, GQLQuery, compile_query
+
+# the examples of the README and a few more
+QUERIES = [
+    "class = tag",
+    "class = note and private and text.string ~ David",
+    "media_list.length >= 10",
+    "class != person and media_list.any.rect",
+    "class = family and child_ref_list.length > 5",
+    "class = event and date.modifier = 0 and date.dateval[2] > 2020",
+    'note_list.any.get_note.text.string ~ "David"',
+    (
+        "class = family and child_ref_list.all.ref.get_person.gender = 0"
+        " and child_ref_list.length = 3"
+    ),
+    "class = person and primary_name.surname_list[0].surname = Smith",
+    (
+        "class = person and event_ref_list.any.ref.get_event.place.get_place"
+        ".name.value ~ York"
+    ),
+    "class = person and gender = 1 order by primary_name.first_name",
+]
+
+# measurements above this ratio to the baseline are regressions
+THRESHOLD = 1.2
+
+
+def best(function: Any, repeat: int) -> float:
+    """Return the best run time of a function."""
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def measure(db: Any, query: str, sample: list[dict[str, Any]], repeat: int) -> dict:
+    """Return the measurements of a query."""
+
+    def parse() -> None:
+        query_cache.clear()
+        compile_query(query)
+
+    parse_seconds = best(parse, repeat=20)
+    gq = GQLQuery(query, db=db)
+    match_seconds = best(lambda: [gq.match(obj) for obj in sample], repeat)
+    objects = sum(
+        getattr(db, f"get_number_of_{GRAMPS_OBJECT_NAMES[name]}")()
+        for name in gq.target_classes
+    )
+    matches = sum(1 for _ in gq.iter_objects())
+    scan_seconds = best(lambda: sum(1 for _ in gq.iter_objects()), repeat)
+    tracemalloc.start()
+    sum(1 for _ in gq.iter_objects())
+    _size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "parse_us": parse_seconds * 1e6,
+        "match_us": match_seconds / len(sample) * 1e6,
+        "scan_s": scan_seconds,
+        "objects_per_s": objects / scan_seconds,
+        "peak_kb": peak / 1e3,
+        "matches": matches,
+    }
+
+
+def compare(results: dict, baseline: dict) -> None:
+    """Print the ratios of the measurements to a baseline."""
+    print("\nratio to the baseline (above 1 is slower or larger)")
+    print("  parse    match     scan   memory  query")
+    regressions = 0
+    for query, measured in results["queries"].items():
+        old = baseline["queries"].get(query)
+        if old is None:
+            continue
+        ratios = {
+            key: measured[key] / old[key] if old[key] else 1.0
+            for key in ("parse_us", "match_us", "scan_s", "peak_kb")
+        }
+        flags = [key for key, ratio in ratios.items() if ratio > THRESHOLD]
+        regressions += bool(flags)
+        columns = " ".join(f"{ratio:8.2f}" for ratio in ratios.values())
+        print(
+            f"{columns}  {query}{'  REGRESSION: ' + ', '.join(flags) if flags else ''}"
+        )
+    print(f"{regressions} queries above {THRESHOLD:.0%} of the baseline")
+
+
+def main() -> None:
+    """Run the benchmarks and print, store and compare the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--people", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="store the results as JSON")
+    parser.add_argument("--compare", help="compare with stored results")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    db = make_tree(args.people)
+    print(f"tree with {args.people} people in {time.perf_counter() - start:.1f}s")
+    sample = [
+        obj_dict
+        for name in ("person", "family", "event")
+        for obj_dict in GQLQuery(f"class = {name}", db=db).iter_objects(
+            as_dict=True, limit=500
+        )
+    ]
+    results: dict[str, Any] = {
+        "people": args.people,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "queries": {},
+    }
+    print("  parse µs  match µs    scan s  objects/s  peak kB  matches  query")
+    for query in QUERIES:
+        measured = measure(db, query, sample, args.repeat)
+        results["queries"][query] = measured
+        print(
+            f"{measured['parse_us']:10.1f}{measured['match_us']:10.2f}"
+            f"{measured['scan_s']:10.4f}{measured['objects_per_s']:11.0f}"
+            f"{measured['peak_kb']:9.0f}{measured['matches']:9d}  {query}"
+        )
+    db.close()
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            compare(results, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Generate a random family tree in a temporary Gramps SQLite database."""
+
+import os
+import random
+import tempfile
+
+from gramps.cli.clidbman import CLIDbManager
+from gramps.gen.db import DbReadBase, DbTxn
+from gramps.gen.db.utils import make_database
+from gramps.gen.dbstate import DbState
+from gramps.gen.lib import (
+    ChildRef,
+    Date,
+    Event,
+    EventRef,
+    Family,
+    Media,
+    MediaRef,
+    Name,
+    Note,
+    Person,
+    Place,
+    PlaceName,
+    PlaceRef,
+    Surname,
+    Tag,
+)
+
+FIRST_NAMES = ["Anna", "John", "Eve", "Ludwig", "Maria", "Jürgen"]
+SURNAMES = ["Smith", "Doe", "Müller", "Straße", "O'Brien"]
+DESCRIPTIONS = ["farmer", "baker", "smith", "teacher", ""]
+NOTES = ["Hello David", "farm", "Emigrated to America", ""]
+PLACES = ["York", "New York", "Berlin", "Wien", "Dublin"]
+TAGS = ["ToDo", "Complete", "Research"]
+
+
+def make_tree(
+    people: int = 5000,
+    events_per_person: int = 6,
+    children_per_family: int = 6,
+    seed: int = 1,
+) -> DbReadBase:
+    """Return a database with random people, families, events and more.
+
+    Every person refers to up to ``events_per_person`` events, every
+    family to a father, a mother and up to ``children_per_family``
+    children, and the people refer back to their families. Events refer
+    to places, and people, families and events to notes, media (a few of
+    them to ten or more) and tags. The same ``seed`` creates the same
+    tree, including the handles. The database is created in a new
+    directory below the system's temporary directory.
+    """
+    rng = random.Random(seed)
+
+    def handle() -> str:
+        return f"{rng.getrandbits(96):024x}"
+
+    os.environ["GRAMPSHOME"] = tempfile.mkdtemp()
+    dbman = CLIDbManager(DbState())
+    path, _name = dbman.create_new_db_cli("GQL Benchmark", dbid="sqlite")
+    db = make_database("sqlite")
+    db.load(path)
+    with DbTxn("Generate tree", db) as trans:
+        tags = []
+        for name in TAGS:
+            tag = Tag()
+            tag.set_handle(handle())
+            tag.set_name(name)
+            db.add_tag(tag, trans)
+            tags.append(tag.handle)
+        notes = []
+        for _ in range(people // 5):
+            note = Note()
+            note.set_handle(handle())
+            note.set(rng.choice(NOTES))
+            note.set_privacy(rng.random() < 0.1)
+            db.add_note(note, trans)
+            notes.append(note.handle)
+        media = []
+        for i in range(max(1, people // 20)):
+            obj = Media()
+            obj.set_handle(handle())
+            obj.set_path(f"photos/{i:05d}.jpg")
+            obj.set_mime_type("image/jpeg")
+            db.add_media(obj, trans)
+            media.append(obj.handle)
+        places = []
+        for i in range(max(1, people // 10)):
+            place = Place()
+            place.set_handle(handle())
+            place.set_name(PlaceName(value=f"{rng.choice(PLACES)} {i}"))
+            if places and rng.random() < 0.5:
+                place_ref = PlaceRef()
+                place_ref.set_reference_handle(rng.choice(places))
+                place.add_placeref(place_ref)
+            db.add_place(place, trans)
+            places.append(place.handle)
+
+        def add_references(obj: Person | Family | Event, with_media: bool) -> None:
+            if rng.random() < 0.3:
+                obj.add_note(rng.choice(notes))
+            if rng.random() < 0.2:
+                obj.add_tag(rng.choice(tags))
+            if not with_media:
+                return
+            roll = rng.random()
+            count = 0 if roll < 0.7 else rng.randint(10, 15) if roll > 0.98 else 1
+            for _ in range(count):
+                media_ref = MediaRef()
+                media_ref.set_reference_handle(rng.choice(media))
+                if rng.random() < 0.3:
+                    media_ref.set_rectangle((10, 10, 50, 50))
+                obj.add_media_reference(media_ref)
+
+        events = []
+        for i in range(people * events_per_person // 2):
+            event = Event()
+            event.set_handle(handle())
+            event.set_description(rng.choice(DESCRIPTIONS))
+            date = Date(1700 + i % 330, 1 + i % 12, 1 + i % 28)
+            if rng.random() < 0.1:
+                date.set_modifier(Date.MOD_ABOUT)
+            event.set_date_object(date)
+            if rng.random() < 0.8:
+                event.set_place_handle(rng.choice(places))
+            add_references(event, with_media=False)
+            db.add_event(event, trans)
+            events.append(event.handle)
+        persons = []
+        for _ in range(people):
+            person = Person()
+            person.set_handle(handle())
+            surname = Surname()
+            surname.set_surname(rng.choice(SURNAMES))
+            name = Name()
+            name.set_first_name(rng.choice(FIRST_NAMES))
+            name.add_surname(surname)
+            person.set_primary_name(name)
+            person.set_gender(rng.randint(0, 2))
+            person.set_privacy(rng.random() < 0.1)
+            for _ in range(rng.randint(0, events_per_person)):
+                event_ref = EventRef()
+                event_ref.set_reference_handle(rng.choice(events))
+                person.add_event_ref(event_ref)
+            add_references(person, with_media=True)
+            persons.append(person)
+        for _ in range(people // 3):
+            family = Family()
+            family.set_handle(handle())
+            for parent, set_parent in [
+                (rng.choice(persons), family.set_father_handle),
+                (rng.choice(persons), family.set_mother_handle),
+            ]:
+                set_parent(parent.handle)
+                parent.add_family_handle(family.handle)
+            for _ in range(rng.randint(0, children_per_family)):
+                child = rng.choice(persons)
+                child_ref = ChildRef()
+                child_ref.set_reference_handle(child.handle)
+                family.add_child_ref(child_ref)
+                child.add_parent_family_handle(family.handle)
+            add_references(family, with_media=True)
+            db.add_family(family, trans)
+        for person in persons:
+            db.add_person(person, trans)
+    return db
@@ -0,0 +1,92 @@
+"""Benchmark matching Gramps objects as dictionaries and as lazy views.
+
+Run with ``python benchmarks/views.py``. Reports the time and peak memory
+of matching Gramps objects in memory with ``match`` and of scanning a
+proxy database, where every object is converted for matching.
+"""
+
+import timeit
+import tracemalloc
+from collections.abc import Callable, Generator, Iterable, Mapping
+from typing import Any
+
+from gramps.gen.proxy import PrivateProxyDb
+from tree import make_tree
+
+from gramps_ql.gql import GQLQuery, GrampsObject, to_dict
+from gramps_ql.views import ObjectView
+
+QUERIES = [
+    "class = person and gender = 0",
+    "class = person and primary_name.first_name = anna",
+    "class = family and child_ref_list.length > 5",
+    "class = event and date.sortval > 2375000",
+]
+
+
+class DictQuery(GQLQuery):
+    """A query converting the objects with ``to_dict`` for matching."""
+
+    @staticmethod
+    def _raw_candidates(
+        cursor: Iterable[tuple[str, dict[str, Any]]], class_name: str
+    ) -> Generator[tuple[GrampsObject | None, Mapping[str, Any]], None, None]:
+        """Convert the objects of the cursor to dictionaries."""
+        for _handle, data in cursor:
+            obj = data["_object"]
+            yield obj, to_dict(obj)
+
+
+def measure(function: Callable[[], Any], repeat: int = 3) -> tuple[float, float]:
+    """Return the best run time and the peak memory in MB of a function."""
+    seconds = min(timeit.repeat(function, number=1, repeat=repeat))
+    tracemalloc.start()
+    function()
+    _size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak / 1e6
+
+
+def compare_match(query: str, objects: list[GrampsObject]) -> list[float]:
+    """Measure matching objects in memory, keeping the converted objects."""
+    gq = GQLQuery(query)
+
+    def match(convert: Callable[[GrampsObject], Mapping[str, Any]]) -> Any:
+        converted = [convert(obj) for obj in objects]
+        return [gq.match(obj_dict) for obj_dict in converted], converted
+
+    return [*measure(lambda: match(to_dict)), *measure(lambda: match(ObjectView))]
+
+
+def compare_scan(query: str, proxy: Any) -> list[float]:
+    """Measure iterating over the objects of a proxy database."""
+    dicts = DictQuery(query, db=proxy)
+    views = GQLQuery(query, db=proxy)
+    return [
+        # proxies are slow, one run each
+        *measure(lambda: sum(1 for _ in dicts.iter_objects()), repeat=1),
+        *measure(lambda: sum(1 for _ in views.iter_objects()), repeat=1),
+    ]
+
+
+def main(people: int = 20000) -> None:
+    """Print the run time and peak memory with dictionaries and views."""
+    db = make_tree(people)
+    objects = list(GQLQuery("class = person or class = event", db=db).iter_objects())
+    print("          dicts                 views")
+    for query in QUERIES:
+        results = compare_match(query, objects)
+        print(
+            "{:7.4f}s {:7.1f}MB   {:7.4f}s {:7.1f}MB  match {}".format(*results, query)
+        )
+    proxy = PrivateProxyDb(db)
+    for query in QUERIES:
+        results = compare_scan(query, proxy)
+        print(
+            "{:7.4f}s {:7.1f}MB   {:7.4f}s {:7.1f}MB  proxy {}".format(*results, query)
+        )
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
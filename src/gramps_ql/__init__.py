@@ -13,9 +13,26 @@ except ImportError:
 __all__ = (
     "__version__",
     "__version_tuple__",
+    "acount",
+    "aiter_objects",
+    "count",
+    "exists",
+    "iter_matches",
     "iter_objects",
+    "iter_values",
     "match",
     "parse",
+    "query_cache",
 )
 
-from .gql import iter_objects, match, parse
+from .aio import acount, aiter_objects
+from .gql import (
+    count,
+    exists,
+    iter_objects,
+    iter_values,
+    match,
+    parse,
+    query_cache,
+)
+from .multi import iter_matches
@@ -0,0 +1,218 @@
+"""Run queries from asyncio code.
+
+The objects are matched in worker threads, each with its own read-only
+connection to the SQLite file, and handed to the event loop in chunks
+through a bounded queue. A ``ReadPool`` of threads and connections is
+shared by all concurrent queries.
+"""
+
+import asyncio
+import sqlite3
+import threading
+from collections.abc import AsyncGenerator, Callable, Iterator, Mapping
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from typing import Any, TypeVar
+
+from gramps.gen.db import DbReadBase
+
+from . import sql
+from .cache import HandleCache
+from .gql import GQLQuery, GrampsObject, batched
+
+# objects handed to the event loop at once
+CHUNK_SIZE = 100
+# chunks waiting for the event loop before the worker pauses
+MAX_CHUNKS = 4
+
+T = TypeVar("T")
+
+
+class ReadPool:
+    """Worker threads with read-only connections to Gramps SQLite files.
+
+    Every thread opens one connection per file and keeps it for the
+    following queries. ``close`` waits for running queries to finish.
+    """
+
+    def __init__(self, max_workers: int = 4) -> None:
+        """Initialize self."""
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="gramps-ql"
+        )
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._readable: dict[str, bool] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, function: Callable[[], T]) -> "Future[T]":
+        """Run a function in a worker thread."""
+        return self._executor.submit(function)
+
+    def readable(self, path: str) -> bool:
+        """Return whether the threads can open their own connections to a file.
+
+        This is not the case if SQLite lacks JSON support (see
+        ``sql.open_database``).
+        """
+        with self._lock:
+            if path not in self._readable:
+                connection = sql.open_database(path)
+                self._readable[path] = connection is not None
+                if connection is not None:
+                    connection.close()
+            return self._readable[path]
+
+    def connection(self, path: str) -> sqlite3.Connection:
+        """Return the current thread's connection to a file."""
+        connections: dict[str, sqlite3.Connection] = self._local.__dict__.setdefault(
+            "connections", {}
+        )
+        if path not in connections:
+            # closed by close() from another thread
+            connection = sql.open_database(path, check_same_thread=False)
+            if connection is None:
+                # the database's own connection must not be used from here
+                raise RuntimeError(f"Cannot open {path} in a worker thread")
+            connections[path] = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connections[path]
+
+    def close(self) -> None:
+        """Stop the threads and close their connections."""
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+
+
+_default_pool: ReadPool | None = None
+_default_pool_lock = threading.Lock()
+
+
+def default_pool() -> ReadPool:
+    """Return the pool used by queries without a pool of their own."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ReadPool()
+        return _default_pool
+
+
+class _PooledQuery(GQLQuery):
+    """A query reading with the connection of a pool's current thread."""
+
+    def __init__(self, query: str, db: DbReadBase, pool: ReadPool, path: str) -> None:
+        """Initialize self."""
+        super().__init__(query, db=db)
+        self.pool = pool
+        self.path = path
+
+    @contextmanager
+    def _run(self) -> Iterator[sqlite3.Connection | None]:
+        """Prepare a run, using the thread's connection without closing it."""
+        if self.cache is None:
+            self._run_cache = HandleCache()
+        try:
+            yield self.pool.connection(self.path)
+        finally:
+            self._run_cache = None
+
+    def _load(self, class_name: str, handle: str) -> Mapping[str, Any] | None:
+        """Look up an object with the thread's connection."""
+        return sql.load(self.pool.connection(self.path), class_name, handle)
+
+    def _backlink_handles(self, handle: str) -> list[tuple[str, str]]:
+        """Look up the objects referring to an object with the thread's connection."""
+        return sql.backlinks(self.pool.connection(self.path), handle)
+
+
+def _pooled_query(
+    query: str, db: DbReadBase, pool: ReadPool | None
+) -> _PooledQuery | None:
+    """Return the query for a pool, or None if it must run in the event loop."""
+    path = sql.database_file(db)
+    pool = pool or default_pool()
+    if path is None or not pool.readable(path):
+        return None
+    return _PooledQuery(query, db, pool, path)
+
+
+async def aiter_objects(
+    query: str,
+    db: DbReadBase,
+    as_dict: bool = False,
+    limit: int | None = None,
+    offset: int = 0,
+    chunk_size: int = CHUNK_SIZE,
+    max_chunks: int = MAX_CHUNKS,
+    pool: ReadPool | None = None,
+) -> AsyncGenerator[GrampsObject | dict[str, Any], None]:
+    """Iterate asynchronously over the objects matching a query.
+
+    The worker pauses while ``max_chunks`` chunks of ``chunk_size``
+    objects wait for the event loop, and stops when the iteration is
+    closed or cancelled. Databases that cannot be read with separate
+    connections (see ``sql.connect`` and ``ReadPool.readable``) are
+    iterated in the event loop, which is given back control after every
+    chunk.
+    """
+    gq = _pooled_query(query, db, pool)
+    if gq is None:
+        objects = GQLQuery(query, db=db).iter_objects(
+            as_dict=as_dict, limit=limit, offset=offset
+        )
+        with closing(objects):
+            for chunk in batched(objects, chunk_size):
+                for obj in chunk:
+                    yield obj
+                await asyncio.sleep(0)
+        return
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[list[Any] | None] = asyncio.Queue(max_chunks)
+    stop = threading.Event()
+
+    def put(chunk: list[Any] | None) -> None:
+        asyncio.run_coroutine_threadsafe(queue.put(chunk), loop).result()
+
+    def produce() -> None:
+        try:
+            objects = gq.iter_objects(as_dict=as_dict, limit=limit, offset=offset)
+            # the cursors are closed in the thread that opened them
+            with closing(objects):
+                for chunk in batched(objects, chunk_size):
+                    if stop.is_set():
+                        return
+                    put(chunk)
+        finally:
+            # also after an error, which is raised by awaiting the producer
+            if not stop.is_set():
+                put(None)
+
+    producer = asyncio.wrap_future(gq.pool.submit(produce))
+    try:
+        while (received := await queue.get()) is not None:
+            for obj in received:
+                yield obj
+        await producer
+    finally:
+        stop.set()
+        # unblock the worker if it waits for room in the queue
+        while not queue.empty():
+            queue.get_nowait()
+        await asyncio.wait([producer])
+
+
+async def acount(query: str, db: DbReadBase, pool: ReadPool | None = None) -> int:
+    """Count the objects matching a query in a worker thread.
+
+    Cancelling stops waiting for the count, not the count itself.
+    Databases that cannot be read with separate connections are counted
+    in the event loop.
+    """
+    gq = _pooled_query(query, db, pool)
+    if gq is None:
+        return GQLQuery(query, db=db).count()
+    return await asyncio.wrap_future(gq.pool.submit(gq.count))
@@ -0,0 +1,379 @@
+"""Caches for evaluating GQL queries."""
+
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Iterable, Iterator, Mapping, Sequence
+from contextlib import closing, contextmanager
+from typing import Any, Generic, NamedTuple, TypeVar
+
+from gramps.gen.db import DbReadBase
+
+from .sql import TABLES
+
+# the dictionary representation of a looked up object, None if it is missing
+Loaded = Mapping[str, Any] | None
+
+T = TypeVar("T")
+
+
+class CacheInfo(NamedTuple):
+    """Statistics of a cache."""
+
+    hits: int
+    misses: int
+    evictions: int
+    maxsize: int
+    currsize: int
+
+
+class HandleCache:
+    """Least-recently-used cache of objects looked up by handle.
+
+    Used for the ``get_*`` steps of a query. Cached values are shared
+    between lookups and must not be modified. A cache that outlives a
+    single query run must be invalidated when the database changes, e.g.
+    by connecting it to the database signals with ``connect``.
+    """
+
+    def __init__(self, maxsize: int = 10000) -> None:
+        """Initialize self."""
+        if maxsize < 0:
+            raise ValueError("maxsize must not be negative")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: OrderedDict[tuple[str, str], Loaded] = OrderedDict()
+        self._signal_keys: list[tuple[DbReadBase, int]] = []
+
+    def __len__(self) -> int:
+        """Return the number of cached objects."""
+        return len(self._data)
+
+    def __contains__(self, key: tuple[str, str]) -> bool:
+        """Return whether the object with a class name and handle is cached."""
+        return key in self._data
+
+    def lookup(
+        self, class_name: str, handle: str, load: Callable[[str, str], Loaded]
+    ) -> Loaded:
+        """Return a cached object, loading and caching it if needed."""
+        key = (class_name, handle)
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._data.move_to_end(key)
+            return value
+        value = load(class_name, handle)
+        self.store(class_name, handle, value)
+        return value
+
+    def peek(self, class_name: str, handle: str) -> Loaded:
+        """Return a cached object without loading it or counting the access."""
+        return self._data.get((class_name, handle))
+
+    def store(self, class_name: str, handle: str, value: Loaded) -> None:
+        """Add a loaded object (None if it is missing) to the cache."""
+        if not self.maxsize:
+            return
+        key = (class_name, handle)
+        self._data[key] = value
+        self._data.move_to_end(key)
+        self._evict()
+
+    def _evict(self) -> None:
+        """Remove the least recently used objects exceeding the size."""
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def resize(self, maxsize: int) -> None:
+        """Change the maximum number of cached objects."""
+        if maxsize < 0:
+            raise ValueError("maxsize must not be negative")
+        self.maxsize = maxsize
+        self._evict()
+
+    def invalidate(self, class_name: str, handles: Iterable[str] | None = None) -> None:
+        """Remove objects of a class (by default all of them) from the cache."""
+        if handles is None:
+            for key in [key for key in self._data if key[0] == class_name]:
+                del self._data[key]
+            return
+        for handle in handles:
+            self._data.pop((class_name, handle), None)
+
+    def clear(self) -> None:
+        """Remove all objects from the cache and reset the statistics."""
+        self._data.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def info(self) -> CacheInfo:
+        """Return the cache statistics."""
+        return CacheInfo(
+            self.hits, self.misses, self.evictions, self.maxsize, len(self._data)
+        )
+
+    def connect(self, db: DbReadBase) -> None:
+        """Invalidate cached objects when they change in a database.
+
+        Uses the ``<class>-add``, ``-update``, ``-delete`` and ``-rebuild``
+        signals emitted by writable Gramps databases.
+        """
+        for class_name in TABLES:
+            for signal in ("add", "update", "delete"):
+                key = db.connect(
+                    f"{class_name}-{signal}", self._handles_changed(class_name)
+                )
+                self._signal_keys.append((db, key))
+            key = db.connect(f"{class_name}-rebuild", self._rebuilt(class_name))
+            self._signal_keys.append((db, key))
+
+    def disconnect(self) -> None:
+        """Disconnect from all database signals."""
+        for db, key in self._signal_keys:
+            db.disconnect(key)
+        self._signal_keys = []
+
+    def _handles_changed(self, class_name: str) -> Callable[[list[str]], None]:
+        """Return a signal callback invalidating changed handles."""
+
+        def callback(handles: list[str]) -> None:
+            # also for added objects, which might be cached as missing
+            self.invalidate(class_name, handles)
+
+        return callback
+
+    def _rebuilt(self, class_name: str) -> Callable[[], None]:
+        """Return a signal callback invalidating a whole class."""
+
+        def callback() -> None:
+            self.invalidate(class_name)
+
+        return callback
+
+
+class QueryCache(Generic[T]):
+    """Thread-safe least-recently-used cache of compiled queries.
+
+    Keyed by the query text. Queries that fail to compile are not cached.
+    """
+
+    def __init__(self, compile: Callable[[str], T], maxsize: int = 512) -> None:
+        """Initialize self."""
+        if maxsize < 0:
+            raise ValueError("maxsize must not be negative")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._compile = compile
+        self._data: OrderedDict[str, T] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of cached queries."""
+        return len(self._data)
+
+    def get(self, query: str) -> T:
+        """Return a compiled query, compiling and caching it if needed."""
+        with self._lock:
+            try:
+                compiled = self._data[query]
+            except KeyError:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._data.move_to_end(query)
+                return compiled
+        # compile without holding the lock; a concurrent miss for the same
+        # query compiles it twice, which is harmless
+        compiled = self._compile(query)
+        with self._lock:
+            if self.maxsize:
+                self._data[query] = compiled
+                self._data.move_to_end(query)
+                self._evict()
+        return compiled
+
+    def _evict(self) -> None:
+        """Remove the least recently used queries exceeding the size."""
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def resize(self, maxsize: int) -> None:
+        """Change the maximum number of cached queries."""
+        if maxsize < 0:
+            raise ValueError("maxsize must not be negative")
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def clear(self) -> None:
+        """Remove all queries from the cache and reset the statistics."""
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def info(self) -> CacheInfo:
+        """Return the cache statistics."""
+        with self._lock:
+            return CacheInfo(
+                self.hits, self.misses, self.evictions, self.maxsize, len(self._data)
+            )
+
+
+class ResultCache:
+    """Persistent least-recently-used cache of the handles matching queries.
+
+    Stored in an SQLite file at ``path``, so it can be shared between
+    processes and runs. Entries are keyed by the normalized query and the
+    database file, and are only served while the database file has the
+    revision it had when the entry was stored (see ``sql.revision``).
+    Least recently used entries are evicted when the stored handles
+    exceed ``maxsize`` bytes.
+    """
+
+    def __init__(self, path: str, maxsize: int = 64 * 2**20) -> None:
+        """Initialize self."""
+        if maxsize < 0:
+            raise ValueError("maxsize must not be negative")
+        self.path = path
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results (query TEXT NOT NULL,"
+                " database TEXT NOT NULL, revision TEXT NOT NULL,"
+                " handles TEXT NOT NULL, size INTEGER NOT NULL,"
+                " used INTEGER NOT NULL, PRIMARY KEY (query, database))"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection to the cache file for one transaction."""
+        with closing(sqlite3.connect(self.path)) as connection, connection:
+            yield connection
+
+    def __len__(self) -> int:
+        """Return the number of cached results."""
+        with self._connect() as connection:
+            (count,) = connection.execute("SELECT count(*) FROM results").fetchone()
+        return int(count)
+
+    def __contains__(self, key: object) -> bool:
+        """Return whether ``(query, database, revision)`` is cached.
+
+        Unlike ``get``, this neither counts as a use nor removes entries.
+        """
+        if not isinstance(key, tuple) or len(key) != 3:
+            return False
+        query, database, revision = key
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT 1 FROM results"
+                " WHERE query = ? AND database = ? AND revision = ?",
+                (query, database, revision),
+            ).fetchone()
+        return row is not None
+
+    def get(
+        self, query: str, database: str, revision: str
+    ) -> list[tuple[str, str]] | None:
+        """Return the class names and handles matching a query, if cached.
+
+        Entries for other revisions of the database are removed.
+        """
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT revision, handles FROM results"
+                " WHERE query = ? AND database = ?",
+                (query, database),
+            ).fetchone()
+            if row is None or row[0] != revision:
+                self.misses += 1
+                if row is not None:
+                    connection.execute(
+                        "DELETE FROM results WHERE query = ? AND database = ?",
+                        (query, database),
+                    )
+                return None
+            connection.execute(
+                "UPDATE results SET used = (SELECT max(used) + 1 FROM results)"
+                " WHERE query = ? AND database = ?",
+                (query, database),
+            )
+        self.hits += 1
+        return [(class_name, handle) for class_name, handle in json.loads(row[1])]
+
+    def store(
+        self,
+        query: str,
+        database: str,
+        revision: str,
+        handles: Sequence[tuple[str, str]],
+    ) -> None:
+        """Store the class names and handles matching a query.
+
+        Results larger than ``maxsize`` are not stored.
+        """
+        data = json.dumps(handles, separators=(",", ":"))
+        if len(data) > self.maxsize:
+            return
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?,"
+                " (SELECT coalesce(max(used), 0) + 1 FROM results))",
+                (query, database, revision, data, len(data)),
+            )
+            self._evict(connection)
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        """Remove the least recently used results exceeding the size."""
+        (total,) = connection.execute(
+            "SELECT coalesce(sum(size), 0) FROM results"
+        ).fetchone()
+        if total <= self.maxsize:
+            return
+        rows = connection.execute(
+            "SELECT query, database, size FROM results ORDER BY used"
+        ).fetchall()
+        for query, database, size in rows:
+            if total <= self.maxsize:
+                break
+            connection.execute(
+                "DELETE FROM results WHERE query = ? AND database = ?",
+                (query, database),
+            )
+            total -= size
+            self.evictions += 1
+
+    def resize(self, maxsize: int) -> None:
+        """Change the maximum size of the stored handles in bytes."""
+        if maxsize < 0:
+            raise ValueError("maxsize must not be negative")
+        self.maxsize = maxsize
+        with self._connect() as connection:
+            self._evict(connection)
+
+    def clear(self) -> None:
+        """Remove all results from the cache and reset the statistics."""
+        with self._connect() as connection:
+            connection.execute("DELETE FROM results")
+        self.hits = self.misses = self.evictions = 0
+
+    def info(self) -> CacheInfo:
+        """Return the cache statistics, with sizes in bytes."""
+        with self._connect() as connection:
+            (size,) = connection.execute(
+                "SELECT coalesce(sum(size), 0) FROM results"
+            ).fetchone()
+        return CacheInfo(self.hits, self.misses, self.evictions, self.maxsize, size)
@@ -0,0 +1,194 @@
+"""Match batches of objects with vectorized comparisons.
+
+The values at the property paths a query compares are extracted into
+NumPy arrays, one batch of objects at a time, and comparisons of numbers
+and strings become masks combined with ``&`` and ``|``. Other conditions
+(``~`` and ``!~`` on strings, ``any``, ``all`` and ``get_*``) and columns
+of mixed types are evaluated object by object, but only for the objects
+the preceding operands of ``and`` and ``or`` leave undecided.
+
+NumPy is an optional dependency, needed for ``GQLQuery(columnar=True)``.
+"""
+
+import operator
+from collections.abc import Callable, Generator, Iterable, Mapping
+from typing import Any
+
+from .compiler import And, Comparison, Node, Or, Path, Step, Truthiness
+from .gql import GrampsObject, batched
+from .views import ObjectView
+
+try:
+    import numpy as np
+
+    HAVE_NUMPY = True
+except ImportError:
+    HAVE_NUMPY = False
+
+# objects matched at once
+BATCH_SIZE = 256
+
+# integers that fit into int64 and floats that represent them exactly
+_INT64 = range(-(2**63), 2**63)
+_EXACT_FLOAT = range(-(2**53), 2**53 + 1)
+
+_OPERATORS: dict[str, Callable[[Any, Any], Any]] = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    ">": operator.gt,
+    "<=": operator.le,
+    ">=": operator.ge,
+}
+
+Evaluate = Callable[[Node, Any], bool]
+Candidate = tuple[GrampsObject | None, Mapping[str, Any]]
+
+
+def filter_batches(
+    candidates: Iterable[Candidate],
+    node: Node,
+    evaluate: Evaluate,
+    size: int = BATCH_SIZE,
+) -> Generator[Candidate, None, None]:
+    """Yield the candidates matching a node, matching them in batches.
+
+    ``evaluate`` evaluates a node for a single object.
+    """
+    for chunk in batched(candidates, size):
+        mask = evaluate_batch(node, [obj_dict for _obj, obj_dict in chunk], evaluate)
+        for i in np.flatnonzero(mask):
+            yield chunk[i]
+
+
+def evaluate_batch(node: Node, objects: list[Any], evaluate: Evaluate) -> Any:
+    """Return the boolean mask of the objects matching a node."""
+    if isinstance(node, (And, Or)):
+        conjunction = isinstance(node, And)
+        mask = np.full(len(objects), conjunction)
+        for operand in node.operands:
+            undecided = np.flatnonzero(mask if conjunction else ~mask)
+            if len(undecided) == len(objects):
+                mask = evaluate_batch(operand, objects, evaluate)
+            elif len(undecided):
+                subset = [objects[i] for i in undecided]
+                mask[undecided] = evaluate_batch(operand, subset, evaluate)
+            else:
+                break
+        return mask
+    if isinstance(node, Comparison):
+        return _compare(node, objects, evaluate)
+    if isinstance(node, Truthiness):
+        values = _column(objects, node.path)
+        return np.fromiter(map(bool, values), dtype=bool, count=len(values))
+    return _row_wise(node, objects, evaluate)
+
+
+def _column(objects: list[Any], path: Path) -> list[Any]:
+    """Return the values at a property path, resolving one step at a time.
+
+    Like ``Evaluator._resolve``, missing values are None.
+    """
+    values = objects
+    for step in path:
+        if step is Step.LENGTH:
+            values = [
+                len(value) if isinstance(value, (dict, list, str, ObjectView)) else None
+                for value in values
+            ]
+        elif isinstance(step, int):
+            values = [
+                value[step]
+                if isinstance(value, (list, str)) and step < len(value)
+                else None
+                for value in values
+            ]
+        else:
+            values = [
+                value.get(step) if isinstance(value, (dict, ObjectView)) else None
+                for value in values
+            ]
+    return values
+
+
+def _row_wise(node: Node, objects: list[Any], evaluate: Evaluate) -> Any:
+    """Return the mask of a node evaluated object by object."""
+    return np.fromiter(
+        (evaluate(node, obj) for obj in objects), dtype=bool, count=len(objects)
+    )
+
+
+def _compare(node: Comparison, objects: list[Any], evaluate: Evaluate) -> Any:
+    """Return the mask of a comparison, vectorized if the column allows it."""
+    values = _column(objects, node.path)
+    types = set(map(type, values))
+    if type(None) in types:
+        # missing values never match
+        types.discard(type(None))
+        valid = np.fromiter((value is not None for value in values), bool, len(values))
+    else:
+        valid = np.ones(len(values), dtype=bool)
+    rhs = node.value
+    compare = _OPERATORS.get(node.operator)
+    if types <= {int, bool} and node.operator == "in":
+        try:
+            column = np.fromiter(
+                (0 if value is None else value for value in values),
+                dtype=np.int64,
+                count=len(values),
+            )
+        except OverflowError:
+            pass
+        else:
+            # integers out of range cannot be in the column
+            literals = [value for value in rhs if isinstance(value, int)]
+            literals = [value for value in literals if value in _INT64]
+            return np.isin(column, np.array(literals, dtype=np.int64)) & valid
+    elif types == {str} and node.operator in ("in", "=~"):
+        if node.operator == "in":
+            folded = node.folded
+            matches = (
+                value is not None and value.casefold() in folded for value in values
+            )
+        else:
+            search = rhs.search
+            matches = (
+                value is not None and search(value) is not None for value in values
+            )
+        return np.fromiter(matches, dtype=bool, count=len(values))
+    elif types <= {int, bool}:
+        if compare is None or isinstance(rhs, str):
+            # like comparing numbers to strings in Python
+            return valid if node.operator == "!=" else np.zeros(len(values), bool)
+        if isinstance(rhs, int) and rhs in _INT64:
+            try:
+                column = np.fromiter(
+                    (0 if value is None else value for value in values),
+                    dtype=np.int64,
+                    count=len(values),
+                )
+            except OverflowError:
+                pass
+            else:
+                return compare(column, rhs) & valid
+    elif types == {float}:
+        if compare is not None and isinstance(rhs, int) and rhs in _EXACT_FLOAT:
+            column = np.fromiter(
+                (0.0 if value is None else value for value in values),
+                dtype=np.float64,
+                count=len(values),
+            )
+            return compare(column, rhs) & valid
+    elif types == {str} and compare is not None:
+        if node.operator in ("=", "!="):
+            column = np.array(
+                ["" if value is None else value.casefold() for value in values],
+                dtype=object,
+            )
+            return compare(column, node.folded) & valid
+        if isinstance(rhs, str):
+            column = np.array(
+                ["" if value is None else value for value in values], dtype=object
+            )
+            return compare(column, rhs) & valid
+    return _row_wise(node, objects, evaluate)
@@ -0,0 +1,388 @@
+"""Compile parsed GQL queries into a tree of predicate nodes."""
+
+import re
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, TypeAlias
+
+QUANTIFIERS = ("any", "all")
+LOGICAL = ("and", "or")
+# the pseudo-property listing the objects that refer to an object
+BACKLINKS = "backlinks"
+
+# the left-hand side has already been validated by the grammar, so it only
+# needs to be split into property names and list indices
+_SEGMENT = re.compile(r"\[(\d+)\]|([^.\[\]]+)")
+# right-hand sides that need no quotes
+_WORD = re.compile(r"[A-Za-z0-9._]+")
+
+
+class Step(Enum):
+    """Pseudo-properties that can appear in a property path."""
+
+    LENGTH = "length"
+
+
+# a precomputed property path: dictionary keys, list indices and pseudo-steps
+Path: TypeAlias = tuple[str | int | Step, ...]
+
+
+@dataclass(frozen=True)
+class And:
+    """All operands must match."""
+
+    operands: tuple["Node", ...]
+
+
+@dataclass(frozen=True)
+class Or:
+    """At least one operand must match."""
+
+    operands: tuple["Node", ...]
+
+
+@dataclass(frozen=True)
+class Comparison:
+    """Compare the value at a property path to a literal.
+
+    ``value`` is the typed literal (an integer if it consists of digits,
+    a string with quotes removed otherwise), ``folded`` is its casefolded
+    string form used for case-insensitive string comparisons. For ``in``,
+    they are frozensets of the typed literals and their casefolded strings;
+    for ``=~``, ``value`` is the compiled regular expression and ``folded``
+    its pattern.
+    """
+
+    path: Path
+    operator: str
+    value: Any
+    folded: Any
+
+
+@dataclass(frozen=True)
+class Truthiness:
+    """Interpret the value at a property path as a boolean."""
+
+    path: Path
+
+
+@dataclass(frozen=True)
+class Quantifier:
+    """Match the items of the list at a property path (``any`` or ``all``)."""
+
+    path: Path
+    quantifier: str
+    predicate: "Node"
+
+
+@dataclass(frozen=True)
+class Lookup:
+    """Follow the handle at a property path (``get_person`` etc.)."""
+
+    path: Path
+    name: str
+    predicate: "Node"
+
+
+@dataclass(frozen=True)
+class Backlinks:
+    """Match the objects referring to an object (``backlinks``).
+
+    ``predicate`` is a condition on the ``backlinks`` property of an
+    object holding the list of the referring objects.
+    """
+
+    predicate: "Node"
+
+
+Node: TypeAlias = And | Or | Comparison | Truthiness | Quantifier | Lookup | Backlinks
+
+
+@dataclass(frozen=True)
+class Field:
+    """A property path to project, possibly following handles.
+
+    The value is found by resolving ``paths`` in turn, following the handle
+    at the end of each path but the last to an object of the class in
+    ``lookups`` (``get_person`` etc.).
+    """
+
+    paths: tuple[Path, ...]
+    lookups: tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class OrderKey:
+    """A property path to sort the matching objects by."""
+
+    field: Field
+    descending: bool
+
+
+def format_path(path: Path) -> str:
+    """Format a property path as a left-hand side string."""
+    lhs = ""
+    for step in path:
+        if isinstance(step, int):
+            lhs += f"[{step}]"
+        else:
+            name = step.value if isinstance(step, Step) else step
+            lhs = f"{lhs}.{name}" if lhs else name
+    return lhs
+
+
+def format_node(node: Node) -> str:
+    """Format a node as a query string."""
+    if isinstance(node, (And, Or)):
+        keyword = " and " if isinstance(node, And) else " or "
+        return keyword.join(
+            f"({format_node(operand)})"
+            if isinstance(operand, (And, Or))
+            else format_node(operand)
+            for operand in node.operands
+        )
+    if isinstance(node, (Quantifier, Lookup)):
+        step = node.quantifier if isinstance(node, Quantifier) else f"get_{node.name}"
+        prefix = ".".join(filter(None, [format_path(node.path), step]))
+        predicate = format_node(node.predicate)
+        if isinstance(node.predicate, (And, Or)):
+            predicate = f"({predicate})"
+        return f"{prefix}.{predicate}"
+    if isinstance(node, Backlinks):
+        return format_node(node.predicate)
+    lhs = format_path(node.path)
+    if isinstance(node, Truthiness):
+        return lhs
+    if node.operator == "in":
+        values = sorted(_format_value(value) for value in node.value)
+        return f"{lhs} in ({', '.join(values)})"
+    value = node.folded if node.operator == "=~" else node.value
+    return f"{lhs} {node.operator} {_format_value(value)}"
+
+
+def format_field(field: Field) -> str:
+    """Format a field as a left-hand side string."""
+    steps = [format_path(field.paths[0])]
+    for class_name, path in zip(field.lookups, field.paths[1:], strict=True):
+        steps.append(f"get_{class_name}")
+        steps.append(format_path(path))
+    return ".".join(filter(None, steps))
+
+
+def format_query(root: Node, order: tuple[OrderKey, ...] = ()) -> str:
+    """Format a compiled query as a normalized query string."""
+    if not order:
+        return format_node(root)
+    keys = (
+        f"{format_field(key.field)} desc" if key.descending else format_field(key.field)
+        for key in order
+    )
+    return f"{format_node(root)} order by {', '.join(keys)}"
+
+
+def _format_value(value: Any) -> str:
+    """Format a literal as a right-hand side string."""
+    if isinstance(value, str) and (value.isdigit() or not _WORD.fullmatch(value)):
+        quote = "'" if '"' in value else '"'
+        return f"{quote}{value}{quote}"
+    return str(value)
+
+
+def split_lhs(lhs: str) -> list[str | int]:
+    """Split a left-hand side into property names and list indices."""
+    return [int(index) if index else name for index, name in _SEGMENT.findall(lhs)]
+
+
+def make_path(segments: list[str | int]) -> Path:
+    """Turn property names and list indices into a property path."""
+    return tuple(
+        Step.LENGTH if i > 0 and segment == "length" else segment
+        for i, segment in enumerate(segments)
+    )
+
+
+def make_literal(rhs: Any) -> tuple[Any, str]:
+    """Return the typed value and its casefolded string for a right-hand side."""
+    if isinstance(rhs, str):
+        rhs = int(rhs) if rhs.isdigit() else rhs.strip("\"'")
+    return rhs, str(rhs).casefold()
+
+
+def compile_condition(
+    segments: list[str | int], operator: str = "", rhs: Any = ""
+) -> Node:
+    """Compile a single condition given as path segments."""
+    if segments[:1] == [BACKLINKS]:
+        return Backlinks(predicate=_compile_path_condition(segments, operator, rhs))
+    return _compile_path_condition(segments, operator, rhs)
+
+
+def _compile_path_condition(segments: list[str | int], operator: str, rhs: Any) -> Node:
+    """Compile a single condition, taking ``backlinks`` as a property."""
+    for i, segment in enumerate(segments):
+        if not isinstance(segment, str):
+            continue
+        if i > 0 and segment in QUANTIFIERS:
+            rest = segments[i + 1 :]
+            if rest and isinstance(rest[0], int):
+                raise ValueError(f"'{segment}' cannot be followed by [")
+            return Quantifier(
+                path=make_path(segments[:i]),
+                quantifier=segment,
+                predicate=compile_condition(rest, operator, rhs),
+            )
+        if segment.startswith("get_"):
+            return Lookup(
+                path=make_path(segments[:i]),
+                name=segment[4:],
+                predicate=compile_condition(segments[i + 1 :], operator, rhs),
+            )
+    path = make_path(segments)
+    if not operator:
+        return Truthiness(path=path)
+    if operator == "in":
+        literals = [make_literal(item) for item in rhs]
+        return Comparison(
+            path=path,
+            operator=operator,
+            value=frozenset(value for value, _folded in literals),
+            folded=frozenset(folded for _value, folded in literals),
+        )
+    if operator == "=~":
+        pattern = rhs.strip("\"'")
+        try:
+            regex = re.compile(pattern, re.IGNORECASE)
+        except re.error:
+            raise ValueError(f"Invalid regular expression: {pattern}") from None
+        return Comparison(path=path, operator=operator, value=regex, folded=pattern)
+    value, folded = make_literal(rhs)
+    return Comparison(path=path, operator=operator, value=value, folded=folded)
+
+
+def compile_field(segments: list[str | int]) -> Field:
+    """Compile a property path to project given as path segments."""
+    paths = []
+    lookups = []
+    start = 0
+    for i, segment in enumerate(segments):
+        if not isinstance(segment, str):
+            continue
+        if i > 0 and segment in QUANTIFIERS:
+            raise ValueError(f"'{segment}' cannot be used in fields")
+        if segment.startswith("get_"):
+            paths.append(make_path(segments[start:i]))
+            lookups.append(segment[4:])
+            start = i + 1
+    paths.append(make_path(segments[start:]))
+    return Field(paths=tuple(paths), lookups=tuple(lookups))
+
+
+def split_order(parsed_list: list[Any]) -> tuple[list[Any], tuple[OrderKey, ...]]:
+    """Split the ``order by`` clause off a parsed query and compile it."""
+    if not parsed_list or parsed_list[-1][:2] != ["order", "by"]:
+        return parsed_list, ()
+    *condition, (_order, _by, *keys) = parsed_list
+    return condition, tuple(
+        OrderKey(compile_field(split_lhs(lhs)), direction == "desc")
+        for lhs, direction in keys
+    )
+
+
+def cost(node: Node) -> int:
+    """Estimate the relative cost of evaluating a node for one object.
+
+    Scalar comparisons are cheap, quantifiers evaluate their predicate for
+    every list item, and lookups and backlinks need database round trips.
+    """
+    if isinstance(node, (And, Or)):
+        return sum(cost(operand) for operand in node.operands)
+    if isinstance(node, Quantifier):
+        return 10 * cost(node.predicate)
+    if isinstance(node, (Lookup, Backlinks)):
+        return 100 + cost(node.predicate)
+    return 1
+
+
+def has_lookup(node: Node) -> bool:
+    """Return whether evaluating a node can follow a handle."""
+    if isinstance(node, (And, Or)):
+        return any(has_lookup(operand) for operand in node.operands)
+    if isinstance(node, Quantifier):
+        return has_lookup(node.predicate)
+    return isinstance(node, (Lookup, Backlinks))
+
+
+def has_backlinks(node: Node) -> bool:
+    """Return whether evaluating a node looks up the objects referring to one."""
+    if isinstance(node, Backlinks):
+        return True
+    if isinstance(node, (And, Or)):
+        return any(has_backlinks(operand) for operand in node.operands)
+    if isinstance(node, (Quantifier, Lookup)):
+        return has_backlinks(node.predicate)
+    return False
+
+
+def reorder(node: Node) -> Node:
+    """Sort the operands of ``and`` and ``or`` by increasing cost.
+
+    Combined with short-circuit evaluation, this makes sure that expensive
+    traversals are skipped whenever a cheap condition decides the result.
+    """
+    if isinstance(node, (And, Or)):
+        operands = sorted((reorder(operand) for operand in node.operands), key=cost)
+        return type(node)(operands=tuple(operands))
+    if isinstance(node, Quantifier):
+        return Quantifier(node.path, node.quantifier, reorder(node.predicate))
+    if isinstance(node, Lookup):
+        return Lookup(node.path, node.name, reorder(node.predicate))
+    if isinstance(node, Backlinks):
+        return Backlinks(reorder(node.predicate))
+    return node
+
+
+def _combine(op: str, left: Node, right: Node) -> Node:
+    """Combine two nodes with a logical operator, flattening chains."""
+    cls = And if op == "and" else Or
+    if isinstance(left, cls):
+        return cls(operands=(*left.operands, right))
+    return cls(operands=(left, right))
+
+
+def compile_parsed(parsed_list: list[Any]) -> Node:
+    """Compile a nested parsed list (the output of ``parse().as_list()``)."""
+    node: Node | None = None
+    op: str | None = None
+    expression: list[Any] = []
+
+    def add(value: Node) -> None:
+        nonlocal node, op
+        node = value if node is None or op is None else _combine(op, node, value)
+        op = None
+
+    def flush() -> None:
+        nonlocal expression
+        if not expression:
+            return
+        lhs, *rest = expression
+        if len(rest) not in (0, 2):
+            raise ValueError(f"Invalid expression: {' '.join(map(str, expression))}")
+        add(compile_condition(split_lhs(lhs), *rest))
+        expression = []
+
+    for item in parsed_list:
+        if isinstance(item, list) and len(expression) % 2 == 0 and expression:
+            # the literals of "in"
+            expression.append(item)
+        elif isinstance(item, list):
+            flush()
+            add(compile_parsed(item))
+        elif item in LOGICAL:
+            flush()
+            op = item
+        else:
+            expression.append(item)
+    flush()
+    if node is None:
+        raise ValueError("Empty query")
+    return node
@@ -0,0 +1,434 @@
+"""Explain and profile the execution of queries."""
+
+import sqlite3
+import time
+from collections.abc import Generator, Iterable, Mapping
+from dataclasses import dataclass, field
+from typing import Any
+
+from gramps.gen.db import DbReadBase
+
+from . import sql
+from .cache import CacheInfo, HandleCache
+from .compiler import (
+    And,
+    Backlinks,
+    Lookup,
+    Node,
+    Or,
+    Quantifier,
+    format_field,
+    format_node,
+)
+from .gql import GRAMPS_OBJECT_NAMES, GQLQuery, GrampsObject, from_dict
+from .views import materialize
+
+
+@dataclass(frozen=True)
+class TableExplanation:
+    """How the objects of one table are matched.
+
+    ``statement`` and ``params`` are the SQL filtering the rows (None if
+    all rows are matched in Python), ``plan`` is SQLite's query plan for
+    it and ``residual`` the condition evaluated in Python for every row
+    SQLite returns.
+    """
+
+    class_name: str
+    statement: str | None
+    params: tuple[Any, ...]
+    plan: tuple[str, ...]
+    residual: str | None
+
+
+@dataclass(frozen=True)
+class Explanation:
+    """How a query is executed.
+
+    ``engine`` is ``sqlite`` if rows are filtered by SQLite and
+    ``python`` otherwise. ``skipped`` are the classes the query cannot
+    match, whose tables are not read. ``sort`` tells where the objects are
+    sorted (None without ``order by``), and ``cache`` holds the statistics
+    of the query's lookup cache (None for a new cache per run).
+    ``results`` is ``hit`` if the matches are served from the query's
+    result cache without reading the tables, ``miss`` if they are stored
+    there after a complete run and ``unsupported`` for databases that are
+    not SQLite files (None without result cache). ``columnar`` tells
+    whether the conditions evaluated in Python are matched in batches.
+    """
+
+    query: str
+    engine: str
+    tables: tuple[TableExplanation, ...]
+    skipped: tuple[str, ...]
+    order: tuple[str, ...]
+    sort: str | None
+    cache: CacheInfo | None
+    results: str | None = None
+    columnar: bool = False
+
+    def __str__(self) -> str:
+        """Return a readable report."""
+        lines = [f"Query: {self.query}", f"Engine: {self.engine}"]
+        for table in self.tables:
+            lines.append(f"Table {table.class_name}:")
+            if table.statement is None:
+                lines.append("  scan all rows")
+            else:
+                lines.append(f"  SQL: {table.statement}")
+                if table.params:
+                    lines.append(f"  parameters: {table.params!r}")
+                lines.extend(f"  plan: {detail}" for detail in table.plan)
+            if table.residual is not None:
+                lines.append(f"  Python: {table.residual}")
+        if self.skipped:
+            lines.append(f"Skipped: {', '.join(self.skipped)}")
+        if self.order:
+            lines.append(f"Order by: {', '.join(self.order)} (in {self.sort})")
+        if self.columnar:
+            lines.append("Columnar: Python conditions matched in batches")
+        if self.cache is None:
+            lines.append("Cache: new for every run")
+        else:
+            lines.append(f"Cache: {self.cache}")
+        if self.results == "hit":
+            lines.append("Result cache: hit, the tables are not read")
+        elif self.results == "miss":
+            lines.append("Result cache: miss, stored after a complete run")
+        elif self.results is not None:
+            lines.append("Result cache: not a SQLite file, not used")
+        return "\n".join(lines)
+
+
+def explain(gq: GQLQuery) -> Explanation:
+    """Return how a query is executed on its database."""
+    if not gq.db:
+        raise ValueError("Database is needed for explaining queries!")
+    order = tuple(
+        f"{format_field(key.field)} desc" if key.descending else format_field(key.field)
+        for key in gq.order
+    )
+    classes = [name for name in GRAMPS_OBJECT_NAMES if name in gq.target_classes]
+    skipped = tuple(name for name in GRAMPS_OBJECT_NAMES if name not in classes)
+    cache = gq.cache.info() if gq.cache is not None else None
+    results = _results(gq)
+    connection = sql.connect(gq.db)
+    if connection is None:
+        residual = format_node(gq.root)
+        tables = tuple(
+            TableExplanation(name, None, (), (), residual) for name in classes
+        )
+        sort = "python" if order else None
+        return Explanation(
+            gq.query,
+            "python",
+            tables,
+            skipped,
+            order,
+            sort,
+            cache,
+            results,
+            gq.columnar and bool(tables),
+        )
+    try:
+        indexes = sql.indexes(connection)
+        explained = []
+        for class_name in classes:
+            table_plan = sql.plan(gq.root, class_name, gq._evaluate, indexes)
+            statement, params = table_plan.select()
+            explained.append(
+                TableExplanation(
+                    class_name,
+                    statement,
+                    params,
+                    _query_plan(connection, statement, params),
+                    None
+                    if table_plan.residual is None
+                    else format_node(table_plan.residual),
+                )
+            )
+    finally:
+        connection.close()
+    sort = None
+    if order:
+        sort = "sqlite" if gq._sortable_in_sql() else "python"
+    return Explanation(
+        gq.query,
+        "sqlite",
+        tuple(explained),
+        skipped,
+        order,
+        sort,
+        cache,
+        results,
+        # rows sorted by SQLite are matched one by one
+        gq.columnar
+        and sort != "sqlite"
+        and any(table.residual is not None for table in explained),
+    )
+
+
+def _results(gq: GQLQuery) -> str | None:
+    """Return whether the result cache of a query has its matches."""
+    if gq.results is None:
+        return None
+    key = gq._result_key()
+    if key is None:
+        return "unsupported"
+    return "hit" if key in gq.results else "miss"
+
+
+def _query_plan(
+    connection: sqlite3.Connection, statement: str, params: tuple[Any, ...]
+) -> tuple[str, ...]:
+    """Return the details of SQLite's query plan for a statement."""
+    rows = connection.execute(f"EXPLAIN QUERY PLAN {statement}", params)
+    return tuple(row[-1] for row in rows)
+
+
+@dataclass
+class NodeProfile:
+    """How often a node was evaluated, how long it took and how often it matched.
+
+    ``seconds`` includes the time of the operands and of looking up
+    objects. ``depth`` is the nesting level of the node in the query.
+    """
+
+    node: Node
+    depth: int = 0
+    evaluations: int = 0
+    matches: int = 0
+    seconds: float = 0.0
+
+    @property
+    def selectivity(self) -> float | None:
+        """Return the fraction of the evaluations that matched."""
+        if not self.evaluations:
+            return None
+        return self.matches / self.evaluations
+
+
+@dataclass
+class TableProfile:
+    """The rows of a table read, matched and converted to Gramps objects."""
+
+    class_name: str
+    read: int = 0
+    matched: int = 0
+    converted: int = 0
+
+
+@dataclass
+class Profile:
+    """Statistics of profiled runs of a query.
+
+    ``lookups`` counts the objects looked up by each ``get_*`` and
+    ``backlinks`` node and ``loads`` the ones that were not in the cache.
+    Objects prefetched in bulk are not counted as loaded.
+    """
+
+    nodes: dict[Node, NodeProfile] = field(default_factory=dict)
+    tables: dict[str, TableProfile] = field(default_factory=dict)
+    lookups: dict[Node, int] = field(default_factory=dict)
+    loads: dict[Node, int] = field(default_factory=dict)
+    seconds: float = 0.0
+
+    def node(self, node: Node, depth: int = 0) -> NodeProfile:
+        """Return the statistics of a node, adding it if needed.
+
+        Equal nodes share their statistics, also the nodes SQL translation
+        leaves to be evaluated in Python.
+        """
+        try:
+            return self.nodes[node]
+        except KeyError:
+            profile = self.nodes[node] = NodeProfile(node, depth)
+            return profile
+
+    def table(self, class_name: str) -> TableProfile:
+        """Return the statistics of a table, adding it if needed."""
+        try:
+            return self.tables[class_name]
+        except KeyError:
+            profile = self.tables[class_name] = TableProfile(class_name)
+            return profile
+
+    def __str__(self) -> str:
+        """Return a readable report."""
+        lines = [f"Total: {self.seconds:.4f}s"]
+        lines.append("   evals  matched  selectivity   seconds  node")
+        for stats in self.nodes.values():
+            selectivity = stats.selectivity
+            ratio = "-" if selectivity is None else f"{selectivity:.1%}"
+            lines.append(
+                f"{stats.evaluations:8d} {stats.matches:8d} {ratio:>12} "
+                f"{stats.seconds:9.4f}  {'  ' * stats.depth}{format_node(stats.node)}"
+            )
+        lines.append("    read  matched  converted  table")
+        for table in self.tables.values():
+            lines.append(
+                f"{table.read:8d} {table.matched:8d} {table.converted:10d}  "
+                f"{table.class_name}"
+            )
+        for node, count in self.lookups.items():
+            loads = self.loads.get(node, 0)
+            lines.append(f"{format_node(node)}: {count} lookups, {loads} loaded")
+        return "\n".join(lines)
+
+
+class ProfiledQuery(GQLQuery):
+    """A query recording statistics of its runs in ``profile``.
+
+    Only conditions evaluated in Python are profiled per node; rows
+    filtered by SQLite count as read only if SQLite returns them.
+    """
+
+    def __init__(
+        self,
+        query: str,
+        db: DbReadBase | None = None,
+        cache: HandleCache | None = None,
+        profile: Profile | None = None,
+    ) -> None:
+        """Initialize self."""
+        super().__init__(query, db=db, cache=cache)
+        self.profile = profile if profile is not None else Profile()
+        self._add_nodes(self.root, 0)
+        # evaluations while planning (of class conditions) are not profiled
+        self._matching = 0
+        # the statistics by node identity, to avoid hashing nodes; the node
+        # is kept to keep its id from being reused
+        self._stats: dict[int, tuple[Node, NodeProfile]] = {}
+        # the get_* or backlinks node whose objects are looked up
+        self._looking_up: Lookup | Backlinks | None = None
+
+    def _add_nodes(self, node: Node, depth: int) -> None:
+        """Add a node and its operands to the profile in query order."""
+        self.profile.node(node, depth)
+        if isinstance(node, (And, Or)):
+            for operand in node.operands:
+                self._add_nodes(operand, depth + 1)
+        elif isinstance(node, (Quantifier, Lookup, Backlinks)):
+            self._add_nodes(node.predicate, depth + 1)
+
+    def iter_objects(
+        self,
+        as_dict: bool = False,
+        prefetch: int = 0,
+        limit: int | None = None,
+        offset: int = 0,
+    ) -> Generator[GrampsObject | dict[str, Any], None, None]:
+        """Iterate over objects in a Gramps database, profiling the run."""
+        start = time.perf_counter()
+        try:
+            for obj, obj_dict in self._iter_page(prefetch, limit, offset):
+                if as_dict:
+                    yield materialize(obj_dict)
+                elif obj is not None:
+                    yield obj
+                else:
+                    self.profile.table(obj_dict["class"]).converted += 1
+                    yield from_dict(obj_dict)
+        finally:
+            self.profile.seconds += time.perf_counter() - start
+
+    def _evaluate(self, node: Node, obj: Any) -> bool:
+        """Evaluate a node, recording the evaluation."""
+        if not self._matching:
+            return super()._evaluate(node, obj)
+        try:
+            stats = self._stats[id(node)][1]
+        except KeyError:
+            stats = self.profile.node(node)
+            self._stats[id(node)] = (node, stats)
+        start = time.perf_counter()
+        result = super()._evaluate(node, obj)
+        stats.seconds += time.perf_counter() - start
+        stats.evaluations += 1
+        stats.matches += result
+        return result
+
+    def _evaluate_lookup(self, node: Lookup, obj: Any) -> bool:
+        """Evaluate a ``get_*`` node, counting its lookups."""
+        outer = self._looking_up
+        self._looking_up = node
+        try:
+            return super()._evaluate_lookup(node, obj)
+        finally:
+            self._looking_up = outer
+
+    def _evaluate_backlinks(self, node: Backlinks, obj: Any) -> bool:
+        """Evaluate a ``backlinks`` node, counting its lookups."""
+        outer = self._looking_up
+        self._looking_up = node
+        try:
+            return super()._evaluate_backlinks(node, obj)
+        finally:
+            self._looking_up = outer
+
+    def _lookup(self, class_name: str, handle: str) -> Mapping[str, Any] | None:
+        """Return a looked up object, counting the lookup for its node."""
+        node = self._looking_up
+        if node is not None:
+            lookups = self.profile.lookups
+            lookups[node] = lookups.get(node, 0) + 1
+        return super()._lookup(class_name, handle)
+
+    def _load(self, class_name: str, handle: str) -> Mapping[str, Any] | None:
+        """Load an object, counting the load for the node looking it up."""
+        node = self._looking_up
+        if node is not None:
+            loads = self.profile.loads
+            loads[node] = loads.get(node, 0) + 1
+        return super()._load(class_name, handle)
+
+    def _filter(
+        self,
+        candidates: Iterable[tuple[GrampsObject | None, Mapping[str, Any]]],
+        node: Node | None,
+        prefetch: int = 0,
+    ) -> Generator[tuple[GrampsObject | None, Mapping[str, Any]], None, None]:
+        """Yield the matching candidates, counting the read and matched ones."""
+        self._matching += 1
+        try:
+            for candidate in super()._filter(self._read(candidates), node, prefetch):
+                self.profile.table(candidate[1]["class"]).matched += 1
+                yield candidate
+        finally:
+            self._matching -= 1
+
+    def _sorted_candidates(
+        self,
+        rows: Iterable[tuple[Any, ...]],
+        class_name: str,
+        table: int,
+        residual: Node | None,
+    ) -> Generator[tuple[tuple[Any, ...], tuple[None, dict[str, Any]]], None, None]:
+        """Turn sorted rows into matches, counting the read and matched ones."""
+        stats = self.profile.table(class_name)
+        self._matching += 1
+        try:
+            for row in super()._sorted_candidates(
+                self._read_rows(rows, stats), class_name, table, residual
+            ):
+                stats.matched += 1
+                yield row
+        finally:
+            self._matching -= 1
+
+    def _read(
+        self, candidates: Iterable[tuple[GrampsObject | None, Mapping[str, Any]]]
+    ) -> Generator[tuple[GrampsObject | None, Mapping[str, Any]], None, None]:
+        """Pass on candidates, counting them."""
+        for candidate in candidates:
+            self.profile.table(candidate[1]["class"]).read += 1
+            yield candidate
+
+    @staticmethod
+    def _read_rows(
+        rows: Iterable[tuple[Any, ...]], stats: TableProfile
+    ) -> Generator[tuple[Any, ...], None, None]:
+        """Pass on rows, counting them."""
+        for row in rows:
+            stats.read += 1
+            yield row
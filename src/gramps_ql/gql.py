@@ -1,20 +1,61 @@
 """Gramps Query Language."""
 
-from collections.abc import Generator
-from typing import Any, TypeAlias
+import heapq
+import os
+import sqlite3
+from collections.abc import Generator, Iterable, Iterator, Mapping, Sequence
+from contextlib import closing, contextmanager
+from dataclasses import dataclass
+from importlib import import_module
+from itertools import islice
+from operator import itemgetter
+from typing import TYPE_CHECKING, Any, TypeAlias, TypeVar
 
-import pyparsing as pp
 from gramps.gen.db import DbReadBase
 from gramps.gen.errors import HandleError
-from gramps.gen.lib.json_utils import object_to_dict
+from gramps.gen.lib.json_utils import data_to_object, object_to_dict, string_to_dict
+
+from . import sql
+from .cache import HandleCache, QueryCache, ResultCache
+from .compiler import (
+    BACKLINKS,
+    And,
+    Backlinks,
+    Comparison,
+    Field,
+    Lookup,
+    Node,
+    Or,
+    OrderKey,
+    Path,
+    Quantifier,
+    Step,
+    Truthiness,
+    compile_condition,
+    compile_field,
+    compile_parsed,
+    format_query,
+    has_lookup,
+    reorder,
+    split_lhs,
+    split_order,
+)
+from .order import directed, sort_value
+from .parser import parse_query
+from .views import ObjectView, materialize
+
+if TYPE_CHECKING:
+    import pyparsing as pp
 
-pp.ParserElement.enablePackrat()
+    from .explain import Explanation
 
 # any Gramps object stored in a database table: primary objects like Person or
 # Event, but also Note and Tag, which are not PrimaryObject subclasses.
 # Gramps ships no type information, hence the alias to Any.
 GrampsObject: TypeAlias = Any
 
+T = TypeVar("T")
+
 
 def obj_to_json(obj: GrampsObject) -> dict[str, Any]:
     """Convert a Gramps object to JSON."""
@@ -29,47 +70,74 @@ def to_dict(obj: GrampsObject) -> dict[str, Any]:
     return obj_dict
 
 
+def from_dict(obj_dict: Mapping[str, Any]) -> GrampsObject:
+    """Convert a dictionary representation (or a view) back to a Gramps object."""
+    if isinstance(obj_dict, ObjectView):
+        return obj_dict.obj
+    return data_to_object(
+        {key: value for key, value in obj_dict.items() if key != "class"}
+    )
+
+
+def batched(iterable: Iterable[T], size: int) -> Iterator[list[T]]:
+    """Split an iterable into lists of (at most) a given size."""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
 def match(
     query: str,
-    obj: GrampsObject | dict[str, Any],
+    obj: GrampsObject | Mapping[str, Any],
     db: DbReadBase | None = None,
 ) -> bool:
     """Match a single object (optionally given as dictionary) to a query."""
     gq = GQLQuery(query=query, db=db)
-    if not isinstance(obj, dict):
-        obj = to_dict(obj)
+    if not isinstance(obj, Mapping):
+        obj = ObjectView(obj)
     return gq.match(obj)
 
 
-def iter_objects(query: str, db: DbReadBase) -> Generator[GrampsObject, None, None]:
+def iter_objects(
+    query: str,
+    db: DbReadBase,
+    as_dict: bool = False,
+    prefetch: int = 0,
+    limit: int | None = None,
+    offset: int = 0,
+) -> Generator[GrampsObject | dict[str, Any], None, None]:
     """Iterate over objects in a Gramps database."""
     gq = GQLQuery(query=query, db=db)
-    return gq.iter_objects()
+    return gq.iter_objects(
+        as_dict=as_dict, prefetch=prefetch, limit=limit, offset=offset
+    )
+
 
+def iter_values(
+    query: str,
+    db: DbReadBase,
+    fields: Sequence[str],
+    as_dict: bool = False,
+    prefetch: int = 0,
+    limit: int | None = None,
+    offset: int = 0,
+) -> Generator[tuple[Any, ...] | dict[str, Any], None, None]:
+    """Iterate over property values of the objects matching a query."""
+    gq = GQLQuery(query=query, db=db)
+    return gq.iter_values(
+        fields, as_dict=as_dict, prefetch=prefetch, limit=limit, offset=offset
+    )
 
-word = pp.Word(pp.alphanums + "." + "_")
-rhs = word | pp.dbl_quoted_string | pp.sgl_quoted_string
-# lhs = pp.Word(pp.identchars, pp.identbodychars + "." + "_")
-logical_and = pp.CaselessKeyword("and")
-logical_or = pp.CaselessKeyword("or")
-logical = logical_and | logical_or
-operator = pp.one_of("= != < <= > >= ~ !~")
 
+def count(query: str, db: DbReadBase) -> int:
+    """Count the objects in a Gramps database matching a query."""
+    return GQLQuery(query=query, db=db).count()
 
-property_name = pp.Word(pp.identchars, pp.identbodychars + "_")
-attribute = "." + property_name
-index = "[" + pp.common.integer + "]"
-lhs = property_name + (attribute | index) * ...
 
-expression = pp.Combine(lhs("lhs*")) + (operator("operator*") + rhs("rhs*")) * ...
+def exists(query: str, db: DbReadBase) -> bool:
+    """Return whether any object in a Gramps database matches a query."""
+    return GQLQuery(query=query, db=db).exists()
 
-infix = pp.infix_notation(
-    expression,
-    [
-        (logical_and, 2, pp.OpAssoc.LEFT),
-        (logical_or, 2, pp.OpAssoc.LEFT),
-    ],
-)
 
 GRAMPS_OBJECT_NAMES = {
     "person": "people",
@@ -85,150 +153,206 @@ GRAMPS_OBJECT_NAMES = {
 }
 
 
-def parse(query: str) -> pp.ParseResults:
-    """Parse a query."""
-    return infix.parse_string(query, parse_all=True)
+# elements of the pyparsing grammar, which is only imported when used
+GRAMMAR_NAMES = frozenset(
+    {
+        "word",
+        "rhs",
+        "logical_and",
+        "logical_or",
+        "logical",
+        "operator",
+        "property_name",
+        "attribute",
+        "index",
+        "lhs",
+        "expression",
+        "infix",
+    }
+)
 
 
-def parse_lhs(query: str) -> pp.ParseResults:
-    """Parse the left-hand side of a query."""
-    return lhs.parse_string(query, parse_all=True)
+def __getattr__(name: str) -> Any:
+    """Return elements of the pyparsing grammar."""
+    if name in GRAMMAR_NAMES:
+        return getattr(import_module(".grammar", __package__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
-class GQLQuery:
-    """GQL query class."""
+def parse(query: str) -> "pp.ParseResults":
+    """Parse a query with the pyparsing grammar."""
+    from .grammar import query as grammar
 
-    def __init__(self, query: str, db: DbReadBase | None = None) -> None:
-        """Initialize self."""
-        self.query = query
-        self.parsed = parse(self.query)
-        self.db = db
+    return grammar.parse_string(query, parse_all=True)
 
-    @staticmethod
-    def _combine_logical(op: str | None, value1: bool | None, value2: bool) -> bool:
-        """Combine booleans with a logical operator as string."""
-        if op == "and":
-            return bool(value1) and value2
-        elif op == "or":
-            return bool(value1) or value2
-        # if op is None, return the second value
-        return value2
-
-    def _traverse(self, parsed_list: list[Any], obj: dict[str, Any]) -> bool:
-        """Traverse a nested parsed list."""
-        result: bool | None = None
-        op: str | None = None
-        expression: list[Any] = []
-        for item in parsed_list:
-            if isinstance(item, list) or item in ["and", "or"]:
-                if expression:
-                    value = self._match_single(obj, *expression)
-                    result = self._combine_logical(op, result, value)
-                    op = None
-                expression = []
-                if item in ["and", "or"]:
-                    op = item
-                elif isinstance(item, list):
-                    value = self._traverse(item, obj)
-                    result = self._combine_logical(op, result, value)
-                    op = None
-            else:
-                expression.append(item)
-        if expression:
-            value = self._match_single(obj, *expression)
-            result = self._combine_logical(op, result, value)
-        return bool(result)
 
-    def match(self, obj: dict[str, Any]) -> bool:
-        """Match an object to the query."""
-        parsed_list = self.parsed.as_list()
-        return self._traverse(parsed_list, obj)
+def parse_lhs(query: str) -> "pp.ParseResults":
+    """Parse the left-hand side of a query."""
+    from .grammar import lhs
 
-    def _match_single(
-        self, obj: Any, lhs: str, operator: str = "", rhs: Any = ""
-    ) -> bool:
-        """Match an object to a single condition."""
-        parsed = parse_lhs(lhs)
-        if not parsed:
-            raise ValueError(f"Unable to parse left-hand side: {lhs}")
-        result: Any = None
-        for i, part in enumerate(parsed):
-            if i == 0 and isinstance(obj, dict):
-                result = obj.get(part)
-            elif i == 0 and not (isinstance(part, str) and part.startswith("get_")):
-                # the object is not a dictionary (e.g. a handle string), so the
-                # first path segment can only be resolved by a get_ method
+    return lhs.parse_string(query, parse_all=True)
+
+
+class Evaluator:
+    """Evaluate compiled nodes for objects, looking up objects in a database."""
+
+    def __init__(
+        self, db: DbReadBase | None = None, cache: HandleCache | None = None
+    ) -> None:
+        """Initialize self.
+
+        Objects looked up with ``get_*`` are cached in ``cache`` if given.
+        """
+        self.db = db
+        self.cache = cache
+        self._run_cache: HandleCache | None = None
+
+    def _evaluate(self, node: Node, obj: Any) -> bool:
+        """Evaluate a compiled node for an object."""
+        if isinstance(node, Comparison):
+            value = self._resolve(obj, node.path)
+            if value is None:
                 return False
-            elif part in ["[", "]", "."]:
-                continue
-            elif part == "length":
-                result = len(result)
-            elif part in ["all", "any"]:
-                if i + 1 == len(parsed):  # last item
-                    results = [
-                        self._match_values(item, operator, rhs) for item in result
-                    ]
-                elif len(parsed) > i + 1 and parsed[i + 1] == ".":
-                    lhs_rest = "".join(parsed[i + 2 :])
-                    results = [
-                        self._match_single(item, lhs_rest, operator, rhs)
-                        for item in result
-                    ]
-                else:
-                    raise ValueError(f"'any' cannot be followed by {parsed[i + 1]}")
-                try:
-                    if part == "all":
-                        # bool(results) because all([]) is True
-                        return bool(results) and all(results)
-                    else:
-                        return any(results)
-                except TypeError:
-                    return False
-            elif isinstance(part, str) and part.startswith("get_"):
-                if not self.db:
-                    raise ValueError("Database is needed for get")
-                try:
-                    if i == 0 and isinstance(obj, str):
-                        result = obj
-                    _obj = getattr(self.db, f"{part}_from_handle")(result)
-                except (AttributeError, HandleError):
+            return self._match_values(value, node)
+        if isinstance(node, Truthiness):
+            return bool(self._resolve(obj, node.path))
+        if isinstance(node, And):
+            for operand in node.operands:
+                if not self._evaluate(operand, obj):
                     return False
-                result = to_dict(_obj)
-            else:
-                try:
-                    result = result[part]
-                except (KeyError, IndexError):
+            return True
+        if isinstance(node, Or):
+            for operand in node.operands:
+                if self._evaluate(operand, obj):
+                    return True
+            return False
+        if isinstance(node, Quantifier):
+            return self._evaluate_quantifier(node, obj)
+        if isinstance(node, Backlinks):
+            return self._evaluate_backlinks(node, obj)
+        return self._evaluate_lookup(node, obj)
+
+    def _evaluate_quantifier(self, node: Quantifier, obj: Any) -> bool:
+        """Evaluate ``any`` or ``all`` for the items of a list."""
+        items = self._resolve(obj, node.path)
+        if items is None:
+            return False
+        try:
+            iterator = iter(items)
+        except TypeError:
+            return False
+        if node.quantifier == "all":
+            # unlike all(), an empty list does not match
+            matched = False
+            for item in iterator:
+                if not self._evaluate(node.predicate, item):
                     return False
+                matched = True
+            return matched
+        for item in iterator:
+            if self._evaluate(node.predicate, item):
+                return True
+        return False
+
+    def _evaluate_lookup(self, node: Lookup, obj: Any) -> bool:
+        """Evaluate a condition on the object referred to by a handle."""
+        handle = self._resolve(obj, node.path)
+        if not isinstance(handle, str):
+            return False
+        obj_dict = self._lookup(node.name, handle)
+        if obj_dict is None:
+            return False
+        return self._evaluate(node.predicate, obj_dict)
+
+    def _evaluate_backlinks(self, node: Backlinks, obj: Any) -> bool:
+        """Evaluate a condition on the objects referring to an object."""
+        return self._evaluate(node.predicate, {BACKLINKS: self._backlinks(obj)})
+
+    def _backlinks(self, obj: Any) -> list[Mapping[str, Any]]:
+        """Return the objects referring to an object.
+
+        Uses the reference map of the database instead of scanning it.
+        """
+        handle = obj.get("handle") if isinstance(obj, Mapping) else None
+        if not isinstance(handle, str):
+            return []
+        objects = []
+        for class_name, referrer in self._backlink_handles(handle):
+            obj_dict = self._lookup(class_name, referrer)
+            if obj_dict is not None:
+                objects.append(obj_dict)
+        return objects
+
+    def _backlink_handles(self, handle: str) -> list[tuple[str, str]]:
+        """Return the class names and handles of the objects referring to one."""
+        if not self.db:
+            raise ValueError("Database is needed for backlinks")
+        return [
+            (class_name.lower(), referrer)
+            for class_name, referrer in self.db.find_backlink_handles(handle)
+        ]
+
+    def _lookup(self, class_name: str, handle: str) -> Mapping[str, Any] | None:
+        """Return a looked up object, using the cache if there is one."""
+        cache = self.cache if self.cache is not None else self._run_cache
+        if cache is None:
+            return self._load(class_name, handle)
+        return cache.lookup(class_name, handle, self._load)
+
+    def _load(self, class_name: str, handle: str) -> Mapping[str, Any] | None:
+        """Look up an object by handle, returning None if it does not exist."""
+        if not self.db:
+            raise ValueError("Database is needed for get")
+        try:
+            obj = getattr(self.db, f"get_{class_name}_from_handle")(handle)
+        except (AttributeError, HandleError):
+            return None
+        return ObjectView(obj)
+
+    def _resolve(self, obj: Any, path: Path) -> Any:
+        """Return the value at a property path, or None if it does not exist."""
+        result = obj
+        for step in path:
+            try:
+                if step is Step.LENGTH:
+                    result = len(result)
+                else:
+                    result = result[step]
+            except (KeyError, IndexError, TypeError):
+                return None
             if result is None:
-                return False
-        return self._match_values(result, operator, rhs)
-
-    def _match_values(self, result: Any, operator: str = "", rhs: Any = "") -> bool:
-        """Match two values."""
-        if not operator:
-            return bool(result)
-        if isinstance(rhs, str):
-            if rhs.isdigit():
-                rhs = int(rhs)
-            else:
-                rhs = rhs.strip("\"'")
-        if operator == "=":
-            if isinstance(result, str):
-                return result.casefold() == str(rhs).casefold()
-            return bool(result == rhs)
-        if operator == "!=":
-            if isinstance(result, str):
-                return result.casefold() != str(rhs).casefold()
-            return bool(result != rhs)
-        if operator == "~":
-            if isinstance(result, str):
-                return str(rhs).casefold() in result.casefold()
-            return bool(rhs in result)
-        if operator == "!~":
-            if isinstance(result, str):
-                return str(rhs).casefold() not in result.casefold()
-            return bool(rhs not in result)
+                return None
+        return result
+
+    @staticmethod
+    def _match_values(result: Any, node: Comparison) -> bool:
+        """Match a value to the literal of a comparison."""
+        operator = node.operator
+        if isinstance(result, str):
+            if operator == "=":
+                return bool(result.casefold() == node.folded)
+            if operator == "!=":
+                return bool(result.casefold() != node.folded)
+            if operator == "~":
+                return node.folded in result.casefold()
+            if operator == "!~":
+                return node.folded not in result.casefold()
+            if operator == "in":
+                return result.casefold() in node.folded
+            if operator == "=~":
+                return node.value.search(result) is not None
+        rhs = node.value
         try:
+            if operator == "=":
+                return bool(result == rhs)
+            if operator == "!=":
+                return bool(result != rhs)
+            if operator == "~":
+                return rhs in result
+            if operator == "!~":
+                return rhs not in result
+            if operator == "in":
+                return result in rhs
             if operator == "<":
                 return bool(result < rhs)
             if operator == ">":
@@ -241,13 +365,617 @@ class GQLQuery:
             return False
         return False
 
-    def iter_objects(self) -> Generator[GrampsObject, None, None]:
-        """Iterate over objects in a Gramps database."""
+
+class GQLQuery(Evaluator):
+    """GQL query class."""
+
+    def __init__(
+        self,
+        query: str,
+        db: DbReadBase | None = None,
+        cache: HandleCache | None = None,
+        columnar: bool = False,
+        results: ResultCache | None = None,
+    ) -> None:
+        """Initialize self.
+
+        Objects looked up with ``get_*`` are cached in ``cache`` if given,
+        otherwise in a new cache for every run of ``iter_objects``. With
+        ``columnar``, the conditions evaluated in Python are matched in
+        batches of objects with NumPy (see ``columnar``). With ``results``,
+        the handles of the matching objects of a SQLite database are stored
+        after a complete run and served from there while the database file
+        is unchanged.
+        """
+        if columnar:
+            from .columnar import HAVE_NUMPY
+
+            if not HAVE_NUMPY:
+                raise ImportError("NumPy is needed for the columnar engine")
+        self.query = query
+        compiled = query_cache.get(query)
+        self.root = compiled.root
+        self.target_classes = compiled.target_classes
+        self.order = compiled.order
+        super().__init__(db, cache)
+        self.columnar = columnar
+        self.results = results
+
+    @property
+    def parsed(self) -> "pp.ParseResults":
+        """Return the output of the pyparsing grammar for the query."""
+        return parse(self.query)
+
+    @staticmethod
+    def _target_classes(node: Node) -> frozenset[str]:
+        """Return the object classes a node can possibly match.
+
+        Only conditions on ``class`` (or ``_class``) restrict the classes;
+        they are decided by matching every class name against them.
+        """
+        if isinstance(node, And):
+            classes = frozenset(GRAMPS_OBJECT_NAMES)
+            for operand in node.operands:
+                classes &= GQLQuery._target_classes(operand)
+            return classes
+        if isinstance(node, Or):
+            classes = frozenset()
+            for operand in node.operands:
+                classes |= GQLQuery._target_classes(operand)
+            return classes
+        if isinstance(node, Comparison) and node.path == ("class",):
+            return frozenset(
+                name
+                for name in GRAMPS_OBJECT_NAMES
+                if GQLQuery._match_values(name, node)
+            )
+        if isinstance(node, Comparison) and node.path == ("_class",):
+            return frozenset(
+                name
+                for name in GRAMPS_OBJECT_NAMES
+                if GQLQuery._match_values(name.capitalize(), node)
+            )
+        return frozenset(GRAMPS_OBJECT_NAMES)
+
+    def match(self, obj: Mapping[str, Any]) -> bool:
+        """Match an object (a dictionary or an ``ObjectView``) to the query."""
+        return self._evaluate(self.root, obj)
+
+    def _match_single(
+        self, obj: Any, lhs: str, operator: str = "", rhs: Any = ""
+    ) -> bool:
+        """Match an object to a single condition."""
+        parse_lhs(lhs)  # raises if the left-hand side is invalid
+        node = compile_condition(split_lhs(lhs), operator, rhs)
+        return self._evaluate(node, obj)
+
+    def iter_objects(
+        self,
+        as_dict: bool = False,
+        prefetch: int = 0,
+        limit: int | None = None,
+        offset: int = 0,
+    ) -> Generator[GrampsObject | dict[str, Any], None, None]:
+        """Iterate over objects in a Gramps database.
+
+        Objects are matched on their raw data and only converted to Gramps
+        objects if they match. With ``as_dict``, the dictionary
+        representation (as returned by ``to_dict``) is yielded instead.
+
+        If ``prefetch`` is positive, candidates are matched in chunks of
+        that size and the objects their ``get_*`` steps refer to are
+        fetched with one query per table and chunk.
+
+        The first ``offset`` matching objects are skipped without converting
+        them, and reading stops after ``limit`` objects (if not None).
+        """
+        for obj, obj_dict in self._iter_page(prefetch, limit, offset):
+            if as_dict:
+                yield materialize(obj_dict)
+            else:
+                yield obj if obj is not None else from_dict(obj_dict)
+
+    def iter_values(
+        self,
+        fields: Sequence[str],
+        as_dict: bool = False,
+        prefetch: int = 0,
+        limit: int | None = None,
+        offset: int = 0,
+    ) -> Generator[tuple[Any, ...] | dict[str, Any], None, None]:
+        """Iterate over the values of property paths of the matching objects.
+
+        ``fields`` are left-hand sides like ``primary_name.first_name``,
+        possibly with ``get_*`` steps. For every matching object, a tuple
+        of their values (None for missing ones) is yielded, or with
+        ``as_dict`` a dictionary keyed by the fields. The values are taken
+        from the raw data, so no Gramps objects are created.
+
+        See ``iter_objects`` for the other arguments.
+        """
+        compiled = [self._compile_field(field) for field in fields]
+        for _obj, obj_dict in self._iter_page(prefetch, limit, offset):
+            values = tuple(self._project(field, obj_dict) for field in compiled)
+            yield dict(zip(fields, values, strict=True)) if as_dict else values
+
+    @staticmethod
+    def _compile_field(lhs: str) -> Field:
+        """Compile a left-hand side to project."""
+        tokens = parse_query(lhs)  # raises if the left-hand side is invalid
+        if len(tokens) != 1 or not isinstance(tokens[0], str):
+            raise ValueError(f"Invalid field: {lhs}")
+        return compile_field(split_lhs(tokens[0]))
+
+    def _project(self, field: Field, obj: Mapping[str, Any]) -> Any:
+        """Return the value of a field for an object, None if it is missing."""
+        value = self._resolve(obj, field.paths[0])
+        for class_name, path in zip(field.lookups, field.paths[1:], strict=True):
+            if not isinstance(value, str):
+                return None
+            looked_up = self._lookup(class_name, value)
+            if looked_up is None:
+                return None
+            value = self._resolve(looked_up, path)
+        return materialize(value)
+
+    def count(self) -> int:
+        """Return the number of matching objects.
+
+        No objects are converted, and tables that SQLite can filter
+        completely are counted with ``COUNT(*)``.
+        """
+        if not self.db:
+            raise ValueError("Database is needed for iterating objects!")
+        handles = self._cached_handles(self._result_key())
+        if handles is not None:
+            return len(handles)
+        with self._run() as connection:
+            if connection is None:
+                return sum(1 for _match in self._matches_python())
+            indexes = sql.indexes(connection)
+            total = 0
+            for class_name in GRAMPS_OBJECT_NAMES:
+                if class_name not in self.target_classes:
+                    continue
+                table_plan = sql.plan(self.root, class_name, self._evaluate, indexes)
+                if table_plan.residual is None:
+                    total += sql.count(connection, table_plan)
+                    continue
+                with closing(sql.iter_rows(connection, table_plan)) as rows:
+                    candidates = self._row_candidates(rows, class_name)
+                    total += sum(
+                        1 for _match in self._filter(candidates, table_plan.residual)
+                    )
+            return total
+
+    def exists(self) -> bool:
+        """Return whether any object matches, stopping at the first one."""
+        if not self.db:
+            raise ValueError("Database is needed for iterating objects!")
+        handles = self._cached_handles(self._result_key())
+        if handles is not None:
+            return bool(handles)
+        with closing(self._iter_matches()) as matches:
+            for _match in matches:
+                return True
+        return False
+
+    def iter_objects_parallel(
+        self, workers: int | None = None, ordered: bool = True, as_dict: bool = False
+    ) -> Generator[GrampsObject | dict[str, Any], None, None]:
+        """Iterate over objects, matching them in worker processes.
+
+        See ``parallel.iter_objects_parallel``.
+        """
+        from .parallel import iter_objects_parallel
+
+        return iter_objects_parallel(
+            self, workers=workers, ordered=ordered, as_dict=as_dict
+        )
+
+    def explain(self) -> "Explanation":
+        """Return how the query is executed on its database.
+
+        See ``explain.explain``.
+        """
+        from .explain import explain
+
+        return explain(self)
+
+    def _iter_page(
+        self, prefetch: int = 0, limit: int | None = None, offset: int = 0
+    ) -> Generator[tuple[GrampsObject | None, Mapping[str, Any]], None, None]:
+        """Iterate over the matches from ``offset``, at most ``limit`` of them."""
         if not self.db:
             raise ValueError("Database is needed for iterating objects!")
-        for objects_name in GRAMPS_OBJECT_NAMES.values():
-            iter_method = getattr(self.db, f"iter_{objects_name}")
-            for obj in iter_method():
-                obj_dict = to_dict(obj)
-                if self.match(obj_dict):
-                    yield obj
+        if (limit is not None and limit < 0) or offset < 0:
+            raise ValueError("limit and offset must not be negative")
+        if limit == 0:
+            return
+        key = self._result_key()
+        handles = self._cached_handles(key)
+        if handles is not None:
+            matches = self._load_results(handles[offset:])
+        elif self.order:
+            matches = self._iter_ordered(prefetch, limit, offset)
+        else:
+            matches = self._iter_matches(prefetch, offset)
+        if key is not None and handles is None and limit is None and not offset:
+            matches = self._store_results(matches, key)
+        with closing(matches):
+            for number, candidate in enumerate(matches, start=1):
+                yield candidate
+                if number == limit:
+                    return
+
+    def _result_key(self) -> tuple[str, str, str] | None:
+        """Return the key of the query in the result cache.
+
+        The key is the normalized query, the database file and its revision.
+        Returns None without result cache or if the database is not a SQLite
+        file.
+        """
+        if self.results is None:
+            return None
+        path = sql.database_file(self.db)
+        if path is None:
+            return None
+        path = os.path.realpath(path)
+        return format_query(self.root, self.order), path, sql.revision(path)
+
+    def _cached_handles(
+        self, key: tuple[str, str, str] | None
+    ) -> list[tuple[str, str]] | None:
+        """Return the cached class names and handles of the matches, if any."""
+        if key is None or self.results is None:
+            return None
+        return self.results.get(*key)
+
+    def _store_results(
+        self,
+        matches: Generator[tuple[GrampsObject | None, Mapping[str, Any]], None, None],
+        key: tuple[str, str, str],
+    ) -> Generator[tuple[GrampsObject | None, Mapping[str, Any]], None, None]:
+        """Pass on matches, storing their handles in the result cache at the end.
+
+        Nothing is stored if the iteration stops early.
+        """
+        handles = []
+        with closing(matches):
+            for candidate in matches:
+                obj_dict = candidate[1]
+                handles.append((obj_dict["class"], obj_dict["handle"]))
+                yield candidate
+        if self.results is not None:
+            self.results.store(*key, handles)
+
+    def _load_results(
+        self, handles: list[tuple[str, str]]
+    ) -> Generator[tuple[GrampsObject | None, Mapping[str, Any]], None, None]:
+        """Load cached matches in order, fetching them in bulk."""
+        for chunk in batched(handles, sql.FETCH_SIZE):
+            wanted: dict[str, list[str]] = {}
+            for class_name, handle in chunk:
+                wanted.setdefault(class_name, []).append(handle)
+            fetched = {
+                class_name: sql.fetch(self.db, class_name, class_handles) or {}
+                for class_name, class_handles in wanted.items()
+            }
+            for class_name, handle in chunk:
+                obj_dict = fetched[class_name].get(handle)
+                if obj_dict is not None:
+                    yield None, obj_dict
+
+    def _iter_ordered(
+        self, prefetch: int = 0, limit: int | None = None, offset: int = 0
+    ) -> Generator[tuple[GrampsObject | None, Mapping[str, Any]], None, None]:
+        """Iterate over the matches in the order of the ``order by`` clause.
+
+        With a limit, only the sort keys and handles of the first
+        ``offset + limit`` matches are kept, in a bounded heap or SQLite's
+        sorter.
+        """
+        stop = None if limit is None else offset + limit
+        with self._run() as connection:
+            if connection is not None and self._sortable_in_sql():
+                sorted_tables = self._sorted_tables(connection, stop)
+                try:
+                    merged = heapq.merge(*sorted_tables, key=itemgetter(0))
+                    for _key, candidate in islice(merged, offset, stop):
+                        yield candidate
+                finally:
+                    # close the cursors before the connection
+                    for sorted_table in sorted_tables:
+                        sorted_table.close()
+                return
+            if connection is None:
+                matches = self._matches_python(prefetch)
+            else:
+                matches = self._matches_sql(connection, prefetch)
+            names = list(GRAMPS_OBJECT_NAMES)
+            entries = (
+                (
+                    self._sort_key(obj_dict),
+                    names.index(obj_dict["class"]),
+                    obj_dict["handle"],
+                )
+                for _obj, obj_dict in matches
+            )
+            if stop is None:
+                ordered = sorted(entries)
+            else:
+                ordered = heapq.nsmallest(stop, entries)
+            for _key, table, handle in ordered[offset:]:
+                obj_dict = self._load(names[table], handle)
+                if obj_dict is not None:
+                    yield None, obj_dict
+
+    def _sort_key(self, obj: Mapping[str, Any]) -> tuple[Any, ...]:
+        """Return the sort key of an object."""
+        return tuple(
+            directed(sort_value(self._project(key.field, obj)), key.descending)
+            for key in self.order
+        )
+
+    def _sortable_in_sql(self) -> bool:
+        """Return whether SQLite can sort by all keys of the query."""
+        return all(
+            not key.field.lookups
+            and Step.LENGTH not in key.field.paths[0]
+            and sql.indexes_arrays(key.field.paths[0])
+            # class is not stored in the JSON data
+            and key.field.paths[0][:1] != ("class",)
+            for key in self.order
+        )
+
+    def _sorted_tables(
+        self, connection: sqlite3.Connection, limit: int | None
+    ) -> list[
+        Generator[tuple[tuple[Any, ...], tuple[None, dict[str, Any]]], None, None]
+    ]:
+        """Return the sorted matches of every table with their sort keys."""
+        keys = [(key.field.paths[0], key.descending) for key in self.order]
+        indexes = sql.indexes(connection)
+        tables = []
+        for i, class_name in enumerate(GRAMPS_OBJECT_NAMES):
+            if class_name not in self.target_classes:
+                continue
+            table_plan = sql.plan(self.root, class_name, self._evaluate, indexes)
+            rows = sql.iter_sorted_rows(
+                connection,
+                table_plan,
+                keys,
+                # the residual might reject rows
+                limit=limit if table_plan.residual is None else None,
+            )
+            tables.append(
+                self._sorted_candidates(rows, class_name, i, table_plan.residual)
+            )
+        return tables
+
+    def _sorted_candidates(
+        self,
+        rows: Iterable[tuple[Any, ...]],
+        class_name: str,
+        table: int,
+        residual: Node | None,
+    ) -> Generator[tuple[tuple[Any, ...], tuple[None, dict[str, Any]]], None, None]:
+        """Turn sorted rows into matches with their sort keys."""
+        for handle, json_data, *columns in rows:
+            obj_dict = string_to_dict(json_data)
+            obj_dict["class"] = class_name
+            if residual is not None and not self._evaluate(residual, obj_dict):
+                continue
+            key = tuple(
+                directed((rank, value if rank else 0), order_key.descending)
+                for order_key, rank, value in zip(
+                    self.order, columns[::2], columns[1::2], strict=True
+                )
+            )
+            yield (key, table, handle), (None, obj_dict)
+
+    @contextmanager
+    def _run(self) -> Iterator[sqlite3.Connection | None]:
+        """Prepare a run over the database.
+
+        Sets up the lookup cache of the run and returns an SQLite connection
+        if the query can be translated to SQL.
+        """
+        if self.cache is None:
+            self._run_cache = HandleCache()
+        try:
+            connection = sql.connect(self.db)
+            if connection is None:
+                yield None
+                return
+            with closing(connection):
+                yield connection
+        finally:
+            self._run_cache = None
+
+    def _iter_matches(
+        self, prefetch: int = 0, offset: int = 0
+    ) -> Generator[tuple[GrampsObject | None, Mapping[str, Any]], None, None]:
+        """Iterate over the matching objects (if known) and dictionaries."""
+        with self._run() as connection:
+            if connection is not None:
+                yield from self._matches_sql(connection, prefetch, offset)
+                return
+            with closing(self._matches_python(prefetch)) as matches:
+                yield from islice(matches, offset, None)
+
+    def _matches_python(
+        self, prefetch: int = 0
+    ) -> Generator[tuple[GrampsObject | None, Mapping[str, Any]], None, None]:
+        """Iterate over matches, matching the raw data in Python."""
+        for class_name in GRAMPS_OBJECT_NAMES:
+            if class_name not in self.target_classes:
+                continue
+            with getattr(self.db, f"get_{class_name}_cursor")() as cursor:
+                yield from self._filter(
+                    self._raw_candidates(cursor, class_name), self.root, prefetch
+                )
+
+    @staticmethod
+    def _raw_candidates(
+        cursor: Iterable[tuple[str, dict[str, Any]]], class_name: str
+    ) -> Generator[tuple[GrampsObject | None, Mapping[str, Any]], None, None]:
+        """Turn raw cursor data into objects (if known) and dictionaries."""
+        for _handle, data in cursor:
+            # proxy databases create the raw data from the object
+            obj = data.get("_object")
+            if obj is not None:
+                yield obj, ObjectView(obj)
+            else:
+                data["class"] = class_name
+                yield None, data
+
+    def _matches_sql(
+        self, connection: sqlite3.Connection, prefetch: int = 0, offset: int = 0
+    ) -> Generator[tuple[GrampsObject | None, Mapping[str, Any]], None, None]:
+        """Iterate over matches, filtering the rows in SQLite where possible.
+
+        Matches to skip are skipped by SQLite in tables it filters
+        completely; tables with fewer of them are skipped after counting.
+        """
+        indexes = sql.indexes(connection)
+        for class_name in GRAMPS_OBJECT_NAMES:
+            if class_name not in self.target_classes:
+                continue
+            table_plan = sql.plan(self.root, class_name, self._evaluate, indexes)
+            skip = 0
+            if offset and table_plan.residual is None:
+                count = sql.count(connection, table_plan)
+                if count <= offset:
+                    offset -= count
+                    continue
+                skip, offset = offset, 0
+            # closed before the connection, also after errors
+            rows = sql.iter_rows(connection, table_plan, offset=skip)
+            matches = self._filter(
+                self._row_candidates(rows, class_name), table_plan.residual, prefetch
+            )
+            with closing(rows), closing(matches):
+                for candidate in matches:
+                    if offset:
+                        offset -= 1
+                        continue
+                    yield candidate
+
+    @staticmethod
+    def _row_candidates(
+        rows: Iterable[tuple[str, str]], class_name: str
+    ) -> Generator[tuple[None, dict[str, Any]], None, None]:
+        """Turn rows of handles and JSON data into dictionaries."""
+        for _handle, json_data in rows:
+            obj_dict = string_to_dict(json_data)
+            obj_dict["class"] = class_name
+            yield None, obj_dict
+
+    def _filter(
+        self,
+        candidates: Iterable[tuple[GrampsObject | None, Mapping[str, Any]]],
+        node: Node | None,
+        prefetch: int = 0,
+    ) -> Generator[tuple[GrampsObject | None, Mapping[str, Any]], None, None]:
+        """Yield the candidates matching a node (all of them for None)."""
+        cache = self.cache if self.cache is not None else self._run_cache
+        if (
+            node is not None
+            and prefetch > 0
+            and cache is not None
+            and cache.maxsize
+            and has_lookup(node)
+        ):
+            candidates = self._prefetched(candidates, node, prefetch, cache)
+        if node is None:
+            yield from candidates
+            return
+        if self.columnar:
+            from .columnar import filter_batches
+
+            yield from filter_batches(candidates, node, self._evaluate)
+            return
+        for candidate in candidates:
+            if self._evaluate(node, candidate[1]):
+                yield candidate
+
+    def _prefetched(
+        self,
+        candidates: Iterable[tuple[GrampsObject | None, Mapping[str, Any]]],
+        node: Node,
+        size: int,
+        cache: HandleCache,
+    ) -> Generator[tuple[GrampsObject | None, Mapping[str, Any]], None, None]:
+        """Pass on candidates in chunks, prefetching their lookups first."""
+        for chunk in batched(candidates, size):
+            self._prefetch(node, [obj_dict for _obj, obj_dict in chunk], cache)
+            yield from chunk
+
+    def _prefetch(
+        self, node: Node, objects: list[Mapping[str, Any]], cache: HandleCache
+    ) -> None:
+        """Load the objects that evaluating a node will look up into a cache.
+
+        Handles are collected level by level, so nested ``get_*`` steps
+        are fetched once the objects referring to them are available.
+        """
+        todo: list[tuple[Node, Any]] = [(node, obj) for obj in objects]
+        while todo:
+            lookups: list[tuple[Lookup, str]] = []
+            for _node, obj in todo:
+                self._collect_lookups(_node, obj, lookups)
+            wanted: dict[str, set[str]] = {}
+            for lookup, handle in lookups:
+                if (lookup.name, handle) not in cache:
+                    wanted.setdefault(lookup.name, set()).add(handle)
+            for class_name, handles in wanted.items():
+                fetched = sql.fetch(self.db, class_name, handles)
+                for handle in handles:
+                    if fetched is None:
+                        obj_dict = self._load(class_name, handle)
+                    else:
+                        obj_dict = fetched.get(handle)
+                    cache.store(class_name, handle, obj_dict)
+            todo = []
+            for lookup, handle in lookups:
+                obj_dict = cache.peek(lookup.name, handle)
+                if obj_dict is not None and has_lookup(lookup.predicate):
+                    todo.append((lookup.predicate, obj_dict))
+
+    def _collect_lookups(
+        self, node: Node, obj: Any, lookups: list[tuple[Lookup, str]]
+    ) -> None:
+        """Collect the handles evaluating a node for an object can follow."""
+        if isinstance(node, (And, Or)):
+            for operand in node.operands:
+                self._collect_lookups(operand, obj, lookups)
+        elif isinstance(node, Quantifier):
+            items = self._resolve(obj, node.path)
+            if isinstance(items, list):
+                for item in items:
+                    self._collect_lookups(node.predicate, item, lookups)
+        elif isinstance(node, Lookup):
+            handle = self._resolve(obj, node.path)
+            if isinstance(handle, str):
+                lookups.append((node, handle))
+
+
+@dataclass(frozen=True)
+class CompiledQuery:
+    """The compiled form of a query text."""
+
+    root: Node
+    target_classes: frozenset[str]
+    order: tuple[OrderKey, ...] = ()
+
+
+def compile_query(query: str) -> CompiledQuery:
+    """Parse and compile a query."""
+    condition, order = split_order(parse_query(query))
+    root = reorder(compile_parsed(condition))
+    return CompiledQuery(root, GQLQuery._target_classes(root), order)
+
+
+# compiled queries shared by all GQLQuery instances (and thus the helpers)
+query_cache: QueryCache[CompiledQuery] = QueryCache(compile_query)
@@ -0,0 +1,54 @@
+"""The pyparsing grammar of GQL.
+
+Queries are parsed with the hand-written parser in ``parser``; this
+grammar is only imported for the legacy ``parse`` output. Importing it
+enables pyparsing's packrat cache, which the grammar relies on to parse
+nested parentheses in reasonable time.
+"""
+
+import pyparsing as pp
+
+pp.ParserElement.enablePackrat()
+
+word = pp.Word(pp.alphanums + "." + "_")
+rhs = word | pp.dbl_quoted_string | pp.sgl_quoted_string
+# lhs = pp.Word(pp.identchars, pp.identbodychars + "." + "_")
+logical_and = pp.CaselessKeyword("and")
+logical_or = pp.CaselessKeyword("or")
+logical = logical_and | logical_or
+operator = pp.one_of("= != < <= > >= ~ !~ =~")
+in_operator = pp.CaselessKeyword("in")
+rhs_set = pp.Group(pp.Suppress("(") + pp.delimited_list(rhs) + pp.Suppress(")"))
+
+
+property_name = pp.Word(pp.identchars, pp.identbodychars + "_")
+attribute = "." + property_name
+index = "[" + pp.common.integer + "]"
+lhs = property_name + (attribute | index) * ...
+
+expression = (
+    pp.Combine(lhs("lhs*"))
+    + (
+        (operator("operator*") + rhs("rhs*"))
+        | (in_operator("operator*") + rhs_set("rhs*"))
+    )
+    * ...
+)
+
+infix = pp.infix_notation(
+    expression,
+    [
+        (logical_and, 2, pp.OpAssoc.LEFT),
+        (logical_or, 2, pp.OpAssoc.LEFT),
+    ],
+)
+
+direction = pp.CaselessKeyword("asc") | pp.CaselessKeyword("desc")
+order_key = pp.Group(pp.Combine(lhs) + pp.Optional(direction, default="asc"))
+order_clause = pp.Group(
+    pp.CaselessKeyword("order")
+    + pp.CaselessKeyword("by")
+    + pp.delimited_list(order_key)
+)
+
+query = infix + pp.Optional(order_clause)
@@ -0,0 +1,102 @@
+"""Indexes on property paths for Gramps SQLite databases.
+
+Indexes are SQLite expression indexes on ``json_extract`` of the JSON data
+and are stored in the database file. SQLite keeps them up to date for
+every change, also by Gramps itself. Queries translated to SQL use them
+for ``=``, ``<``, ``>``, ``<=`` and ``>=`` comparisons on the indexed
+property path.
+"""
+
+import hashlib
+import re
+from typing import NamedTuple
+
+from gramps.gen.db import DbReadBase
+
+from . import sql
+from .compiler import Step
+from .gql import GQLQuery
+
+
+class Index(NamedTuple):
+    """An index usable for a property path of a class.
+
+    ``builtin`` indexes are created and maintained by Gramps and cannot be
+    dropped.
+    """
+
+    class_name: str
+    field: str
+    name: str
+    builtin: bool
+
+
+def index_name(class_name: str, field: str) -> str:
+    """Return the name of the index on a property path of a class."""
+    key = _key(field)
+    slug = re.sub(r"\W+", "_", _field(key)).strip("_")
+    digest = hashlib.sha1(key.encode()).hexdigest()[:8]
+    return f"gql_{class_name}_{slug}_{digest}"
+
+
+def list_indexes(db: DbReadBase) -> list[Index]:
+    """Return the indexes of a Gramps SQLite database, by class."""
+    connection = sql.connect(db)
+    if connection is None:
+        raise ValueError("Indexes need a Gramps SQLite database without changes")
+    try:
+        indexed = sql.indexes(connection)
+    finally:
+        connection.close()
+    return [
+        Index(class_name, _field(key), name, not name.startswith("gql_"))
+        for class_name in sql.TABLES
+        for key, name in indexed[class_name].items()
+    ]
+
+
+def create_index(db: DbReadBase, class_name: str, field: str) -> Index:
+    """Create an index on a property path (a left-hand side) of a class.
+
+    Does nothing if the index exists already. Creating it reads the whole
+    table.
+    """
+    key = _key(field)
+    name = index_name(class_name, field)
+    _check(db, class_name)
+    db.dbapi.execute(
+        f'CREATE INDEX IF NOT EXISTS "{name}"'
+        f" ON {class_name}(json_extract(json_data, {sql.quote(key)}))"
+    )
+    db.dbapi.commit()
+    return Index(class_name, _field(key), name, False)
+
+
+def drop_index(db: DbReadBase, class_name: str, field: str) -> None:
+    """Drop the index on a property path of a class, if it exists."""
+    name = index_name(class_name, field)
+    _check(db, class_name)
+    db.dbapi.execute(f'DROP INDEX IF EXISTS "{name}"')
+    db.dbapi.commit()
+
+
+def _check(db: DbReadBase, class_name: str) -> None:
+    """Raise if a class of a database cannot be indexed."""
+    if sql.database_file(db) is None:
+        raise ValueError("Indexes need a Gramps SQLite database without changes")
+    if class_name not in sql.TABLES:
+        raise ValueError(f"Unknown class: {class_name}")
+
+
+def _key(field: str) -> str:
+    """Return the JSON path of a property path that can be indexed."""
+    compiled = GQLQuery._compile_field(field)
+    path = compiled.paths[0]
+    if compiled.lookups or Step.LENGTH in path:
+        raise ValueError(f"Cannot index {field}")
+    return "$" + sql.json_path(path)
+
+
+def _field(key: str) -> str:
+    """Return the property path of an indexed JSON path."""
+    return re.sub(r'\."([^"]*)"', r".\1", key[1:]).lstrip(".")
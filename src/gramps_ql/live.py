@@ -0,0 +1,209 @@
+"""Queries kept up to date with the changes of a Gramps database."""
+
+from collections.abc import Callable, Mapping
+from typing import Any, NamedTuple
+
+from gramps.gen.db import DbReadBase
+from gramps.gen.errors import HandleError
+
+from .cache import HandleCache
+from .compiler import has_backlinks, has_lookup
+from .gql import GRAMPS_OBJECT_NAMES, GQLQuery
+
+# an object by class name and handle
+Key = tuple[str, str]
+
+
+class Delta(NamedTuple):
+    """Objects that started or stopped matching a live query."""
+
+    added: frozenset[Key]
+    removed: frozenset[Key]
+
+
+class _TrackingQuery(GQLQuery):
+    """A query recording the objects looked up while evaluating it."""
+
+    def __init__(self, query: str, db: DbReadBase, cache: HandleCache) -> None:
+        """Initialize self."""
+        super().__init__(query, db=db, cache=cache)
+        self.looked_up: set[Key] = set()
+
+    def _lookup(self, class_name: str, handle: str) -> Mapping[str, Any] | None:
+        """Return a looked up object, recording its class name and handle."""
+        self.looked_up.add((class_name, handle))
+        return super()._lookup(class_name, handle)
+
+
+class LiveQuery:
+    """The matches of a query, updated when objects of the database change.
+
+    After ``connect``, every ``<class>-add``, ``-update`` and ``-delete``
+    signal re-evaluates only the changed objects and, for queries with
+    ``get_*`` steps, the objects whose conditions looked them up (with
+    ``backlinks``, also the objects they refer to). The changes of the
+    matches are passed to the callbacks as a ``Delta``.
+
+    Tracking the lookups keeps the looked up handles of every object of
+    the target classes in memory, not only of the matching ones.
+    """
+
+    def __init__(
+        self,
+        query: str,
+        db: DbReadBase,
+        callback: Callable[[Delta], None] | None = None,
+    ) -> None:
+        """Initialize self.
+
+        ``callback`` is called with every non-empty ``Delta``; more can be
+        added to ``callbacks``.
+        """
+        self.cache = HandleCache()
+        self.gq = _TrackingQuery(query, db, self.cache)
+        self.db = db
+        self.callbacks: list[Callable[[Delta], None]] = []
+        if callback is not None:
+            self.callbacks.append(callback)
+        self.matches: set[Key] = set()
+        self._track = has_lookup(self.gq.root)
+        self._backlinks = has_backlinks(self.gq.root)
+        # the objects each object looked up, and the reverse
+        self._depends_on: dict[Key, set[Key]] = {}
+        self._dependents: dict[Key, set[Key]] = {}
+        self._signal_keys: list[int] = []
+
+    def __contains__(self, key: Key) -> bool:
+        """Return whether the object with a class name and handle matches."""
+        return key in self.matches
+
+    def __len__(self) -> int:
+        """Return the number of matching objects."""
+        return len(self.matches)
+
+    def connect(self) -> None:
+        """Match all objects and start following the database signals."""
+        self.refresh()
+        for class_name in GRAMPS_OBJECT_NAMES:
+            for signal in ("add", "update", "delete"):
+                key = self.db.connect(
+                    f"{class_name}-{signal}", self._handles_changed(class_name)
+                )
+                self._signal_keys.append(key)
+            key = self.db.connect(f"{class_name}-rebuild", self._rebuilt)
+            self._signal_keys.append(key)
+
+    def disconnect(self) -> None:
+        """Stop following the database signals."""
+        for key in self._signal_keys:
+            self.db.disconnect(key)
+        self._signal_keys = []
+
+    def refresh(self) -> Delta:
+        """Match all objects again, returning (and emitting) the changes."""
+        self.cache.clear()
+        self._depends_on.clear()
+        self._dependents.clear()
+        if self._track:
+            matches = set()
+            for class_name in GRAMPS_OBJECT_NAMES:
+                if class_name not in self.gq.target_classes:
+                    continue
+                with getattr(self.db, f"get_{class_name}_cursor")() as cursor:
+                    for _obj, obj_dict in GQLQuery._raw_candidates(cursor, class_name):
+                        key = (class_name, obj_dict["handle"])
+                        if self._evaluate(key, obj_dict):
+                            matches.add(key)
+        else:
+            matches = {
+                (class_name, handle)
+                for class_name, handle in self.gq.iter_values(["class", "handle"])
+            }
+        return self._update(matches - self.matches, self.matches - matches)
+
+    def changed(self, class_name: str, handles: list[str]) -> Delta:
+        """Re-evaluate the objects affected by changed objects of a class."""
+        self.cache.invalidate(class_name, handles)
+        keys = {(class_name, handle) for handle in handles}
+        affected = {key for key in keys if class_name in self.gq.target_classes}
+        for key in keys:
+            affected.update(self._dependents.get(key, ()))
+        if self._backlinks:
+            # the objects referred to by the changed objects gained backlinks;
+            # the ones they no longer refer to looked them up
+            for key in keys:
+                for referred in self._referred(key):
+                    if referred[0] in self.gq.target_classes:
+                        affected.add(referred)
+                    affected.update(self._dependents.get(referred, ()))
+        added = set()
+        removed = set()
+        for key in affected:
+            obj_dict = self.gq._load(*key)
+            if obj_dict is not None and self._evaluate(key, obj_dict):
+                if key not in self.matches:
+                    added.add(key)
+            else:
+                if obj_dict is None:
+                    self._forget(key)
+                if key in self.matches:
+                    removed.add(key)
+        return self._update(added, removed)
+
+    def _referred(self, key: Key) -> set[Key]:
+        """Return the objects an object refers to (none if it is missing)."""
+        class_name, handle = key
+        try:
+            obj = getattr(self.db, f"get_{class_name}_from_handle")(handle)
+        except HandleError:
+            return set()
+        if obj is None:
+            return set()
+        return {
+            (referred_class.lower(), referred)
+            for referred_class, referred in obj.get_referenced_handles_recursively()
+        }
+
+    def _evaluate(self, key: Key, obj_dict: Mapping[str, Any]) -> bool:
+        """Match an object, recording the objects it looked up."""
+        if not self._track:
+            return self.gq.match(obj_dict)
+        self.gq.looked_up = set()
+        try:
+            return self.gq.match(obj_dict)
+        finally:
+            self._forget(key)
+            if self.gq.looked_up:
+                self._depends_on[key] = self.gq.looked_up
+                for looked_up in self.gq.looked_up:
+                    self._dependents.setdefault(looked_up, set()).add(key)
+
+    def _forget(self, key: Key) -> None:
+        """Remove the recorded lookups of an object."""
+        for looked_up in self._depends_on.pop(key, ()):
+            dependents = self._dependents[looked_up]
+            dependents.discard(key)
+            if not dependents:
+                del self._dependents[looked_up]
+
+    def _update(self, added: set[Key], removed: set[Key]) -> Delta:
+        """Apply changes to the matches and pass them to the callbacks."""
+        self.matches |= added
+        self.matches -= removed
+        delta = Delta(frozenset(added), frozenset(removed))
+        if added or removed:
+            for callback in self.callbacks:
+                callback(delta)
+        return delta
+
+    def _handles_changed(self, class_name: str) -> Callable[[list[str]], None]:
+        """Return a signal callback re-evaluating changed handles."""
+
+        def callback(handles: list[str]) -> None:
+            self.changed(class_name, handles)
+
+        return callback
+
+    def _rebuilt(self) -> None:
+        """Match all objects again after a table was rebuilt."""
+        self.refresh()
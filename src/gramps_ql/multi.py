@@ -0,0 +1,230 @@
+"""Match several queries in one pass over the database."""
+
+import sqlite3
+from collections import Counter
+from collections.abc import Generator, Hashable, Mapping, Sequence
+from contextlib import closing
+from typing import Any, Generic, TypeVar
+
+from gramps.gen.db import DbReadBase
+from gramps.gen.lib.json_utils import string_to_dict
+
+from . import sql
+from .cache import HandleCache
+from .compiler import (
+    And,
+    Backlinks,
+    Comparison,
+    Lookup,
+    Node,
+    Or,
+    Path,
+    Quantifier,
+    Truthiness,
+)
+from .gql import GRAMPS_OBJECT_NAMES, Evaluator, GQLQuery, GrampsObject, from_dict
+from .views import materialize
+
+K = TypeVar("K", bound=Hashable)
+
+
+class _SharedEvaluator(Evaluator):
+    """Evaluate the nodes of several queries, sharing common parts.
+
+    Nodes and property paths that occur more than once among the queries
+    are only evaluated (resolved) once per object; ``memo`` must be
+    cleared before moving on to the next object.
+    """
+
+    def __init__(
+        self,
+        db: DbReadBase | None,
+        shared_nodes: set[int],
+        shared_paths: set[Path],
+    ) -> None:
+        """Initialize self."""
+        super().__init__(db, HandleCache())
+        self.shared_nodes = shared_nodes
+        self.shared_paths = shared_paths
+        # the object is part of the value to keep its id from being reused
+        self.memo: dict[tuple[int, int], tuple[Any, bool]] = {}
+        self.resolved: dict[tuple[Path, int], tuple[Any, Any]] = {}
+
+    def clear(self) -> None:
+        """Forget the results for the current object."""
+        self.memo.clear()
+        self.resolved.clear()
+
+    def _evaluate(self, node: Node, obj: Any) -> bool:
+        """Evaluate a node, reusing the result for shared nodes."""
+        if id(node) not in self.shared_nodes:
+            return super()._evaluate(node, obj)
+        key = (id(node), id(obj))
+        try:
+            return self.memo[key][1]
+        except KeyError:
+            pass
+        result = super()._evaluate(node, obj)
+        self.memo[key] = (obj, result)
+        return result
+
+    def _resolve(self, obj: Any, path: Path) -> Any:
+        """Resolve a property path, reusing the value for shared paths."""
+        if path not in self.shared_paths:
+            return super()._resolve(obj, path)
+        key = (path, id(obj))
+        try:
+            return self.resolved[key][1]
+        except KeyError:
+            pass
+        value = super()._resolve(obj, path)
+        self.resolved[key] = (obj, value)
+        return value
+
+
+def _intern(node: Node, nodes: dict[Node, Node], uses: Counter[int]) -> Node:
+    """Return a node whose equal subtrees are the same objects."""
+    if isinstance(node, (And, Or)):
+        node = type(node)(
+            tuple(_intern(operand, nodes, uses) for operand in node.operands)
+        )
+    elif isinstance(node, Quantifier):
+        node = Quantifier(
+            node.path, node.quantifier, _intern(node.predicate, nodes, uses)
+        )
+    elif isinstance(node, Lookup):
+        node = Lookup(node.path, node.name, _intern(node.predicate, nodes, uses))
+    elif isinstance(node, Backlinks):
+        node = Backlinks(_intern(node.predicate, nodes, uses))
+    node = nodes.setdefault(node, node)
+    uses[id(node)] += 1
+    return node
+
+
+class MultiQuery(Generic[K]):
+    """Several queries matched in a single pass over the database.
+
+    Every object is read and converted once, and every table is skipped
+    if none of the queries can match its objects.
+    """
+
+    def __init__(
+        self, queries: Mapping[K, str] | Sequence[str], db: DbReadBase
+    ) -> None:
+        """Initialize self.
+
+        ``queries`` maps query IDs to queries; for a sequence, the IDs are
+        the indices.
+        """
+        items: list[tuple[Any, str]] = (
+            list(queries.items())
+            if isinstance(queries, Mapping)
+            else list(enumerate(queries))
+        )
+        self.ids: list[K] = [query_id for query_id, _query in items]
+        self.queries = [GQLQuery(query, db=db) for _query_id, query in items]
+        if any(query.order for query in self.queries):
+            raise ValueError("Queries with 'order by' cannot be matched together")
+        self.db = db
+        nodes: dict[Node, Node] = {}
+        uses: Counter[int] = Counter()
+        self.roots = [_intern(query.root, nodes, uses) for query in self.queries]
+        self.shared_nodes = {id(node) for node in nodes.values() if uses[id(node)] > 1}
+        paths = Counter(
+            node.path
+            for node in nodes.values()
+            if isinstance(node, (Comparison, Truthiness, Quantifier, Lookup))
+        )
+        self.shared_paths = {path for path, count in paths.items() if count > 1}
+
+    def _applicable(self, class_name: str) -> list[int]:
+        """Return the indices of the queries that can match a class."""
+        return [
+            i
+            for i, query in enumerate(self.queries)
+            if class_name in query.target_classes
+        ]
+
+    def iter_matches(
+        self, as_dict: bool = False
+    ) -> Generator[tuple[GrampsObject | dict[str, Any], tuple[K, ...]], None, None]:
+        """Iterate over objects matching any query, with the matching IDs."""
+        if not self.db:
+            raise ValueError("Database is needed for iterating objects!")
+        evaluator = _SharedEvaluator(self.db, self.shared_nodes, self.shared_paths)
+        connection = sql.connect(self.db)
+        if connection is None:
+            yield from self._iter_matches_python(evaluator, as_dict)
+            return
+        with closing(connection):
+            yield from self._iter_matches_sql(evaluator, connection, as_dict)
+
+    def _iter_matches_python(
+        self, evaluator: _SharedEvaluator, as_dict: bool
+    ) -> Generator[tuple[GrampsObject | dict[str, Any], tuple[K, ...]], None, None]:
+        """Iterate over matches, evaluating all queries in Python."""
+        for class_name in GRAMPS_OBJECT_NAMES:
+            applicable = self._applicable(class_name)
+            if not applicable:
+                continue
+            with getattr(self.db, f"get_{class_name}_cursor")() as cursor:
+                for obj, obj_dict in GQLQuery._raw_candidates(cursor, class_name):
+                    matched = tuple(
+                        self.ids[i]
+                        for i in applicable
+                        if evaluator._evaluate(self.roots[i], obj_dict)
+                    )
+                    evaluator.clear()
+                    if not matched:
+                        continue
+                    if as_dict:
+                        yield materialize(obj_dict), matched
+                    else:
+                        yield (obj if obj is not None else from_dict(obj_dict)), matched
+
+    def _iter_matches_sql(
+        self,
+        evaluator: _SharedEvaluator,
+        connection: sqlite3.Connection,
+        as_dict: bool,
+    ) -> Generator[tuple[GrampsObject | dict[str, Any], tuple[K, ...]], None, None]:
+        """Iterate over matches, filtering rows in SQLite where possible."""
+        indexes = sql.indexes(connection)
+        for class_name in GRAMPS_OBJECT_NAMES:
+            applicable = self._applicable(class_name)
+            if not applicable:
+                continue
+            plans = [
+                sql.plan(self.roots[i], class_name, evaluator._evaluate, indexes)
+                for i in applicable
+            ]
+            rows = sql.iter_rows_many(connection, plans)
+            with closing(rows):
+                for _handle, json_data, *flags in rows:
+                    obj_dict = string_to_dict(json_data)
+                    obj_dict["class"] = class_name
+                    matched = tuple(
+                        self.ids[i]
+                        for i, table_plan, flag in zip(
+                            applicable, plans, flags, strict=True
+                        )
+                        if flag
+                        and (
+                            table_plan.residual is None
+                            or evaluator._evaluate(table_plan.residual, obj_dict)
+                        )
+                    )
+                    evaluator.clear()
+                    if matched:
+                        yield (obj_dict if as_dict else from_dict(obj_dict)), matched
+
+
+def iter_matches(
+    queries: Mapping[K, str] | Sequence[str], db: DbReadBase, as_dict: bool = False
+) -> Generator[tuple[GrampsObject | dict[str, Any], tuple[K, ...]], None, None]:
+    """Iterate over objects matching any of several queries.
+
+    Yields the objects with the IDs (the keys of a mapping, the indices of
+    a sequence) of the queries they match.
+    """
+    return MultiQuery(queries, db).iter_matches(as_dict=as_dict)
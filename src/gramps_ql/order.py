@@ -0,0 +1,45 @@
+"""Sort keys for the ``order by`` clause of GQL queries."""
+
+import json
+from typing import Any
+
+
+class Descending:
+    """A sort key in reverse order."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any) -> None:
+        """Initialize self."""
+        self.value = value
+
+    def __lt__(self, other: "Descending") -> bool:
+        """Return whether self sorts before other."""
+        return bool(other.value < self.value)
+
+    def __eq__(self, other: object) -> bool:
+        """Return whether self and other sort the same."""
+        return isinstance(other, Descending) and bool(self.value == other.value)
+
+    __hash__ = None  # type: ignore[assignment]
+
+
+def sort_value(value: Any) -> tuple[int, Any]:
+    """Return the sort key of a property value.
+
+    Missing values come first, followed by numbers (including booleans),
+    strings (by code point) and lists and dictionaries (by their JSON
+    text). This is the order of ``sql.order_terms`` in SQLite.
+    """
+    if value is None:
+        return 0, 0
+    if isinstance(value, (bool, int, float)):
+        return 1, value
+    if isinstance(value, str):
+        return 2, value
+    return 3, json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def directed(key: tuple[int, Any], descending: bool) -> Any:
+    """Return a sort key, reversed if descending."""
+    return Descending(key) if descending else key
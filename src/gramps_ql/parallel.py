@@ -0,0 +1,192 @@
+"""Match queries in worker processes.
+
+The objects of every table the query can match are split into ranges
+of handles. Worker processes, each with its own read-only connection to
+the SQLite file, evaluate the query for one range at a time and send
+back the handles of the matching objects. The main process then builds
+the objects (or dictionaries) for those handles only.
+
+The query's ``columnar`` setting is used by the workers. Its lookup
+cache cannot be shared between processes, so every worker caches
+lookups in a ``HandleCache`` of the same size. The result cache is read
+and written by the main process.
+"""
+
+import os
+from collections.abc import Generator, Mapping
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from contextlib import closing
+from typing import Any
+
+from . import sql
+from .cache import HandleCache
+from .gql import GRAMPS_OBJECT_NAMES, GQLQuery, GrampsObject, from_dict
+
+# rows per range of handles evaluated by a worker
+CHUNK_SIZE = 5000
+
+# the worker state, set up by the pool's initializer
+_worker: "_Worker | None" = None
+
+
+class _WorkerQuery(GQLQuery):
+    """A query looking up objects with a worker's connection."""
+
+    def __init__(
+        self, query: str, worker: "_Worker", cache_size: int, columnar: bool
+    ) -> None:
+        """Initialize self."""
+        super().__init__(query, cache=HandleCache(cache_size), columnar=columnar)
+        self.worker = worker
+
+    def _load(self, class_name: str, handle: str) -> Mapping[str, Any] | None:
+        """Look up an object in the worker's database."""
+        return sql.load(self.worker.connection, class_name, handle)
+
+    def _backlink_handles(self, handle: str) -> list[tuple[str, str]]:
+        """Look up the objects referring to an object in the worker's database."""
+        return sql.backlinks(self.worker.connection, handle)
+
+
+class _Worker:
+    """A read-only connection and the compiled query of a worker process."""
+
+    def __init__(self, path: str, query: str, cache_size: int, columnar: bool) -> None:
+        """Initialize self."""
+        connection = sql.open_database(path)
+        if connection is None:
+            raise ValueError("SQLite does not support JSON")
+        self.connection = connection
+        self.query = _WorkerQuery(query, self, cache_size, columnar)
+        self.indexes = sql.indexes(connection)
+        self.plans: dict[str, sql.TablePlan] = {}
+
+    def match(self, class_name: str, low: str | None, high: str | None) -> list[str]:
+        """Return the handles of the matching objects in a range."""
+        if class_name not in self.plans:
+            self.plans[class_name] = sql.plan(
+                self.query.root, class_name, self.query._evaluate, self.indexes
+            )
+        table_plan = self.plans[class_name]
+        rows = sql.iter_rows(self.connection, table_plan.between(low, high))
+        with closing(rows):
+            candidates = self.query._row_candidates(rows, class_name)
+            handles = [
+                obj_dict["handle"]
+                for _obj, obj_dict in self.query._filter(
+                    candidates, table_plan.residual
+                )
+            ]
+        # a range without bounds is scanned in the order of the rows
+        handles.sort()
+        return handles
+
+
+def _init_worker(path: str, query: str, cache_size: int, columnar: bool) -> None:
+    """Set up the state of a worker process."""
+    global _worker
+    _worker = _Worker(path, query, cache_size, columnar)
+
+
+def _match_range(class_name: str, low: str | None, high: str | None) -> list[str]:
+    """Return the handles of the matching objects in a range of a table."""
+    assert _worker is not None
+    return _worker.match(class_name, low, high)
+
+
+def iter_objects_parallel(
+    gq: GQLQuery,
+    workers: int | None = None,
+    ordered: bool = True,
+    as_dict: bool = False,
+    chunk_size: int = CHUNK_SIZE,
+) -> Generator[GrampsObject | dict[str, Any], None, None]:
+    """Iterate over the objects matching a query using worker processes.
+
+    ``workers`` defaults to the number of CPUs. If ``ordered`` is True,
+    objects are yielded by table and in the order of their handles,
+    otherwise as soon as their range is done. When iteration stops early,
+    pending ranges are cancelled. Databases that cannot be read with
+    separate connections (see ``sql.connect``) and queries with an
+    ``order by`` clause are iterated serially.
+
+    Cached results are served without starting workers, and the handles
+    of a complete run are stored in the query's result cache.
+    """
+    if not gq.db:
+        raise ValueError("Database is needed for iterating objects!")
+    path = None if gq.order else sql.database_file(gq.db)
+    connection = None if path is None else sql.open_database(path)
+    if path is None or connection is None:
+        yield from gq.iter_objects(as_dict=as_dict)
+        return
+    key = gq._result_key()
+    handles = gq._cached_handles(key)
+    if handles is not None:
+        connection.close()
+        matches = gq._load_results(handles)
+    else:
+        with closing(connection):
+            tasks = [
+                (class_name, low, high)
+                for class_name in GRAMPS_OBJECT_NAMES
+                if class_name in gq.target_classes
+                for low, high in sql.handle_ranges(connection, class_name, chunk_size)
+            ]
+        matches = _iter_matches(gq, path, tasks, workers, ordered)
+        if key is not None:
+            matches = gq._store_results(matches, key)
+    with closing(matches):
+        for _obj, obj_dict in matches:
+            yield obj_dict if as_dict else from_dict(obj_dict)
+
+
+def _iter_matches(
+    gq: GQLQuery,
+    path: str,
+    tasks: list[tuple[str, str | None, str | None]],
+    workers: int | None,
+    ordered: bool,
+) -> Generator[tuple[None, Mapping[str, Any]], None, None]:
+    """Match ranges of handles in worker processes and load the matches."""
+    cache_size = HandleCache().maxsize if gq.cache is None else gq.cache.maxsize
+    executor = ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(),
+        initializer=_init_worker,
+        initargs=(path, gq.query, cache_size, gq.columnar),
+    )
+    try:
+        futures = {executor.submit(_match_range, *task): task[0] for task in tasks}
+        for future in _completed(list(futures), ordered):
+            handles = future.result()
+            if handles:
+                yield from _load(gq, futures[future], handles)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _completed(
+    futures: list["Future[list[str]]"], ordered: bool
+) -> Generator["Future[list[str]]", None, None]:
+    """Yield futures in order or as they complete."""
+    if ordered:
+        yield from futures
+        return
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        yield from done
+
+
+def _load(
+    gq: GQLQuery, class_name: str, handles: list[str]
+) -> Generator[tuple[None, Mapping[str, Any]], None, None]:
+    """Fetch the dictionaries of matching handles."""
+    objects = sql.fetch(gq.db, class_name, handles)
+    assert objects is not None
+    for handle in handles:
+        obj_dict = objects.get(handle)
+        if obj_dict is None:
+            # deleted in the meantime
+            continue
+        yield None, obj_dict
@@ -0,0 +1,247 @@
+"""Recursive-descent parser for GQL queries.
+
+Produces the same nested lists as ``parse(query).as_list()`` with the
+pyparsing grammar and fails at the same positions, but parses every
+token once: no backtracking into operands, no packrat cache and no
+pyparsing import unless there is an error to report.
+"""
+
+import re
+from collections.abc import Callable
+from typing import Any
+
+# pyparsing's default whitespace
+_WHITESPACE = re.compile(r"[ \n\t\r]*")
+
+# pyparsing's identchars and identbodychars (Latin-1 letters)
+_IDENT_START = "A-Z_a-zªµºÀ-ÖØ-öø-ÿ"
+_PROPERTY = f"[{_IDENT_START}][0-9{_IDENT_START}·]*"
+_LHS = re.compile(rf"{_PROPERTY}(?:\.{_PROPERTY}|\[[0-9]+\])*")
+_LEADING_ZEROS = re.compile(r"\[0+(?=[0-9])")
+
+_OPERATOR = re.compile(r"<=|>=|!=|!~|=~|=|<|>|~")
+_WORD = re.compile(r"[A-Za-z0-9._]+")
+# the body of quoted strings, which must be followed by the closing quote
+_QUOTED = {
+    quote: re.compile(
+        rf"{quote}(?:[^{quote}\n\r\\]|(?:{quote}{quote})|(?:\\(?:[^x]|x[0-9a-fA-F]+)))*"
+    )
+    for quote in "\"'"
+}
+
+# characters that must not surround a keyword
+_KEYWORD_CHARS = frozenset(
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_$"
+)
+
+
+class _Failure(Exception):
+    """A part of the query could not be parsed at a position."""
+
+    def __init__(self, loc: int) -> None:
+        """Initialize self."""
+        super().__init__(loc)
+        self.loc = loc
+
+
+def parse_error(query: str, loc: int, msg: str) -> Exception:
+    """Return the pyparsing exception for an error at a position."""
+    import pyparsing as pp  # only needed to report errors
+
+    return pp.ParseException(query, loc, msg)
+
+
+def parse_query(query: str) -> list[Any]:
+    """Parse a query into nested lists of tokens.
+
+    Raises the same ``pyparsing.ParseException`` as ``parse`` for invalid
+    queries.
+    """
+    parser = _Parser(query)
+    try:
+        tokens, end = parser.or_term(0)
+    except _Failure as failure:
+        raise parse_error(query, failure.loc, "Expected 'or' term") from None
+    order = parser.order_clause(end)
+    if order is not None:
+        clause, end = order
+        tokens.append(clause)
+    end = parser.skip(end)
+    if end != len(query):
+        raise parse_error(query, end, "Expected end of text")
+    return tokens
+
+
+class _Parser:
+    """Parser state for a single query.
+
+    Every method takes the position to start at and returns the tokens
+    and the position after them, or raises ``_Failure`` with the position
+    pyparsing would report.
+    """
+
+    def __init__(self, query: str) -> None:
+        """Initialize self."""
+        self.query = query
+
+    def skip(self, pos: int) -> int:
+        """Skip whitespace."""
+        return _WHITESPACE.match(self.query, pos).end()  # type: ignore[union-attr]
+
+    def keyword(self, pos: int, keyword: str) -> bool:
+        """Return whether a case-insensitive keyword starts at a position."""
+        query = self.query
+        end = pos + len(keyword)
+        if query[pos:end].upper() != keyword.upper():
+            return False
+        if pos > 0 and query[pos - 1].upper() in _KEYWORD_CHARS:
+            return False
+        return end >= len(query) or query[end].upper() not in _KEYWORD_CHARS
+
+    def or_term(self, pos: int) -> tuple[list[Any], int]:
+        """Parse operands separated by ``or``."""
+        return self.binary(pos, "or", self.and_term)
+
+    def and_term(self, pos: int) -> tuple[list[Any], int]:
+        """Parse operands separated by ``and``."""
+        return self.binary(pos, "and", self.atom)
+
+    def binary(
+        self, pos: int, keyword: str, operand: Callable[[int], tuple[list[Any], int]]
+    ) -> tuple[list[Any], int]:
+        """Parse operands separated by a keyword, grouping two or more."""
+        tokens, end = operand(pos)
+        group: list[Any] | None = None
+        while True:
+            start = self.skip(end)
+            if not self.keyword(start, keyword):
+                break
+            try:
+                right, right_end = operand(start + len(keyword))
+            except _Failure:
+                break
+            if group is None:
+                group = tokens
+            group.append(keyword)
+            group.extend(right)
+            end = right_end
+        if group is None:
+            return tokens, end
+        return [group], end
+
+    def atom(self, pos: int) -> tuple[list[Any], int]:
+        """Parse an expression or a parenthesized query."""
+        pos = self.skip(pos)
+        if self.query.startswith("(", pos):
+            tokens, end = self.or_term(pos + 1)
+            end = self.skip(end)
+            if not self.query.startswith(")", end):
+                raise _Failure(end)
+            return tokens, end + 1
+        return self.expression(pos)
+
+    def expression(self, pos: int) -> tuple[list[Any], int]:
+        """Parse a left-hand side and any operator/right-hand side pairs."""
+        query = self.query
+        match = _LHS.match(query, pos)
+        if match is None:
+            raise _Failure(pos)
+        lhs = match.group()
+        if "[0" in lhs:
+            # indices are parsed as integers
+            lhs = _LEADING_ZEROS.sub("[", lhs)
+        tokens: list[Any] = [lhs]
+        end = match.end()
+        while True:
+            start = self.skip(end)
+            match = _OPERATOR.match(query, start)
+            if match is None:
+                if not self.keyword(start, "in"):
+                    break
+                rhs_set = self.rhs_set(start + len("in"))
+                if rhs_set is None:
+                    break
+                tokens.append("in")
+                tokens.append(rhs_set[0])
+                end = rhs_set[1]
+                continue
+            rhs_start = self.skip(match.end())
+            rhs_end = self.rhs(rhs_start)
+            if rhs_end is None:
+                break
+            tokens.append(match.group())
+            tokens.append(query[rhs_start:rhs_end])
+            end = rhs_end
+        return tokens, end
+
+    def order_clause(self, pos: int) -> tuple[list[Any], int] | None:
+        """Parse an optional ``order by`` clause, None if there is none."""
+        start = self.skip(pos)
+        if not self.keyword(start, "order"):
+            return None
+        start = self.skip(start + len("order"))
+        if not self.keyword(start, "by"):
+            return None
+        key = self.order_key(start + len("by"))
+        if key is None:
+            return None
+        clause: list[Any] = ["order", "by", key[0]]
+        end = key[1]
+        while True:
+            start = self.skip(end)
+            if not self.query.startswith(",", start):
+                break
+            key = self.order_key(start + 1)
+            if key is None:
+                break
+            clause.append(key[0])
+            end = key[1]
+        return clause, end
+
+    def order_key(self, pos: int) -> tuple[list[str], int] | None:
+        """Parse a left-hand side and an optional direction, None if invalid."""
+        pos = self.skip(pos)
+        match = _LHS.match(self.query, pos)
+        if match is None:
+            return None
+        lhs = match.group()
+        if "[0" in lhs:
+            lhs = _LEADING_ZEROS.sub("[", lhs)
+        start = self.skip(match.end())
+        for direction in ("asc", "desc"):
+            if self.keyword(start, direction):
+                return [lhs, direction], start + len(direction)
+        # the default direction, which pyparsing adds as well
+        return [lhs, "asc"], match.end()
+
+    def rhs_set(self, pos: int) -> tuple[list[str], int] | None:
+        """Parse a parenthesized list of right-hand sides, None if invalid."""
+        query = self.query
+        pos = self.skip(pos)
+        if not query.startswith("(", pos):
+            return None
+        items = []
+        while True:
+            start = self.skip(pos + 1)
+            end = self.rhs(start)
+            if end is None:
+                return None
+            items.append(query[start:end])
+            pos = self.skip(end)
+            if query.startswith(")", pos):
+                return items, pos + 1
+            if not query.startswith(",", pos):
+                return None
+
+    def rhs(self, pos: int) -> int | None:
+        """Return the end of a word or quoted string, None if there is none."""
+        query = self.query
+        match = _WORD.match(query, pos)
+        if match is not None:
+            return match.end()
+        if pos < len(query) and query[pos] in _QUOTED:
+            quote = query[pos]
+            end = _QUOTED[quote].match(query, pos).end()  # type: ignore[union-attr]
+            if query.startswith(quote, end):
+                return end + 1
+        return None
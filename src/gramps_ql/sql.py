@@ -0,0 +1,1066 @@
+"""Translate compiled GQL queries to SQL for the SQLite backend.
+
+Gramps 6 stores every object as JSON in the ``json_data`` column of its
+table. Conditions of a compiled query are translated to ``json_extract``,
+``json_type`` and ``json_each`` expressions that reproduce the semantics of
+``GQLQuery._evaluate`` exactly. Parts that cannot be translated are kept
+as a residual node that is evaluated in Python for the rows returned by
+SQLite.
+"""
+
+import os
+import re
+import sqlite3
+import sys
+from collections.abc import (
+    Callable,
+    Collection,
+    Generator,
+    Iterator,
+    Mapping,
+    Sequence,
+)
+from dataclasses import dataclass, replace
+from functools import cache
+from typing import Any
+
+from gramps.gen import lib
+from gramps.gen.db import DbReadBase
+from gramps.gen.lib.json_utils import string_to_dict
+from gramps.plugins.db.dbapi.dbapi import DBAPI
+
+from .compiler import (
+    BACKLINKS,
+    And,
+    Backlinks,
+    Comparison,
+    Lookup,
+    Node,
+    Or,
+    Path,
+    Quantifier,
+    Step,
+    Truthiness,
+)
+
+# names of the object tables, which are the same as the GQL class names
+TABLES = (
+    "person",
+    "family",
+    "event",
+    "place",
+    "citation",
+    "source",
+    "repository",
+    "media",
+    "note",
+    "tag",
+)
+
+Evaluate = Callable[[Node, Any], bool]
+
+# the indexed JSON paths (like ``$.gramps_id``) of each table, mapped to the
+# names of their indexes: the ones created by ``index.create_index`` start
+# with ``gql_`` and are on ``json_extract``, the others are on the column
+# named like the property
+Indexes = Mapping[str, Mapping[str, str]]
+
+# columns Gramps keeps equal to the top-level JSON property of the same name
+JSON_COLUMNS = ("handle", "gramps_id")
+
+# top-level lists of handles, which Gramps also stores in the reference table
+HANDLE_LISTS = frozenset(
+    {"family_list", "parent_family_list", "tag_list", "note_list", "citation_list"}
+)
+
+# the most strings to look up in an index for a case-insensitive comparison
+MAX_VARIANTS = 1024
+
+_COLUMN_INDEX = re.compile(r"CREATE INDEX \S+ ON \w+ ?\((\w+)\)", re.IGNORECASE)
+_JSON_INDEX = re.compile(
+    r"CREATE INDEX \S+ ON \w+ ?\(json_extract\(json_data, '(\$[^']*)'\)\)",
+    re.IGNORECASE,
+)
+
+
+def _casefold(value: Any) -> Any:
+    """Casefold a string (SQLite's lower() only handles ASCII)."""
+    if isinstance(value, str):
+        return value.casefold()
+    return value
+
+
+def _regexp(pattern: str, value: str) -> bool:
+    """Search a string for a regular expression, ignoring case."""
+    # re caches the compiled patterns
+    return re.search(pattern, value, re.IGNORECASE) is not None
+
+
+def connect(db: DbReadBase) -> sqlite3.Connection | None:
+    """Open a read-only connection to the SQLite file of a Gramps database.
+
+    Returns None if the database is not a Gramps SQLite database storing
+    JSON data, or if it has uncommitted changes that another connection
+    would not see.
+    """
+    path = database_file(db)
+    if path is None:
+        return None
+    return open_database(path)
+
+
+def database_file(db: DbReadBase) -> str | None:
+    """Return the SQLite file of a Gramps database if it can be queried.
+
+    Returns None under the same conditions as ``connect``.
+    """
+    if not isinstance(db, DBAPI) or db.transaction is not None:
+        return None
+    if db.serializer.data_field != "json_data":
+        return None
+    directory = db.get_save_path()
+    if not directory or directory == ":memory:":
+        return None
+    path = os.path.join(directory, "sqlite.db")
+    if not os.path.isfile(path):
+        return None
+    return path
+
+
+def revision(path: str) -> str:
+    """Return a string that changes whenever a Gramps SQLite file is written.
+
+    Combines SQLite's file change counter, which every write transaction
+    increments (except in WAL mode), with the size and modification time of
+    the file and of its write-ahead log, if any.
+    """
+    with open(path, "rb") as file:
+        # the counter is at offset 24 of the database header
+        header = file.read(28)
+    parts = [str(int.from_bytes(header[24:28], "big"))]
+    for name in (path, f"{path}-wal"):
+        try:
+            stat = os.stat(name)
+        except FileNotFoundError:
+            continue
+        parts.append(f"{stat.st_size}:{stat.st_mtime_ns}")
+    return " ".join(parts)
+
+
+def open_database(
+    path: str, check_same_thread: bool = True
+) -> sqlite3.Connection | None:
+    """Open a read-only connection to a Gramps SQLite file.
+
+    Returns None if SQLite lacks JSON support.
+    """
+    connection = sqlite3.connect(
+        f"file:{path}?mode=ro", uri=True, check_same_thread=check_same_thread
+    )
+    try:
+        connection.execute("SELECT json_type('{}')")
+    except sqlite3.OperationalError:
+        # SQLite compiled without JSON support
+        connection.close()
+        return None
+    connection.create_function("gql_casefold", 1, _casefold, deterministic=True)
+    connection.create_function("gql_regexp", 2, _regexp, deterministic=True)
+    return connection
+
+
+def indexes(connection: sqlite3.Connection) -> dict[str, dict[str, str]]:
+    """Return the indexed JSON paths of the tables of a Gramps database.
+
+    These are the columns Gramps keeps equal to JSON properties (if they
+    are indexed) and the indexes on ``json_extract`` created by
+    ``index.create_index``.
+    """
+    result: dict[str, dict[str, str]] = {table: {} for table in TABLES}
+    rows = connection.execute(
+        "SELECT name, tbl_name, sql FROM sqlite_master WHERE type = 'index'"
+    )
+    for name, table, statement in rows:
+        if table not in result:
+            continue
+        if statement is None:
+            # the index of the primary key
+            result[table]["$.handle"] = name
+            continue
+        match = _JSON_INDEX.fullmatch(statement)
+        if match is not None and name.startswith("gql_"):
+            result[table][match.group(1)] = name
+            continue
+        match = _COLUMN_INDEX.fullmatch(statement)
+        if match is not None and match.group(1) in JSON_COLUMNS:
+            result[table]["$." + match.group(1)] = name
+    return result
+
+
+@cache
+def _unfolded() -> dict[str, tuple[str, ...]]:
+    """Return the characters casefolding to each string, except itself."""
+    unfolded: dict[str, list[str]] = {}
+    for code_point in range(sys.maxunicode + 1):
+        char = chr(code_point)
+        folded = char.casefold()
+        if folded != char:
+            unfolded.setdefault(folded, []).append(char)
+    return {folded: tuple(chars) for folded, chars in unfolded.items()}
+
+
+def case_variants(folded: str, limit: int = MAX_VARIANTS) -> list[str] | None:
+    """Return all strings that casefold to a casefolded string.
+
+    Returns None if there are more than ``limit`` of them.
+    """
+    unfolded = _unfolded()
+    longest = max(len(piece) for piece in unfolded)
+    # variants[i] are the variants of folded[i:]
+    variants: list[list[str]] = [[] for _ in folded] + [[""]]
+    for i in reversed(range(len(folded))):
+        for j in range(i + 1, min(i + longest, len(folded)) + 1):
+            piece = folded[i:j]
+            chars = list(unfolded.get(piece, ()))
+            if j == i + 1 and piece.casefold() == piece:
+                chars.append(piece)
+            for char in chars:
+                variants[i].extend(char + rest for rest in variants[j])
+        if len(variants[i]) > limit:
+            return None
+    return variants[0]
+
+
+def quote(value: str) -> str:
+    """Quote a string as an SQL literal."""
+    return "'" + value.replace("'", "''") + "'"
+
+
+def json_path(path: Path) -> str:
+    """Return the SQLite JSON path suffix of a property path (without ``$``)."""
+    parts = []
+    for step in path:
+        if isinstance(step, int):
+            parts.append(f"[{step}]")
+        elif isinstance(step, str) and step.isidentifier() and step.isascii():
+            parts.append(f".{step}")
+        else:
+            parts.append(f'."{step}"')
+    return "".join(parts)
+
+
+@cache
+def array_properties() -> frozenset[str]:
+    """Return the names of the properties that are arrays in all Gramps schemas."""
+    arrays: set[str] = set()
+    others: set[str] = set()
+
+    def visit(schema: Mapping[str, Any]) -> None:
+        for name, prop in schema.get("properties", {}).items():
+            (arrays if prop.get("type") == "array" else others).add(name)
+            visit(prop)
+        if isinstance(schema.get("items"), Mapping):
+            visit(schema["items"])
+
+    for table in TABLES:
+        visit(getattr(lib, table.capitalize()).get_schema())
+    return frozenset(arrays - others)
+
+
+def indexes_arrays(path: Path) -> bool:
+    """Return whether the integer steps of a path only index arrays.
+
+    Python also indexes the characters of strings, which JSON paths cannot.
+    """
+    previous: Any = None
+    for step in path:
+        if isinstance(step, int) and previous not in array_properties():
+            return False
+        previous = step
+    return True
+
+
+@dataclass(frozen=True)
+class Fragment:
+    """A translated condition.
+
+    ``sql`` always evaluates to 0 or 1 (never NULL), so fragments can be
+    negated safely. If ``exact`` is False, the fragment matches a superset
+    of the rows the condition matches.
+    """
+
+    sql: str
+    params: tuple[Any, ...]
+    exact: bool = True
+
+
+TRUE = Fragment("1", ())
+FALSE = Fragment("0", ())
+
+
+@dataclass(frozen=True)
+class Scope:
+    """The JSON value conditions are evaluated against.
+
+    ``doc`` is the SQL expression of the JSON document, ``base`` the SQL
+    expression of the JSON path of the value within the document. For
+    objects stored in a table (the object itself or one fetched by a
+    lookup), ``class_name`` is their class.
+    """
+
+    doc: str
+    base: str
+    class_name: str | None = None
+
+    def path(self, path: Path) -> str:
+        """Return the SQL expression of the JSON path of a property path."""
+        suffix = json_path(path)
+        if self.base == "'$'":
+            return quote("$" + suffix)
+        if not suffix:
+            return self.base
+        return f"{self.base} || {quote(suffix)}"
+
+
+class Translator:
+    """Translate compiled nodes for the objects of one table."""
+
+    def __init__(self, evaluate: Evaluate, indexes: Indexes | None = None) -> None:
+        """Initialize self.
+
+        ``evaluate`` is used to decide conditions on ``class``, which is
+        not part of the stored JSON, in Python. Comparisons on paths in
+        ``indexes`` are prefixed with conditions SQLite can use them for.
+        """
+        self.evaluate = evaluate
+        self.indexes = indexes or {}
+        self.aliases = 0
+        # the index conditions translated so far
+        self.indexed = 0
+
+    def alias(self, prefix: str) -> str:
+        """Return a new unique table alias."""
+        self.aliases += 1
+        return f"{prefix}{self.aliases}"
+
+    def translate(self, node: Node, scope: Scope) -> Fragment | None:
+        """Translate a node, or return None if it cannot be translated."""
+        if isinstance(node, (And, Or)):
+            return self.translate_logical(node, scope)
+        if scope.class_name and node_uses_class(node):
+            # class is computed from the table, not stored in the JSON
+            obj = {"class": scope.class_name}
+            return TRUE if self.evaluate(node, obj) else FALSE
+        if isinstance(node, Comparison):
+            return self.translate_comparison(node, scope)
+        if isinstance(node, Truthiness):
+            return self.translate_truthiness(node, scope)
+        if isinstance(node, Quantifier):
+            return self.translate_quantifier(node, scope)
+        if isinstance(node, Lookup):
+            return self.translate_lookup(node, scope)
+        if isinstance(node, Backlinks):
+            return self.translate_backlinks(node, scope)
+        return None
+
+    def translate_logical(self, node: And | Or, scope: Scope) -> Fragment | None:
+        """Translate ``and`` or ``or``."""
+        fragments = []
+        exact = True
+        for operand in node.operands:
+            fragment = self.translate(operand, scope)
+            if fragment is None:
+                if isinstance(node, Or):
+                    return None
+                # leaving out a conjunct yields a superset
+                exact = False
+                continue
+            fragments.append(fragment)
+            exact = exact and fragment.exact
+        if not fragments:
+            return None
+        keyword = " AND " if isinstance(node, And) else " OR "
+        return Fragment(
+            "(" + keyword.join(fragment.sql for fragment in fragments) + ")",
+            tuple(param for fragment in fragments for param in fragment.params),
+            exact,
+        )
+
+    def translate_comparison(self, node: Comparison, scope: Scope) -> Fragment | None:
+        """Translate a comparison to a literal."""
+        path, length = split_length(node.path)
+        if path is None:
+            return FALSE
+        if not indexes_arrays(path):
+            return None
+        doc = scope.doc
+        json_path = scope.path(path)
+        op = node.operator
+        rhs = node.value
+        if length:
+            value = length_sql(doc, json_path)
+            numeric = numeric_comparison(value, op, rhs)
+            return Fragment(
+                f"(CASE WHEN {value} IS NULL THEN 0 ELSE {numeric} END)",
+                numeric_params(op, rhs),
+            )
+        value = f"json_extract({doc}, {json_path})"
+        text, text_params = text_comparison(value, op, rhs, node.folded)
+        array, array_params = array_comparison(doc, json_path, op, rhs)
+        obj, obj_params = object_comparison(doc, json_path, op, rhs)
+        numeric = numeric_comparison(value, op, rhs)
+        sql = (
+            f"(CASE coalesce(json_type({doc}, {json_path}), 'null')"
+            " WHEN 'null' THEN 0"
+            f" WHEN 'text' THEN {text}"
+            f" WHEN 'array' THEN {array}"
+            f" WHEN 'object' THEN {obj}"
+            # integer, real, true or false
+            f" ELSE {numeric} END)"
+        )
+        params = (*text_params, *array_params, *obj_params, *numeric_params(op, rhs))
+        index = self.index_condition(node, path, scope)
+        if index is not None:
+            self.indexed += 1
+            # a superset of the matches that SQLite can find with an index
+            sql = f"({index.sql} AND {sql})"
+            params = (*index.params, *params)
+        return Fragment(sql, params)
+
+    def index_condition(
+        self, node: Comparison, path: Path, scope: Scope
+    ) -> Fragment | None:
+        """Return an indexable condition implied by a comparison, if any."""
+        if scope.class_name is None or scope.base != "'$'":
+            return None
+        alias = scope.doc.partition(".")[0]
+        op = node.operator
+        rhs = node.value
+        if op == "~" and isinstance(rhs, str) and len(path) == 1:
+            if path[0] in HANDLE_LISTS:
+                return Fragment(
+                    f"{alias}.handle IN"
+                    " (SELECT obj_handle FROM reference WHERE ref_handle = ?)",
+                    (rhs,),
+                )
+            return None
+        key = "$" + json_path(path)
+        indexed = self.indexes.get(scope.class_name, {})
+        if key not in indexed:
+            return None
+        if indexed[key].startswith("gql_"):
+            value = f"json_extract({scope.doc}, {quote(key)})"
+        elif isinstance(rhs, (str, frozenset)):
+            # the literals of "in" are looked up as strings
+            value = f"{alias}.{key[2:]}"
+        else:
+            # the column affinity would convert the number to text
+            return None
+        if op in ("<", ">", "<=", ">="):
+            return Fragment(f"{value} {op} ?", (rhs,))
+        candidates: list[Any] = []
+        if op == "=":
+            variants = case_variants(node.folded)
+            if variants is None:
+                return None
+            candidates.extend(variants)
+            # numbers also match the strings of their digits
+            if isinstance(rhs, int):
+                candidates.append(rhs)
+            placeholders = ", ".join("?" * len(candidates))
+            return Fragment(f"{value} IN ({placeholders})", tuple(candidates))
+        if op == "in":
+            for folded in sorted(node.folded):
+                variants = case_variants(folded, MAX_VARIANTS - len(candidates))
+                if variants is None:
+                    return None
+                candidates.extend(variants)
+            if indexed[key].startswith("gql_"):
+                candidates.extend(sorted(v for v in rhs if isinstance(v, int)))
+            placeholders = ", ".join("?" * len(candidates))
+            return Fragment(f"{value} IN ({placeholders})", tuple(candidates))
+        return None
+
+    def translate_truthiness(self, node: Truthiness, scope: Scope) -> Fragment | None:
+        """Translate the boolean interpretation of a value."""
+        path, length = split_length(node.path)
+        if path is None:
+            return FALSE
+        if not indexes_arrays(path):
+            return None
+        doc = scope.doc
+        json_path = scope.path(path)
+        if length:
+            return Fragment(f"(coalesce({length_sql(doc, json_path)}, 0) > 0)", ())
+        value = f"json_extract({doc}, {json_path})"
+        return Fragment(
+            f"(CASE json_type({doc}, {json_path})"
+            f" WHEN 'text' THEN {value} != ''"
+            f" WHEN 'integer' THEN {value} != 0"
+            f" WHEN 'real' THEN {value} != 0"
+            " WHEN 'true' THEN 1"
+            f" WHEN 'array' THEN json_array_length({doc}, {json_path}) > 0"
+            f" WHEN 'object' THEN {value} != '{{}}'"
+            " ELSE 0 END)",
+            (),
+        )
+
+    def translate_quantifier(self, node: Quantifier, scope: Scope) -> Fragment | None:
+        """Translate ``any`` or ``all`` as ``EXISTS`` over ``json_each``.
+
+        Only properties that are arrays are translated; Python also
+        iterates over the characters of strings and the keys of objects.
+        """
+        path, length = split_length(node.path)
+        if path is None or length:
+            # the length is not iterable
+            return FALSE
+        if not path or path[-1] not in array_properties():
+            return None
+        if not indexes_arrays(path):
+            return None
+        alias = self.alias("j")
+        doc = scope.doc
+        json_path = scope.path(path)
+        predicate = self.translate(node.predicate, Scope(doc, f"{alias}.fullkey"))
+        if predicate is None:
+            return None
+        if node.quantifier == "all" and not predicate.exact:
+            # negating a superset would give a subset
+            return None
+        each = f"json_each({doc}, {json_path}) AS {alias}"
+        if node.quantifier == "all":
+            condition = (
+                f"json_array_length({doc}, {json_path}) > 0"
+                f" AND NOT EXISTS (SELECT 1 FROM {each} WHERE NOT {predicate.sql})"
+            )
+        else:
+            condition = f"EXISTS (SELECT 1 FROM {each} WHERE {predicate.sql})"
+        return Fragment(
+            f"(CASE WHEN json_type({doc}, {json_path}) = 'array'"
+            f" THEN {condition} ELSE 0 END)",
+            predicate.params,
+            predicate.exact,
+        )
+
+    def translate_lookup(self, node: Lookup, scope: Scope) -> Fragment | None:
+        """Translate a lookup as ``EXISTS`` over the referenced table."""
+        path, length = split_length(node.path)
+        if path is None or length or node.name not in TABLES:
+            # not a handle or not a table
+            return FALSE
+        if not indexes_arrays(path):
+            return None
+        alias = self.alias("t")
+        doc = scope.doc
+        json_path = scope.path(path)
+        predicate = self.translate(
+            node.predicate, Scope(f"{alias}.json_data", "'$'", node.name)
+        )
+        if predicate is None:
+            return None
+        return Fragment(
+            f"(CASE WHEN json_type({doc}, {json_path}) = 'text'"
+            f" THEN EXISTS (SELECT 1 FROM {node.name} AS {alias}"
+            f" WHERE {alias}.handle = json_extract({doc}, {json_path})"
+            f" AND {predicate.sql}) ELSE 0 END)",
+            predicate.params,
+            predicate.exact,
+        )
+
+    def translate_backlinks(self, node: Backlinks, scope: Scope) -> Fragment | None:
+        """Translate ``backlinks`` using the reference table.
+
+        Its length and ``any`` or ``all`` of the referring objects are
+        translated; the other conditions are left to Python.
+        """
+        if scope.class_name is None or scope.base != "'$'":
+            return None
+        handle = scope.doc.partition(".")[0] + ".handle"
+        predicate = node.predicate
+        if isinstance(predicate, Quantifier) and predicate.path == (BACKLINKS,):
+            return self.translate_referrers(predicate, handle)
+        if isinstance(predicate, Truthiness) and predicate.path in (
+            (BACKLINKS,),
+            (BACKLINKS, Step.LENGTH),
+        ):
+            return Fragment(f"EXISTS (SELECT 1 {self.referrers(handle)})", ())
+        if isinstance(predicate, Comparison) and predicate.path == (
+            BACKLINKS,
+            Step.LENGTH,
+        ):
+            count = f"(SELECT count(*) {self.referrers(handle)})"
+            op = predicate.operator
+            return Fragment(
+                f"({numeric_comparison(count, op, predicate.value)})",
+                numeric_params(op, predicate.value),
+            )
+        return None
+
+    def referrers(self, handle: str) -> str:
+        """Return the FROM and WHERE clauses of the references to a handle.
+
+        Like ``find_backlink_handles``, but without references from missing
+        objects.
+        """
+        alias = self.alias("r")
+        exists = " ".join(
+            f"WHEN {quote(table.capitalize())} THEN EXISTS (SELECT 1 FROM {table}"
+            f" WHERE handle = {alias}.obj_handle)"
+            for table in TABLES
+        )
+        return (
+            f"FROM reference AS {alias} WHERE {alias}.ref_handle = {handle}"
+            f" AND CASE {alias}.obj_class {exists} ELSE 0 END"
+        )
+
+    def translate_referrers(self, node: Quantifier, handle: str) -> Fragment | None:
+        """Translate ``any`` or ``all`` of the objects referring to a handle."""
+        conditions = []
+        for table in TABLES:
+            alias = self.alias("t")
+            predicate = self.translate(
+                node.predicate, Scope(f"{alias}.json_data", "'$'", table)
+            )
+            if predicate is None:
+                return None
+            if node.quantifier == "all" and not predicate.exact:
+                # negating a superset would give a subset
+                return None
+            conditions.append((table, alias, predicate))
+        if node.quantifier == "any":
+            matching = [
+                (self.referrer(handle, table, alias, predicate.sql), predicate)
+                for table, alias, predicate in conditions
+                if predicate.sql != FALSE.sql
+            ]
+            if not matching:
+                return FALSE
+            return Fragment(
+                "(" + " OR ".join(sql for sql, _predicate in matching) + ")",
+                tuple(
+                    param for _sql, predicate in matching for param in predicate.params
+                ),
+                all(predicate.exact for _sql, predicate in matching),
+            )
+        # unlike all(), no referring objects do not match
+        failing = [
+            (self.referrer(handle, table, alias, f"NOT {predicate.sql}"), predicate)
+            for table, alias, predicate in conditions
+            if predicate.sql != TRUE.sql
+        ]
+        sql = f"EXISTS (SELECT 1 {self.referrers(handle)})"
+        if failing:
+            sql += " AND NOT (" + " OR ".join(sql for sql, _predicate in failing) + ")"
+        return Fragment(
+            f"({sql})",
+            tuple(param for _sql, predicate in failing for param in predicate.params),
+        )
+
+    def referrer(self, handle: str, table: str, alias: str, condition: str) -> str:
+        """Return SQL for whether an object of a table refers to a handle."""
+        ref = self.alias("r")
+        return (
+            f"EXISTS (SELECT 1 FROM reference AS {ref}"
+            f" JOIN {table} AS {alias} ON {alias}.handle = {ref}.obj_handle"
+            f" WHERE {ref}.ref_handle = {handle}"
+            f" AND {ref}.obj_class = {quote(table.capitalize())} AND {condition})"
+        )
+
+    def referred(self, node: Node, class_name: str) -> list[Fragment]:
+        """Return conditions on the handles of the objects a node can match.
+
+        A ``get_*`` step that must match for the node to match follows a
+        handle that is in the reference table, so the objects referring to
+        the objects matching its condition are a superset of the matches.
+        If the condition uses an index, SQLite can find them through the
+        index of the reference table, instead of following the handle of
+        every object.
+        """
+        if isinstance(node, And):
+            return [
+                fragment
+                for operand in node.operands
+                for fragment in self.referred(operand, class_name)
+            ]
+        if isinstance(node, Quantifier):
+            return self.referred(node.predicate, class_name)
+        if not isinstance(node, Lookup) or node.name not in TABLES:
+            return []
+        if node.path == ("handle",):
+            # the object itself, which it does not refer to
+            return []
+        alias = self.alias("t")
+        indexed = self.indexed
+        predicate = self.translate(
+            node.predicate, Scope(f"{alias}.json_data", "'$'", node.name)
+        )
+        if predicate is None or self.indexed == indexed:
+            return []
+        ref = self.alias("r")
+        return [
+            Fragment(
+                f"t0.handle IN (SELECT {ref}.obj_handle FROM reference AS {ref}"
+                f" JOIN {node.name} AS {alias} ON {alias}.handle = {ref}.ref_handle"
+                f" WHERE {ref}.obj_class = ? AND {predicate.sql})",
+                (class_name.capitalize(), *predicate.params),
+                exact=False,
+            )
+        ]
+
+
+def node_uses_class(node: Node) -> bool:
+    """Return whether a condition refers to the computed class."""
+    return isinstance(node, (Comparison, Truthiness)) and node.path[:1] == ("class",)
+
+
+def split_length(path: Path) -> tuple[Path | None, bool]:
+    """Split a trailing ``length`` off a path.
+
+    Returns None as path if ``length`` appears before the end, because
+    nothing can be looked up in an integer.
+    """
+    if Step.LENGTH in path[:-1]:
+        return None, False
+    if path and path[-1] is Step.LENGTH:
+        return path[:-1], True
+    return path, False
+
+
+def length_sql(doc: str, json_path: str) -> str:
+    """Return SQL for the length of a JSON array, string or object."""
+    return (
+        f"(CASE json_type({doc}, {json_path})"
+        f" WHEN 'array' THEN json_array_length({doc}, {json_path})"
+        f" WHEN 'text' THEN length(json_extract({doc}, {json_path}))"
+        f" WHEN 'object' THEN (SELECT count(*) FROM json_each({doc}, {json_path}))"
+        " END)"
+    )
+
+
+def numeric_comparison(value: str, op: str, rhs: Any) -> str:
+    """Return SQL comparing a number to the literal."""
+    if op == "in":
+        count = len(integers(rhs))
+        return f"{value} IN ({', '.join('?' * count)})" if count else "0"
+    if isinstance(rhs, int):
+        if op in ("=", "!=", "<", ">", "<=", ">="):
+            return f"{value} {op} ?"
+        # a number does not contain anything
+        return "0"
+    # numbers are never equal to strings, and cannot be ordered with them
+    return "1" if op == "!=" else "0"
+
+
+def numeric_params(op: str, rhs: Any) -> tuple[Any, ...]:
+    """Return the parameters of ``numeric_comparison``."""
+    if op == "in":
+        return integers(rhs)
+    if isinstance(rhs, int) and op in ("=", "!=", "<", ">", "<=", ">="):
+        return (rhs,)
+    return ()
+
+
+def integers(rhs: Collection[Any]) -> tuple[int, ...]:
+    """Return the integers of the literals of ``in``, sorted."""
+    return tuple(sorted(value for value in rhs if isinstance(value, int)))
+
+
+def text_comparison(
+    value: str, op: str, rhs: Any, folded: Any
+) -> tuple[str, tuple[Any, ...]]:
+    """Return SQL comparing a string to the literal."""
+    if op == "in":
+        placeholders = ", ".join("?" * len(folded))
+        return f"gql_casefold({value}) IN ({placeholders})", tuple(sorted(folded))
+    if op == "=~":
+        return f"gql_regexp(?, {value})", (rhs.pattern,)
+    if op == "=":
+        return f"gql_casefold({value}) = ?", (folded,)
+    if op == "!=":
+        return f"gql_casefold({value}) != ?", (folded,)
+    if op == "~":
+        return f"instr(gql_casefold({value}), ?) > 0", (folded,)
+    if op == "!~":
+        return f"instr(gql_casefold({value}), ?) = 0", (folded,)
+    if isinstance(rhs, str):
+        # Python and SQLite (BINARY collation) both order by code point
+        return f"{value} {op} ?", (rhs,)
+    return "0", ()
+
+
+def array_comparison(
+    doc: str, json_path: str, op: str, rhs: Any
+) -> tuple[str, tuple[Any, ...]]:
+    """Return SQL comparing a list to the literal."""
+    if op in ("~", "!~"):
+        exists = (
+            f"EXISTS (SELECT 1 FROM json_each({doc}, {json_path})"
+            " WHERE type NOT IN ('array', 'object') AND value = ?)"
+        )
+        return (exists if op == "~" else f"NOT {exists}"), (rhs,)
+    return ("1" if op == "!=" else "0"), ()
+
+
+def object_comparison(
+    doc: str, json_path: str, op: str, rhs: Any
+) -> tuple[str, tuple[Any, ...]]:
+    """Return SQL comparing a dictionary to the literal."""
+    if op in ("~", "!~") and isinstance(rhs, str):
+        # "in" tests the keys of a dictionary
+        exists = f"EXISTS (SELECT 1 FROM json_each({doc}, {json_path}) WHERE key = ?)"
+        return (exists if op == "~" else f"NOT {exists}"), (rhs,)
+    return ("1" if op in ("!=", "!~") else "0"), ()
+
+
+@dataclass(frozen=True)
+class TablePlan:
+    """How to find the objects of one table matching a query.
+
+    SQLite returns the rows matching ``where``; the ones that also match
+    ``residual`` (if any) in Python are the result.
+    """
+
+    class_name: str
+    where: str
+    params: tuple[Any, ...]
+    residual: Node | None
+
+    def between(self, low: str | None, high: str | None) -> "TablePlan":
+        """Restrict the plan to handles from ``low`` (inclusive) to ``high``.
+
+        None stands for an open end of the range.
+        """
+        where = [self.where]
+        params = list(self.params)
+        if low is not None:
+            where.append("t0.handle >= ?")
+            params.append(low)
+        if high is not None:
+            where.append("t0.handle < ?")
+            params.append(high)
+        return replace(self, where=" AND ".join(where), params=tuple(params))
+
+    def select(
+        self, columns: str = "handle, json_data", offset: int = 0
+    ) -> tuple[str, tuple[Any, ...]]:
+        """Return the SELECT statement and its parameters.
+
+        With ``offset``, the first rows are skipped.
+        """
+        statement = f"SELECT {columns} FROM {self.class_name} AS t0 WHERE {self.where}"
+        if not offset:
+            return statement, self.params
+        return f"{statement} LIMIT -1 OFFSET ?", (*self.params, offset)
+
+
+def plan(
+    root: Node, class_name: str, evaluate: Evaluate, indexes: Indexes | None = None
+) -> TablePlan:
+    """Plan the query for the objects of a table.
+
+    ``indexes`` (see ``indexes``) are used for comparisons on indexed
+    property paths.
+    """
+    translator = Translator(evaluate, indexes)
+    scope = Scope("t0.json_data", "'$'", class_name)
+    conjuncts = root.operands if isinstance(root, And) else (root,)
+    where = []
+    params: list[Any] = []
+    residual = []
+    for conjunct in conjuncts:
+        for referred in translator.referred(conjunct, class_name):
+            where.append(referred.sql)
+            params.extend(referred.params)
+        fragment = translator.translate(conjunct, scope)
+        if fragment is not None:
+            where.append(fragment.sql)
+            params.extend(fragment.params)
+        if fragment is None or not fragment.exact:
+            residual.append(conjunct)
+    return TablePlan(
+        class_name=class_name,
+        where=" AND ".join(where) or "1",
+        params=tuple(params),
+        residual=(
+            None
+            if not residual
+            else residual[0]
+            if len(residual) == 1
+            else And(tuple(residual))
+        ),
+    )
+
+
+def iter_rows(
+    connection: sqlite3.Connection, table_plan: TablePlan, offset: int = 0
+) -> Generator[tuple[str, str], None, None]:
+    """Iterate over the handles and JSON data of the rows matching a plan."""
+    statement, params = table_plan.select(offset=offset)
+    cursor = connection.execute(statement, params)
+    try:
+        yield from cursor
+    finally:
+        cursor.close()
+
+
+def count(connection: sqlite3.Connection, table_plan: TablePlan) -> int:
+    """Return the number of rows matching a plan."""
+    statement, params = table_plan.select("COUNT(*)")
+    (number,) = connection.execute(statement, params).fetchone()
+    return int(number)
+
+
+def order_terms(path: Path) -> tuple[str, str]:
+    """Return SQL for the type rank and value of a property path.
+
+    Sorting by both orders the objects of a table like ``order.sort_value``
+    does in Python.
+    """
+    doc = "t0.json_data"
+    json_path_sql = quote("$" + json_path(path))
+    rank = (
+        f"(CASE json_type({doc}, {json_path_sql})"
+        " WHEN 'integer' THEN 1 WHEN 'real' THEN 1"
+        " WHEN 'true' THEN 1 WHEN 'false' THEN 1"
+        " WHEN 'text' THEN 2 WHEN 'array' THEN 3 WHEN 'object' THEN 3"
+        " ELSE 0 END)"
+    )
+    return rank, f"json_extract({doc}, {json_path_sql})"
+
+
+def iter_sorted_rows(
+    connection: sqlite3.Connection,
+    table_plan: TablePlan,
+    keys: Sequence[tuple[Path, bool]],
+    limit: int | None = None,
+) -> Iterator[tuple[Any, ...]]:
+    """Iterate over the rows matching a plan, sorted by property paths.
+
+    ``keys`` are the paths with whether to sort them in descending order;
+    ties are sorted by handle. Rows consist of the handle, the JSON data and
+    the type rank and value of every key.
+    """
+    columns: list[str] = []
+    order: list[str] = []
+    for i, (path, descending) in enumerate(keys):
+        columns.extend(order_terms(path))
+        direction = " DESC" if descending else ""
+        # the rank and value are the result columns after handle and json_data
+        order.extend([f"{3 + 2 * i}{direction}", f"{4 + 2 * i}{direction}"])
+    statement, params = table_plan.select(", ".join(["handle", "json_data", *columns]))
+    statement = f"{statement} ORDER BY {', '.join(order)}, 1"
+    if limit is not None:
+        statement = f"{statement} LIMIT ?"
+        params = (*params, limit)
+    cursor = connection.execute(statement, params)
+    try:
+        yield from cursor
+    finally:
+        cursor.close()
+
+
+def iter_rows_many(
+    connection: sqlite3.Connection, table_plans: Sequence[TablePlan]
+) -> Generator[tuple[Any, ...], None, None]:
+    """Iterate over the rows matching any of several plans for one table.
+
+    Rows consist of the handle, the JSON data and a 0/1 flag per plan.
+    """
+    table = table_plans[0].class_name
+    flags = [f"f{i}" for i in range(len(table_plans))]
+    columns = ", ".join(
+        f"({table_plan.where}) AS {flag}"
+        for table_plan, flag in zip(table_plans, flags, strict=True)
+    )
+    params = [param for table_plan in table_plans for param in table_plan.params]
+    # every condition is evaluated once, in the subquery; its LIMIT keeps
+    # SQLite from flattening it and evaluating the conditions again
+    statement = (
+        f"SELECT handle, json_data, {', '.join(flags)} FROM"
+        f" (SELECT handle, json_data, {columns} FROM {table} AS t0 LIMIT -1)"
+        f" WHERE {' OR '.join(flags)}"
+    )
+    cursor = connection.execute(statement, params)
+    try:
+        yield from cursor
+    finally:
+        cursor.close()
+
+
+def handle_ranges(
+    connection: sqlite3.Connection, class_name: str, size: int
+) -> list[tuple[str | None, str | None]]:
+    """Split the handles of a table into ranges of (at most) a given size.
+
+    Returns ``(low, high)`` pairs as taken by ``TablePlan.between``.
+    """
+    bounds = [
+        handle
+        for (handle,) in connection.execute(
+            f"SELECT handle FROM (SELECT handle, row_number() OVER "
+            f"(ORDER BY handle) AS n FROM {class_name}) "
+            f"WHERE n > 1 AND (n - 1) % ? = 0",
+            (size,),
+        )
+    ]
+    lows: list[str | None] = [None, *bounds]
+    highs: list[str | None] = [*bounds, None]
+    return list(zip(lows, highs, strict=True))
+
+
+def load(
+    connection: sqlite3.Connection, class_name: str, handle: str
+) -> dict[str, Any] | None:
+    """Return the dictionary representation of an object, None if missing."""
+    if class_name not in TABLES:
+        return None
+    row = connection.execute(
+        f"SELECT json_data FROM {class_name} WHERE handle = ?", (handle,)
+    ).fetchone()
+    if row is None:
+        return None
+    obj_dict: dict[str, Any] = string_to_dict(row[0])
+    obj_dict["class"] = class_name
+    return obj_dict
+
+
+def backlinks(connection: sqlite3.Connection, handle: str) -> list[tuple[str, str]]:
+    """Return the class names and handles of the objects referring to a handle."""
+    rows = connection.execute(
+        "SELECT obj_class, obj_handle FROM reference WHERE ref_handle = ?", (handle,)
+    )
+    return [(class_name.lower(), referrer) for class_name, referrer in rows]
+
+
+# handles per bulk lookup, well below SQLite's limit of bound parameters
+FETCH_SIZE = 500
+
+
+def fetch(
+    db: DbReadBase, class_name: str, handles: Collection[str]
+) -> dict[str, dict[str, Any]] | None:
+    """Fetch the dictionary representations of objects in bulk.
+
+    Uses the database's own connection, so uncommitted changes are seen.
+    Missing handles are left out. Returns None if the database does not
+    store JSON data in SQL tables.
+    """
+    if not isinstance(db, DBAPI) or db.serializer.data_field != "json_data":
+        return None
+    if class_name not in TABLES:
+        return None
+    objects = {}
+    handles = list(handles)
+    for start in range(0, len(handles), FETCH_SIZE):
+        chunk = handles[start : start + FETCH_SIZE]
+        placeholders = ", ".join("?" * len(chunk))
+        db.dbapi.execute(
+            f"SELECT handle, json_data FROM {class_name} "
+            f"WHERE handle IN ({placeholders})",
+            chunk,
+        )
+        for handle, json_data in db.dbapi.fetchall():
+            obj_dict = string_to_dict(json_data)
+            obj_dict["class"] = class_name
+            objects[handle] = obj_dict
+    return objects
@@ -0,0 +1,92 @@
+"""Read-only views of Gramps objects in their dictionary representation.
+
+A view resolves the members of an object only when they are accessed,
+instead of converting the whole object with ``object_to_dict`` like
+``to_dict``. Nested Gramps objects become views of their own, lists
+become lists of views, and the ``class`` key of the top-level view is
+computed from the object's class.
+"""
+
+from collections.abc import Iterator, Mapping
+from typing import Any
+
+from gramps.gen.lib.json_utils import object_to_dict
+
+
+class ObjectView(Mapping[str, Any]):
+    """A lazily converted view of a Gramps object as a dictionary.
+
+    Looks like ``to_dict(obj)`` for a top-level view, or like the dictionary
+    of a nested object (without ``class``) otherwise.
+    """
+
+    __slots__ = ("_members", "_nested", "_state", "obj")
+
+    def __init__(self, obj: Any, nested: bool = False) -> None:
+        """Initialize self."""
+        self.obj = obj
+        self._nested = nested
+        self._state: dict[str, Any] | None = None
+        # the members converted so far
+        self._members: dict[str, Any] = {}
+
+    def _get_state(self) -> dict[str, Any]:
+        """Return the (unconverted) members of the object."""
+        if self._state is None:
+            self._state = self.obj.get_object_state()
+        return self._state
+
+    def __getitem__(self, key: str) -> Any:
+        """Return a member, converted to a view if needed."""
+        if key == "class" and not self._nested:
+            return type(self.obj).__name__.lower()
+        try:
+            return self._members[key]
+        except KeyError:
+            value = self._members[key] = view(self._get_state()[key])
+            return value
+
+    def __contains__(self, key: object) -> bool:
+        """Return whether the object has a member."""
+        if key == "class" and not self._nested:
+            return True
+        return key in self._get_state()
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the member names."""
+        yield from self._get_state()
+        if not self._nested:
+            yield "class"
+
+    def __len__(self) -> int:
+        """Return the number of members."""
+        return len(self._get_state()) + (not self._nested)
+
+    def __repr__(self) -> str:
+        """Return a representation of the view."""
+        return f"ObjectView({self.obj!r})"
+
+    def to_dict(self) -> dict[str, Any]:
+        """Return the fully converted dictionary."""
+        obj_dict: dict[str, Any] = object_to_dict(self.obj)
+        if not self._nested:
+            obj_dict["class"] = obj_dict["_class"].lower()
+        return obj_dict
+
+
+def view(value: Any) -> Any:
+    """Return the dictionary representation of a member value, lazily."""
+    if isinstance(value, (float, int, str, type(None))):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [view(item) for item in value]
+    return ObjectView(value, nested=True)
+
+
+def materialize(value: Any) -> Any:
+    """Convert the views in a value to dictionaries."""
+    if isinstance(value, ObjectView):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [materialize(item) for item in value]
+    return value
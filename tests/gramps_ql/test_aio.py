@@ -0,0 +1,180 @@
+import asyncio
+import os
+import shutil
+import tempfile
+from contextlib import closing
+
+import pytest
+from gramps.cli.clidbman import CLIDbManager
+from gramps.gen.db import DbTxn
+from gramps.gen.db.utils import make_database
+from gramps.gen.dbstate import DbState
+from gramps.gen.lib import Event, EventRef, Person
+from gramps.gen.proxy import PrivateProxyDb
+
+import gramps_ql as gql
+from gramps_ql import sql
+from gramps_ql.aio import ReadPool
+from gramps_ql.gql import GQLQuery
+
+QUERIES = [
+    "class = person",
+    "class = person and gender = 1",
+    "event_ref_list.any.ref.get_event.description ~ farm",
+    "class = person order by gramps_id desc",
+    "class = tag",
+    "backlinks[0].class = person",
+    "class = person or backlinks.any.gender = 1",
+]
+
+
+@pytest.fixture(scope="module")
+def db():
+    """Return Gramps Database."""
+    TEST_GRAMPSHOME = tempfile.mkdtemp()
+    os.environ["GRAMPSHOME"] = TEST_GRAMPSHOME
+    dbman = CLIDbManager(DbState())
+    path, _name = dbman.create_new_db_cli("GQL Test", dbid="sqlite")
+    db = make_database("sqlite")
+    db.load(path)
+    with DbTxn("Add test objects", db) as trans:
+        for i in range(50):
+            event = Event()
+            event.set_handle(f"event{i:04d}")
+            event.set_description("farmer" if i % 3 else "baker")
+            db.add_event(event, trans)
+            person = Person()
+            person.set_handle(f"person{i:04d}")
+            person.set_gramps_id(f"I{i:04d}")
+            person.set_gender(i % 2)
+            person.set_privacy(i % 5 == 0)
+            ref = EventRef()
+            ref.set_reference_handle(f"event{i:04d}")
+            person.add_event_ref(ref)
+            db.add_person(person, trans)
+    yield db
+    db.close()
+    shutil.rmtree(TEST_GRAMPSHOME)
+
+
+@pytest.fixture
+def pool():
+    pool = ReadPool(max_workers=2)
+    yield pool
+    pool.close()
+
+
+async def collect(objects, stop=None):
+    result = []
+    async for obj in objects:
+        result.append(obj)
+        if len(result) == stop:
+            break
+    return result
+
+
+@pytest.mark.parametrize("residual", [False, True])
+@pytest.mark.parametrize("query", QUERIES)
+def test_same_as_iter_objects(db, pool, query, residual, monkeypatch):
+    if residual:
+        monkeypatch.setattr(sql.Translator, "translate_lookup", lambda *args: None)
+    q = GQLQuery(query, db=db)
+    expected = list(q.iter_objects(as_dict=True))
+    objects = gql.aiter_objects(query, db, as_dict=True, chunk_size=7, pool=pool)
+    assert asyncio.run(collect(objects)) == expected
+    objects = gql.aiter_objects(query, db, limit=5, offset=3, pool=pool)
+    assert [obj.handle for obj in asyncio.run(collect(objects))] == [
+        obj["handle"] for obj in expected[3:8]
+    ]
+    assert asyncio.run(gql.acount(query, db, pool=pool)) == len(expected)
+
+
+def test_concurrent(db, pool):
+    async def run():
+        return await asyncio.gather(
+            *(collect(gql.aiter_objects(query, db, pool=pool)) for query in QUERIES),
+            *(gql.acount(query, db, pool=pool) for query in QUERIES),
+        )
+
+    results = asyncio.run(run())
+    counts = [GQLQuery(query, db=db).count() for query in QUERIES]
+    assert [len(objects) for objects in results[: len(QUERIES)]] == counts
+    assert results[len(QUERIES) :] == counts
+    # every thread reuses its connection
+    assert len(pool._connections) <= 2
+
+
+def test_back_pressure(db, pool, monkeypatch):
+    read = []
+    iter_rows = sql.iter_rows
+
+    def spy(*args, **kwargs):
+        with closing(iter_rows(*args, **kwargs)) as rows:
+            for row in rows:
+                read.append(row[0])
+                yield row
+
+    monkeypatch.setattr(sql, "iter_rows", spy)
+
+    async def run():
+        objects = gql.aiter_objects(
+            "class = person", db, chunk_size=2, max_chunks=1, pool=pool
+        )
+        first = await anext(objects)
+        await asyncio.sleep(0.2)
+        # a chunk in the queue and one waiting for room
+        assert len(read) <= 6
+        await objects.aclose()
+        return first
+
+    assert asyncio.run(run()).handle == "person0000"
+    assert len(read) <= 8
+    assert asyncio.run(gql.acount("class = person", db, pool=pool)) == 50
+
+
+def test_cancel(db, pool):
+    async def run():
+        objects = gql.aiter_objects("class = person", db, chunk_size=1, pool=pool)
+        task = asyncio.create_task(collect(objects))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return await gql.acount("class = event", db, pool=pool)
+
+    assert asyncio.run(run()) == 50
+
+
+def test_worker_error(db, pool, monkeypatch):
+    def fail(*args):
+        raise RuntimeError("lookup failed")
+
+    monkeypatch.setattr(sql.Translator, "translate_lookup", lambda *args: None)
+    monkeypatch.setattr(sql, "load", fail)
+    query = "event_ref_list.any.ref.get_event.description ~ farm"
+    with pytest.raises(RuntimeError):
+        asyncio.run(collect(gql.aiter_objects(query, db, pool=pool)))
+    with pytest.raises(RuntimeError):
+        asyncio.run(gql.acount(query, db, pool=pool))
+
+
+def test_fallback(db, pool):
+    proxy = PrivateProxyDb(db)
+    objects = gql.aiter_objects("class = person", proxy, chunk_size=3, pool=pool)
+    assert len(asyncio.run(collect(objects))) == 40
+    assert asyncio.run(gql.acount("class = person", proxy, pool=pool)) == 40
+    assert pool._connections == []
+
+
+def test_fallback_without_json(db, pool, monkeypatch):
+    # the database's own connection is not shared with the worker threads
+    monkeypatch.setattr(sql, "open_database", lambda *args, **kwargs: None)
+    monkeypatch.setattr(sql, "connect", lambda db: None)
+    submit = pool.submit
+    monkeypatch.setattr(pool, "submit", lambda function: pytest.fail("submitted"))
+    objects = gql.aiter_objects("class = person", db, chunk_size=3, pool=pool)
+    assert len(asyncio.run(collect(objects))) == 50
+    assert asyncio.run(gql.acount("class = person", db, pool=pool)) == 50
+    assert not pool.readable(sql.database_file(db))
+    with pytest.raises(RuntimeError):
+        submit(lambda: pool.connection(sql.database_file(db))).result()
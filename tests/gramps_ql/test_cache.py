@@ -0,0 +1,333 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from gramps.cli.clidbman import CLIDbManager
+from gramps.gen.db import DbTxn
+from gramps.gen.db.utils import make_database
+from gramps.gen.dbstate import DbState
+from gramps.gen.lib import Person, PersonRef
+from gramps.gen.proxy import PrivateProxyDb
+
+from gramps_ql import match, query_cache, sql
+from gramps_ql.cache import CacheInfo, HandleCache, QueryCache, ResultCache
+from gramps_ql.gql import GQLQuery
+
+
+@pytest.fixture
+def db():
+    """Return Gramps Database."""
+    TEST_GRAMPSHOME = tempfile.mkdtemp()
+    os.environ["GRAMPSHOME"] = TEST_GRAMPSHOME
+    dbman = CLIDbManager(DbState())
+    path, _name = dbman.create_new_db_cli("GQL Test", dbid="sqlite")
+    db = make_database("sqlite")
+    db.load(path)
+    with DbTxn("Add test objects", db) as trans:
+        person = Person()
+        person.set_gramps_id("person001")
+        person.set_handle("handle001")
+        db.add_person(person, trans)
+        for i in range(2, 5):
+            person = Person()
+            person.set_gramps_id(f"person00{i}")
+            person.set_handle(f"handle00{i}")
+            person_ref = PersonRef()
+            person_ref.set_reference_handle("handle001")
+            person.add_person_ref(person_ref)
+            db.add_person(person, trans)
+    yield db
+    db.close()
+    shutil.rmtree(TEST_GRAMPSHOME)
+
+
+def load(class_name, handle):
+    return {"class": class_name, "handle": handle}
+
+
+def test_lookup():
+    cache = HandleCache()
+    assert cache.lookup("person", "a", load) == {"class": "person", "handle": "a"}
+    assert cache.lookup("person", "a", load) is cache.lookup("person", "a", load)
+    assert cache.lookup("person", "b", lambda *args: None) is None
+    assert cache.lookup("person", "b", load) is None
+    assert cache.info() == CacheInfo(
+        hits=3, misses=2, evictions=0, maxsize=10000, currsize=2
+    )
+
+
+def test_lru():
+    cache = HandleCache(maxsize=2)
+    cache.lookup("person", "a", load)
+    cache.lookup("person", "b", load)
+    cache.lookup("person", "a", load)
+    cache.lookup("person", "c", load)
+    assert ("person", "a") in cache
+    assert ("person", "b") not in cache
+    assert ("person", "c") in cache
+    assert cache.evictions == 1
+    cache.resize(1)
+    assert len(cache) == 1
+    assert ("person", "c") in cache
+    assert cache.evictions == 2
+    cache.clear()
+    assert cache.info() == CacheInfo(0, 0, 0, 1, 0)
+
+
+def test_disabled():
+    cache = HandleCache(maxsize=0)
+    cache.lookup("person", "a", load)
+    cache.lookup("person", "a", load)
+    assert len(cache) == 0
+    assert cache.misses == 2
+    with pytest.raises(ValueError):
+        HandleCache(maxsize=-1)
+
+
+def test_invalidate():
+    cache = HandleCache()
+    for handle in "abc":
+        cache.lookup("person", handle, load)
+        cache.lookup("note", handle, load)
+    cache.invalidate("person", ["a", "x"])
+    assert ("person", "a") not in cache
+    assert len(cache) == 5
+    cache.invalidate("note")
+    assert len(cache) == 2
+
+
+@pytest.mark.parametrize("use_sql", [True, False])
+def test_query_run(db, monkeypatch, use_sql):
+    if not use_sql:
+        monkeypatch.setattr(sql, "connect", lambda db: None)
+    loaded = []
+    get_person = db.get_person_from_handle
+
+    def get_person_from_handle(handle):
+        loaded.append(handle)
+        return get_person(handle)
+
+    monkeypatch.setattr(db, "get_person_from_handle", get_person_from_handle)
+    q = GQLQuery("person_ref_list.any.ref.get_person.gramps_id = person001", db=db)
+    assert len(list(q.iter_objects())) == 3
+    assert len(list(q.iter_objects())) == 3
+    # SQLite follows the handles itself
+    assert loaded == ([] if use_sql else ["handle001", "handle001"])
+
+
+def test_shared(db, monkeypatch):
+    monkeypatch.setattr(sql, "connect", lambda db: None)
+    cache = HandleCache()
+    q = GQLQuery(
+        "person_ref_list.any.ref.get_person.gramps_id = person001", db=db, cache=cache
+    )
+    assert len(list(q.iter_objects())) == 3
+    assert cache.info() == CacheInfo(2, 1, 0, 10000, 1)
+    assert q.match({"person_ref_list": [{"ref": "handle001"}]})
+    assert not q.match({"person_ref_list": [{"ref": "missing"}]})
+    assert cache.info() == CacheInfo(3, 2, 0, 10000, 2)
+
+
+def test_signals(db):
+    cache = HandleCache()
+    cache.connect(db)
+    q = GQLQuery("person_ref_list.any.ref.get_person.gramps_id = x", db=db, cache=cache)
+    obj = {"person_ref_list": [{"ref": "handle001"}, {"ref": "handle005"}]}
+    assert not q.match(obj)
+    assert len(cache) == 2
+    with DbTxn("Edit", db) as trans:
+        person = db.get_person_from_handle("handle001")
+        person.set_gramps_id("x")
+        db.commit_person(person, trans)
+    assert ("person", "handle001") not in cache
+    assert q.match(obj)
+    with DbTxn("Add", db) as trans:
+        person = Person()
+        person.set_handle("handle005")
+        db.add_person(person, trans)
+    assert ("person", "handle005") not in cache
+    cache.disconnect()
+    with DbTxn("Edit", db) as trans:
+        db.remove_person("handle001", trans)
+    assert ("person", "handle001") in cache
+
+
+def test_prefetch(db, monkeypatch):
+    monkeypatch.setattr(sql, "connect", lambda db: None)
+    fetched = []
+    fetch = sql.fetch
+
+    def fetch_handles(db, class_name, handles):
+        fetched.append(sorted(handles))
+        return fetch(db, class_name, handles)
+
+    monkeypatch.setattr(sql, "fetch", fetch_handles)
+    monkeypatch.setattr(db, "get_person_from_handle", None)
+    q = GQLQuery(
+        "person_ref_list.any.ref.get_person.person_ref_list.any.ref.get_person.private"
+        " or person_ref_list.any.ref.get_person.gramps_id = person001",
+        db=db,
+    )
+    assert len(list(q.iter_objects(prefetch=2))) == 3
+    assert fetched == [["handle001"]]
+
+
+def test_prefetch_proxy(db):
+    proxy = PrivateProxyDb(db)
+    q = GQLQuery("person_ref_list.any.ref.get_person.gramps_id = person001", db=proxy)
+    assert len(list(q.iter_objects(prefetch=2))) == 3
+
+
+def test_prefetch_transaction(db):
+    q = GQLQuery("person_ref_list.any.ref.get_person.gramps_id = x", db=db)
+    with DbTxn("Edit", db) as trans:
+        person = db.get_person_from_handle("handle001")
+        person.set_gramps_id("x")
+        db.commit_person(person, trans)
+        assert len(list(q.iter_objects(prefetch=10))) == 3
+
+
+def test_query_cache():
+    compiled = []
+
+    def compile(query):
+        if not query:
+            raise ValueError("Empty query")
+        compiled.append(query)
+        return query.upper()
+
+    cache = QueryCache(compile, maxsize=2)
+    assert cache.get("a") == "A"
+    assert cache.get("b") == "B"
+    assert cache.get("a") == "A"
+    assert cache.get("c") == "C"
+    assert cache.get("b") == "B"
+    assert compiled == ["a", "b", "c", "b"]
+    assert cache.info() == CacheInfo(1, 4, 2, 2, 2)
+    with pytest.raises(ValueError):
+        cache.get("")
+    assert len(cache) == 2
+    cache.resize(0)
+    assert len(cache) == 0
+    cache.get("a")
+    assert len(cache) == 0
+    cache.clear()
+    assert cache.info() == CacheInfo(0, 0, 0, 0, 0)
+
+
+def test_query_cache_threads():
+    cache = QueryCache(str.upper, maxsize=10)
+    queries = [f"q{i % 20}" for i in range(1000)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(cache.get, queries))
+    assert results == [query.upper() for query in queries]
+    info = cache.info()
+    assert info.hits + info.misses == 1000
+    assert info.currsize == 10
+
+
+def test_helpers_use_query_cache():
+    query_cache.clear()
+    assert match("class = person", {"class": "person"})
+    assert not match("class = person", {"class": "note"})
+    assert GQLQuery("class = person").root is GQLQuery("class = person").root
+    assert query_cache.info() == CacheInfo(3, 1, 0, 512, 1)
+
+
+def test_result_cache(tmp_path):
+    path = str(tmp_path / "results.db")
+    cache = ResultCache(path, maxsize=100)
+    handles = [("person", "a"), ("note", "b")]
+    assert cache.get("q", "db", "1") is None
+    cache.store("q", "db", "1", handles)
+    assert ("q", "db", "1") in cache
+    assert ("q", "db", "2") not in cache
+    assert cache.get("q", "db", "1") == handles
+    # persistent
+    assert ResultCache(path).get("q", "db", "1") == handles
+    assert cache.get("q", "other", "1") is None
+    # other revisions are removed
+    assert cache.get("q", "db", "2") is None
+    assert len(cache) == 0
+    assert cache.info() == CacheInfo(1, 3, 0, 100, 0)
+    cache.clear()
+    assert cache.info() == CacheInfo(0, 0, 0, 100, 0)
+
+
+def test_result_cache_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path / "results.db"), maxsize=60)
+    handles = [("person", "handle001")]  # 24 bytes
+    cache.store("a", "db", "1", handles)
+    cache.store("b", "db", "1", handles)
+    cache.get("a", "db", "1")
+    cache.store("c", "db", "1", handles)
+    assert cache.get("a", "db", "1") == handles
+    assert cache.get("b", "db", "1") is None
+    assert cache.get("c", "db", "1") == handles
+    assert cache.evictions == 1
+    cache.store("d", "db", "1", handles * 3)
+    assert len(cache) == 2
+    cache.resize(30)
+    assert len(cache) == 1
+    assert cache.info().currsize == 24
+
+
+def test_result_cache_query(db, tmp_path, monkeypatch):
+    results = ResultCache(str(tmp_path / "results.db"))
+    query = "person_ref_list.any.ref.get_person.gramps_id = person001"
+    expected = ["handle002", "handle003", "handle004"]
+    q = GQLQuery(query, db=db, results=results)
+    # incomplete runs are not stored
+    assert len(list(q.iter_objects(limit=2))) == 2
+    assert next(q.iter_objects()).handle == "handle002"
+    assert len(results) == 0
+    assert [obj.handle for obj in q.iter_objects()] == expected
+    assert len(results) == 1
+
+    def fail(*args, **kwargs):
+        raise AssertionError("not served from the cache")
+
+    monkeypatch.setattr(GQLQuery, "_iter_matches", fail)
+    monkeypatch.setattr(sql, "count", fail)
+    # also for equivalent query texts
+    q = GQLQuery(query.replace(" = ", "  =  "), db=db, results=results)
+    assert [obj.handle for obj in q.iter_objects()] == expected
+    assert [d["handle"] for d in q.iter_objects(as_dict=True, offset=1)] == [
+        "handle003",
+        "handle004",
+    ]
+    assert q.iter_values(["gramps_id"], limit=1).__next__() == ("person002",)
+    assert q.count() == 3
+    assert q.exists()
+    monkeypatch.undo()
+    with DbTxn("Edit", db) as trans:
+        person = db.get_person_from_handle("handle003")
+        person.set_person_ref_list([])
+        db.commit_person(person, trans)
+    assert [obj.handle for obj in q.iter_objects()] == ["handle002", "handle004"]
+    assert results.info().misses == 4
+
+
+def test_result_cache_order(db, tmp_path, monkeypatch):
+    results = ResultCache(str(tmp_path / "results.db"))
+    q = GQLQuery("class = person order by gramps_id desc", db=db, results=results)
+    expected = [f"person00{i}" for i in range(4, 0, -1)]
+    assert [obj.gramps_id for obj in q.iter_objects()] == expected
+    monkeypatch.setattr(GQLQuery, "_iter_ordered", None)
+    assert [obj.gramps_id for obj in q.iter_objects()] == expected
+    # the order is part of the key
+    q = GQLQuery("class = person order by gramps_id", db=db, results=results)
+    with pytest.raises(TypeError):
+        list(q.iter_objects())
+
+
+def test_result_cache_unused(db, tmp_path):
+    results = ResultCache(str(tmp_path / "results.db"))
+    q = GQLQuery("class = person", db=PrivateProxyDb(db), results=results)
+    assert len(list(q.iter_objects())) == 4
+    with DbTxn("Edit", db):
+        q = GQLQuery("class = person", db=db, results=results)
+        assert len(list(q.iter_objects())) == 4
+    assert len(results) == 0
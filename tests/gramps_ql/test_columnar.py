@@ -0,0 +1,104 @@
+import pytest
+
+from gramps_ql import columnar
+from gramps_ql.compiler import Quantifier
+from gramps_ql.gql import GQLQuery
+
+np = pytest.importorskip("numpy")
+
+OBJECTS = [
+    {"class": "person", "gender": 0, "private": True, "change": 1712477760},
+    {"class": "person", "gender": 1, "private": False, "change": 2**70},
+    {"class": "event", "gender": None, "private": 0, "change": 1.5},
+    {"class": "event", "gender": True, "change": "1712477760"},
+    {"class": "note", "gender": "1", "private": [], "change": [1712477760]},
+    {"class": "Note", "gender": 2.0, "private": "x"},
+    {},
+]
+
+QUERIES = [
+    "gender = 0",
+    "gender = 1",
+    "gender != 1",
+    "gender < 2",
+    "gender >= 1",
+    "gender = x",
+    "gender != x",
+    "gender ~ 1",
+    "gender !~ 1",
+    "gender > x",
+    "private",
+    "change > 1712477760",
+    "change <= 1712477760",
+    f"change < {2**80}",
+    "change ~ 1712477760",
+    "class = note",
+    "class != NOTE",
+    "class > f",
+    "class < 1",
+    "class ~ o",
+    "gender in (0, x)",
+    f"change in (1712477760, {2**80})",
+    "class in (NOTE, tag)",
+    "class =~ '^n.t'",
+    "gender =~ 1",
+    "gender = 0 or change > 2",
+    "class = person and gender = 1",
+    "private and (gender < 1 or class ~ t) and change",
+]
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_same_as_row_wise(query):
+    gq = GQLQuery(query)
+    expected = [gq.match(obj) for obj in OBJECTS]
+    mask = columnar.evaluate_batch(gq.root, OBJECTS, gq._evaluate)
+    assert mask.tolist() == expected
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_homogeneous_columns(query):
+    # columns of a single type are vectorized
+    objects = [
+        {"class": name, "gender": gender, "private": gender == 1, "change": change}
+        for name, gender, change in [
+            ("person", 0, 1712477760),
+            ("person", 1, 1712477761),
+            ("note", 2, 0),
+        ]
+    ]
+    gq = GQLQuery(query)
+    expected = [gq.match(obj) for obj in objects]
+    assert columnar.evaluate_batch(gq.root, objects, gq._evaluate).tolist() == expected
+
+
+def test_undecided_only():
+    # expensive operands are only evaluated for undecided objects
+    evaluated = []
+
+    class Recording(GQLQuery):
+        def _evaluate(self, node, obj):
+            if isinstance(node, Quantifier):
+                evaluated.append(obj)
+            return super()._evaluate(node, obj)
+
+    gq = Recording("gender = 1 and private.any = 1")
+    assert columnar.evaluate_batch(gq.root, OBJECTS, gq._evaluate).tolist() == [
+        False
+    ] * len(OBJECTS)
+    assert evaluated == [OBJECTS[1], OBJECTS[3], OBJECTS[4]]
+
+
+def test_batches():
+    gq = GQLQuery("gender > 0", columnar=True)
+    candidates = [(None, obj) for obj in OBJECTS]
+    expected = [obj for obj in OBJECTS if gq.match(obj)]
+    for size in (1, 2, 100):
+        matches = columnar.filter_batches(candidates, gq.root, gq._evaluate, size)
+        assert [obj for _obj, obj in matches] == expected
+
+
+def test_without_numpy(monkeypatch):
+    monkeypatch.setattr(columnar, "HAVE_NUMPY", False)
+    with pytest.raises(ImportError):
+        GQLQuery("gender = 1", columnar=True)
@@ -0,0 +1,168 @@
+import pytest
+
+from gramps_ql.compiler import (
+    And,
+    Backlinks,
+    Comparison,
+    Lookup,
+    Or,
+    Quantifier,
+    Step,
+    Truthiness,
+    format_node,
+    format_path,
+    has_backlinks,
+    has_lookup,
+    make_literal,
+    split_lhs,
+)
+from gramps_ql.gql import GQLQuery
+
+
+def test_split_lhs():
+    assert split_lhs("one") == ["one"]
+    assert split_lhs("one.two[0].three") == ["one", "two", 0, "three"]
+
+
+def test_literal():
+    assert make_literal("2021") == (2021, "2021")
+    assert make_literal("'John Doe'") == ("John Doe", "john doe")
+    assert make_literal('"0001"') == ("0001", "0001")
+    assert make_literal("Straße") == ("Straße", "strasse")
+    assert make_literal(-1) == (-1, "-1")
+
+
+def test_compile_single():
+    assert GQLQuery("class=person").root == Comparison(
+        ("class",), "=", "person", "person"
+    )
+    assert GQLQuery("private").root == Truthiness(("private",))
+
+
+def test_compile_in_regex():
+    root = GQLQuery("gender in (1, 'X', y)").root
+    assert root == Comparison(
+        ("gender",), "in", frozenset({1, "X", "y"}), frozenset({"1", "x", "y"})
+    )
+    assert format_node(root) == "gender in (1, X, y)"
+    root = GQLQuery("first_name =~ '^jo.*'").root
+    assert root.value.search("John")
+    assert root.folded == "^jo.*"
+    assert format_node(root) == 'first_name =~ "^jo.*"'
+    with pytest.raises(ValueError):
+        GQLQuery("first_name =~ '('")
+
+
+def test_compile_path():
+    root = GQLQuery("primary_name.surname_list[0].surname = Doe").root
+    assert root.path == ("primary_name", "surname_list", 0, "surname")
+    root = GQLQuery("media_list.length >= 10").root
+    assert root == Comparison(("media_list", Step.LENGTH), ">=", 10, "10")
+    assert format_path(root.path) == "media_list.length"
+    # only the first segment can be a property called "length"
+    assert GQLQuery("length").root == Truthiness(("length",))
+
+
+def test_compile_and_or():
+    assert GQLQuery("d or a and b and c").root == Or(
+        (
+            Truthiness(("d",)),
+            And((Truthiness(("a",)), Truthiness(("b",)), Truthiness(("c",)))),
+        )
+    )
+    assert GQLQuery("a and (b or c)").root == And(
+        (Truthiness(("a",)), Or((Truthiness(("b",)), Truthiness(("c",)))))
+    )
+
+
+def test_compile_quantifier():
+    assert GQLQuery("media_list.any.rect.length > 0").root == Quantifier(
+        ("media_list",), "any", Comparison(("rect", Step.LENGTH), ">", 0, "0")
+    )
+    assert GQLQuery("array.all = 2").root == Quantifier(
+        ("array",), "all", Comparison((), "=", 2, "2")
+    )
+
+
+def test_compile_lookup():
+    assert GQLQuery(
+        "event_ref_list.any.ref.get_event.description ~ farmer"
+    ).root == Quantifier(
+        ("event_ref_list",),
+        "any",
+        Lookup(
+            ("ref",), "event", Comparison(("description",), "~", "farmer", "farmer")
+        ),
+    )
+    assert GQLQuery("note_list.any.get_person").root == Quantifier(
+        ("note_list",), "any", Lookup((), "person", Truthiness(()))
+    )
+
+
+def test_compile_backlinks():
+    assert GQLQuery("backlinks.any.class = event").root == Backlinks(
+        Quantifier(("backlinks",), "any", Comparison(("class",), "=", "event", "event"))
+    )
+    assert GQLQuery("father_handle.get_person.backlinks").root == Lookup(
+        ("father_handle",), "person", Backlinks(Truthiness(("backlinks",)))
+    )
+    assert format_node(GQLQuery("backlinks.length > 1").root) == "backlinks.length > 1"
+
+
+def test_has_lookup_backlinks():
+    root = GQLQuery("gender = 1 or note_list.any.get_note.backlinks.length > 1").root
+    assert has_lookup(root)
+    assert has_backlinks(root)
+    root = GQLQuery("gender = 1 or note_list.any.get_note.private").root
+    assert has_lookup(root)
+    assert not has_backlinks(root)
+    assert not has_lookup(GQLQuery("gender = 1").root)
+
+
+def test_compile_invalid_quantifier():
+    with pytest.raises(ValueError):
+        GQLQuery("array.any[0] = 1")
+
+
+def test_root_is_immutable():
+    root = GQLQuery("a and b").root
+    with pytest.raises(AttributeError):
+        root.operands = ()
+    assert hash(root) == hash(GQLQuery("a and b").root)
+
+
+def test_reorder():
+    # cheap scalar conditions are evaluated before traversals
+    assert GQLQuery("note_list.any.get_note.private and class = tag").root == And(
+        (
+            Comparison(("class",), "=", "tag", "tag"),
+            Quantifier(
+                ("note_list",), "any", Lookup((), "note", Truthiness(("private",)))
+            ),
+        )
+    )
+    assert GQLQuery("a.any.b or c").root == Or(
+        (Truthiness(("c",)), Quantifier(("a",), "any", Truthiness(("b",))))
+    )
+
+
+def test_target_classes():
+    assert GQLQuery("class = tag").target_classes == {"tag"}
+    assert GQLQuery("class = person and private").target_classes == {"person"}
+    assert GQLQuery("class = person or class = note").target_classes == {
+        "person",
+        "note",
+    }
+    assert GQLQuery("_class = Family").target_classes == {"family"}
+    assert GQLQuery("class = person and class = note").target_classes == set()
+    assert len(GQLQuery("class != person").target_classes) == 9
+    assert "person" not in GQLQuery("class != person").target_classes
+    assert GQLQuery(
+        "(class = person or class = family) and (class != family or private)"
+    ).target_classes == {"person", "family"}
+    assert GQLQuery(
+        "(class = person or class = family) and class != family"
+    ).target_classes == {"person"}
+    assert len(GQLQuery("private").target_classes) == 10
+    # conditions on other objects do not restrict the classes
+    assert len(GQLQuery("note_list.any.get_note.class = note").target_classes) == 10
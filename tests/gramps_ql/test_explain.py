@@ -0,0 +1,202 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+from gramps.cli.clidbman import CLIDbManager
+from gramps.gen.db import DbTxn
+from gramps.gen.db.utils import make_database
+from gramps.gen.dbstate import DbState
+from gramps.gen.lib import Event, EventRef, Person
+from gramps.gen.proxy import PrivateProxyDb
+
+from gramps_ql import sql
+from gramps_ql.cache import HandleCache, ResultCache
+from gramps_ql.compiler import Lookup, format_node
+from gramps_ql.explain import Profile, ProfiledQuery
+from gramps_ql.gql import GQLQuery
+
+
+@pytest.fixture(scope="module")
+def db():
+    """Return Gramps Database."""
+    TEST_GRAMPSHOME = tempfile.mkdtemp()
+    os.environ["GRAMPSHOME"] = TEST_GRAMPSHOME
+    dbman = CLIDbManager(DbState())
+    path, _name = dbman.create_new_db_cli("GQL Test", dbid="sqlite")
+    db = make_database("sqlite")
+    db.load(path)
+    with DbTxn("Add test objects", db) as trans:
+        for i in range(10):
+            event = Event()
+            event.set_handle(f"event{i:04d}")
+            event.set_description("farmer" if i < 3 else "baker")
+            db.add_event(event, trans)
+            person = Person()
+            person.set_handle(f"person{i:04d}")
+            person.set_gramps_id(f"I{i:04d}")
+            person.set_gender(i % 2)
+            ref = EventRef()
+            ref.set_reference_handle(f"event{i // 2:04d}")
+            person.add_event_ref(ref)
+            db.add_person(person, trans)
+    yield db
+    db.close()
+    shutil.rmtree(TEST_GRAMPSHOME)
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "class = person and (gender = 1 or private) and gramps_id ~ 'I 1'",
+        "event_ref_list.any.ref.get_event.description ~ farm",
+        "media_list.all.citation_list.length > 0",
+        "x.get_person.primary_name.first_name = '0001'",
+        "note = '\"'",
+    ],
+)
+def test_format_node(query):
+    root = GQLQuery(query).root
+    assert GQLQuery(format_node(root)).root == root
+
+
+def test_explain_sql(db):
+    q = GQLQuery("class = person and gramps_id = I0001 order by change desc", db=db)
+    explanation = q.explain()
+    assert explanation.engine == "sqlite"
+    assert [table.class_name for table in explanation.tables] == ["person"]
+    assert "family" in explanation.skipped
+    (table,) = explanation.tables
+    assert table.residual is None
+    assert any("person_gramps_id" in detail for detail in table.plan)
+    assert explanation.order == ("change desc",)
+    assert explanation.sort == "sqlite"
+    assert explanation.cache is None
+    report = str(explanation)
+    assert "SQL: SELECT handle, json_data FROM person" in report
+    assert "Order by: change desc (in sqlite)" in report
+
+
+def test_explain_residual(db, monkeypatch):
+    monkeypatch.setattr(sql.Translator, "translate_lookup", lambda *args: None)
+    query = "gender = 1 and event_ref_list.any.ref.get_event.description ~ farm"
+    cache = HandleCache()
+    q = GQLQuery(
+        f"{query} order by event_ref_list[0].ref.get_event.description",
+        db=db,
+        cache=cache,
+    )
+    explanation = q.explain()
+    assert len(explanation.tables) == 10
+    table = explanation.tables[0]
+    assert table.residual == "event_ref_list.any.ref.get_event.description ~ farm"
+    assert explanation.order == ("event_ref_list[0].ref.get_event.description",)
+    assert explanation.sort == "python"
+    assert explanation.cache == cache.info()
+    assert "Python: event_ref_list.any" in str(explanation)
+
+
+def test_explain_python(db):
+    q = GQLQuery("class = person and gender = 1", db=PrivateProxyDb(db))
+    explanation = q.explain()
+    assert explanation.engine == "python"
+    assert [table.statement for table in explanation.tables] == [None]
+    assert explanation.tables[0].residual == "class = person and gender = 1"
+    assert "scan all rows" in str(explanation)
+    with pytest.raises(ValueError):
+        GQLQuery("class = person").explain()
+
+
+def test_explain_result_cache(db, tmp_path):
+    results = ResultCache(str(tmp_path / "results.db"))
+    q = GQLQuery("class = person and gender = 1", db=db, results=results)
+    assert q.explain().results == "miss"
+    assert "Result cache: miss" in str(q.explain())
+    assert len(list(q.iter_objects())) == 5
+    assert q.explain().results == "hit"
+    assert "Result cache: hit, the tables are not read" in str(q.explain())
+    # explaining does not count as a use of the cache
+    assert results.info().hits == 0
+    q = GQLQuery("class = person", db=PrivateProxyDb(db), results=results)
+    assert q.explain().results == "unsupported"
+    assert GQLQuery("class = person", db=db).explain().results is None
+
+
+def test_explain_columnar(db, monkeypatch):
+    pytest.importorskip("numpy")
+    monkeypatch.setattr(sql.Translator, "translate_lookup", lambda *args: None)
+    query = "gender = 1 and event_ref_list.any.ref.get_event.description ~ farm"
+    explanation = GQLQuery(query, db=db, columnar=True).explain()
+    assert explanation.columnar
+    assert "Columnar: Python conditions matched in batches" in str(explanation)
+    assert not GQLQuery(query, db=db).explain().columnar
+    # without conditions left to Python, or sorted by SQLite
+    assert not GQLQuery("gender = 1", db=db, columnar=True).explain().columnar
+    q = GQLQuery(f"{query} order by gramps_id", db=db, columnar=True)
+    assert not q.explain().columnar
+    q = GQLQuery(query, db=PrivateProxyDb(db), columnar=True)
+    assert q.explain().columnar
+
+
+@pytest.mark.parametrize("python", [False, True])
+def test_profile(db, python, monkeypatch):
+    if python:
+        monkeypatch.setattr(sql, "connect", lambda db: None)
+    monkeypatch.setattr(sql.Translator, "translate_lookup", lambda *args: None)
+    query = "class = person and event_ref_list.any.ref.get_event.description ~ farm"
+    q = ProfiledQuery(query, db=db)
+    expected = [obj.handle for obj in GQLQuery(query, db=db).iter_objects()]
+    assert [obj.handle for obj in q.iter_objects()] == expected
+    profile = q.profile
+    assert list(profile.tables) == ["person"]
+    table = profile.tables["person"]
+    assert (table.read, table.matched, table.converted) == (10, 6, 6)
+    lookup = next(
+        stats for stats in profile.nodes.values() if isinstance(stats.node, Lookup)
+    )
+    assert lookup.evaluations == 10
+    assert lookup.matches == 6
+    assert lookup.selectivity == 0.6
+    assert lookup.seconds > 0
+    assert profile.lookups == {lookup.node: 10}
+    # five events, looked up twice each
+    assert profile.loads == {lookup.node: 5}
+    assert profile.seconds > 0
+    report = str(profile)
+    assert "   10        6        60.0%" in report
+    assert "ref.get_event.description ~ farm: 10 lookups, 5 loaded" in report
+    assert list(q.iter_objects(as_dict=True, limit=2))
+    assert profile.tables["person"].converted == 6
+
+
+def test_profile_lookups_by_node(db, monkeypatch):
+    monkeypatch.setattr(sql.Translator, "translate_lookup", lambda *args: None)
+    q = ProfiledQuery(
+        "class = person and (event_ref_list.any.ref.get_event.description = farmer"
+        " or event_ref_list.any.ref.get_event.description = baker)",
+        db=db,
+    )
+    assert len(list(q.iter_objects())) == 10
+    farmer, baker = (node for node in q.profile.nodes if isinstance(node, Lookup))
+    # the second condition is only evaluated for the 4 people who are not
+    # farmers, whose events were all loaded by the first one
+    assert q.profile.lookups == {farmer: 10, baker: 4}
+    assert q.profile.loads == {farmer: 5}
+    report = str(q.profile)
+    assert "ref.get_event.description = farmer: 10 lookups, 5 loaded" in report
+    assert "ref.get_event.description = baker: 4 lookups, 0 loaded" in report
+    q = ProfiledQuery("class = event and backlinks[0].class = person", db=db)
+    assert len(list(q.iter_objects())) == 5
+    assert q.profile.lookups == {q.root.operands[1]: 10}
+
+
+def test_profile_sql(db):
+    profile = Profile()
+    q = ProfiledQuery("class = person and gender = 1", db=db, profile=profile)
+    assert len(list(q.iter_objects(as_dict=True))) == 5
+    # the condition is evaluated by SQLite
+    assert all(stats.evaluations == 0 for stats in profile.nodes.values())
+    assert profile.tables["person"].read == 5
+    q = ProfiledQuery("class = person order by gramps_id desc", db=db, profile=profile)
+    assert len(list(q.iter_objects(as_dict=True, limit=3))) == 3
+    assert profile.tables["person"].read == 8
@@ -9,6 +9,7 @@ from gramps.gen.db.utils import make_database
 from gramps.gen.dbstate import DbState
 from gramps.gen.lib import Note, Person, PersonRef
 
+from gramps_ql import sql
 from gramps_ql.gql import GQLQuery
 
 
@@ -70,3 +71,22 @@ def test_get_note(db):
 def test_get_note_0(db):
     q = GQLQuery("note_list.any.get_person", db=db)
     assert len(list(q.iter_objects())) == 0
+
+
+def test_get_short_circuit(db, monkeypatch):
+    # match in Python rather than SQLite
+    monkeypatch.setattr(sql, "connect", lambda db: None)
+    lookups = []
+    get_note_from_handle = db.get_note_from_handle
+
+    def counting_get_note_from_handle(handle):
+        lookups.append(handle)
+        return get_note_from_handle(handle)
+
+    monkeypatch.setattr(db, "get_note_from_handle", counting_get_note_from_handle)
+    q = GQLQuery("class=tag and note_list.any.get_note.gramps_id = note003", db=db)
+    assert len(list(q.iter_objects())) == 0
+    assert lookups == []
+    q = GQLQuery("class=person and note_list.any.get_note.gramps_id = note003", db=db)
+    assert len(list(q.iter_objects())) == 1
+    assert lookups == ["handle003"]
@@ -0,0 +1,183 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+from gramps.cli.clidbman import CLIDbManager
+from gramps.gen.db import DbTxn
+from gramps.gen.db.utils import make_database
+from gramps.gen.dbstate import DbState
+from gramps.gen.lib import Date, Event, EventRef, Person, Tag
+from gramps.gen.proxy import PrivateProxyDb
+
+from gramps_ql import index, sql
+from gramps_ql.gql import GQLQuery
+
+QUERIES = [
+    "class = event and date.sortval > 2400000",
+    "date.sortval <= 2400000",
+    "date.sortval = 0",
+    "description = FARMER",
+    "description = 1912",
+    "description = 5",
+    "description = 'straße'",
+    "description >= f",
+    "description < b",
+    "gramps_id = e0003",
+    "gramps_id > E0003",
+    "handle = EVENT0001",
+    "tag_list ~ tag0000",
+    "tag_list ~ tag0002",
+    "tag_list ~ TAG0000",
+    "description in (FARMER, 'straße', 5)",
+    "gramps_id in (e0001, E0002)",
+    "description =~ '^s'",
+    "event_ref_list.any.ref.get_event.description = farmer",
+    "event_ref_list.any.ref.get_event.date.sortval < 2400000",
+    "event_ref_list.all.ref.get_event.description = baker",
+    "backlinks.any.description = farmer",
+]
+
+
+@pytest.fixture(scope="module")
+def db():
+    """Return Gramps Database."""
+    TEST_GRAMPSHOME = tempfile.mkdtemp()
+    os.environ["GRAMPSHOME"] = TEST_GRAMPSHOME
+    dbman = CLIDbManager(DbState())
+    path, _name = dbman.create_new_db_cli("GQL Test", dbid="sqlite")
+    db = make_database("sqlite")
+    db.load(path)
+    with DbTxn("Add test objects", db) as trans:
+        for i in range(2):
+            tag = Tag()
+            tag.set_handle(f"tag{i:04d}")
+            tag.set_name(f"tag {i}")
+            db.add_tag(tag, trans)
+        descriptions = ["Farmer", "farmer", "STRASSE", "Straße", "baker", 5, "", "1912"]
+        for i, description in enumerate(descriptions):
+            event = Event()
+            event.set_handle(f"event{i:04d}")
+            event.set_gramps_id(f"E{i:04d}")
+            event.set_description(description)
+            if i:
+                event.set_date_object(Date(1800 + 40 * i, 1, 1))
+            event.set_tag_list([f"tag{i % 2:04d}"])
+            db.add_event(event, trans)
+        person = Person()
+        person.set_handle("person0000")
+        person.set_tag_list(["tag0000", "tag0001"])
+        for handle in ["event0001", "event0004"]:
+            event_ref = EventRef()
+            event_ref.set_reference_handle(handle)
+            person.add_event_ref(event_ref)
+        db.add_person(person, trans)
+    index.create_index(db, "event", "date.sortval")
+    index.create_index(db, "event", "description")
+    yield db
+    db.close()
+    shutil.rmtree(TEST_GRAMPSHOME)
+
+
+def handles(objects):
+    """Return the sorted handles of objects."""
+    return sorted(obj["handle"] for obj in objects)
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_same_as_python(db, query):
+    q = GQLQuery(query, db=db)
+    expected = handles(
+        GQLQuery(query, db=PrivateProxyDb(db)).iter_objects(as_dict=True)
+    )
+    assert handles(q.iter_objects(as_dict=True)) == expected
+    assert q.count() == len(expected)
+
+
+def query_plan(db, query, class_name="event"):
+    """Return the SQLite query plan of a query for a table."""
+    connection = sql.connect(db)
+    q = GQLQuery(query, db=db)
+    table_plan = sql.plan(q.root, class_name, q._evaluate, sql.indexes(connection))
+    statement, params = table_plan.select()
+    rows = connection.execute(f"EXPLAIN QUERY PLAN {statement}", params).fetchall()
+    connection.close()
+    return " ".join(row[-1] for row in rows)
+
+
+def test_index_used(db):
+    name = index.index_name("event", "date.sortval")
+    assert f"USING INDEX {name}" in query_plan(db, "date.sortval > 2400000")
+    name = index.index_name("event", "description")
+    assert f"USING INDEX {name}" in query_plan(db, "description = farmer")
+    assert "event_gramps_id" in query_plan(db, "gramps_id = e0001")
+    assert "USING INDEX sqlite_autoindex_event_1" in query_plan(db, "handle = x")
+    assert "reference_ref_handle" in query_plan(db, "tag_list ~ tag0000", "person")
+    name = index.index_name("event", "description")
+    assert f"USING INDEX {name}" in query_plan(db, "description in (farmer, 5)")
+    assert "event_gramps_id" in query_plan(db, "gramps_id in (e0001, x)")
+    assert "SCAN" in query_plan(db, "date.sortval != 0")
+    assert "USING INDEX" not in query_plan(db, "description ~ farmer")
+    # the persons referring to the matching events are found with the indexes
+    plan = query_plan(db, "event_ref_list.any.ref.get_event.description = a", "person")
+    assert f"USING INDEX {name}" in plan
+    assert "reference_ref_handle" in plan
+
+
+def test_list_create_drop(db):
+    indexes = index.list_indexes(db)
+    assert index.Index("event", "gramps_id", "event_gramps_id", True) in indexes
+    assert index.Index("person", "handle", "sqlite_autoindex_person_1", True) in indexes
+    created = [i for i in indexes if not i.builtin]
+    assert [(i.class_name, i.field) for i in created] == [
+        ("event", "date.sortval"),
+        ("event", "description"),
+    ]
+    new = index.create_index(db, "person", "primary_name.surname_list[0].surname")
+    assert new.name == index.index_name(
+        "person", "primary_name.surname_list[00].surname"
+    )
+    assert new in index.list_indexes(db)
+    assert index.create_index(db, "person", new.field) == new
+    index.drop_index(db, "person", new.field)
+    assert new not in index.list_indexes(db)
+    index.drop_index(db, "person", new.field)
+
+
+def test_index_updated(db):
+    with DbTxn("Edit", db) as trans:
+        event = db.get_event_from_handle("event0004")
+        event.set_description("Farmer")
+        db.commit_event(event, trans)
+    q = GQLQuery("description = farmer", db=db)
+    assert handles(q.iter_objects(as_dict=True)) == [
+        "event0000",
+        "event0001",
+        "event0004",
+    ]
+    with DbTxn("Edit", db) as trans:
+        event.set_description("baker")
+        db.commit_event(event, trans)
+    assert q.count() == 2
+
+
+def test_invalid(db):
+    for field in ["tag_list.length", "place.get_place.name", "a = b", "tag_list.any"]:
+        with pytest.raises(ValueError):
+            index.create_index(db, "event", field)
+    with pytest.raises(ValueError):
+        index.create_index(db, "foo", "gramps_id")
+    with pytest.raises(ValueError):
+        index.list_indexes(PrivateProxyDb(db))
+
+
+def test_case_variants():
+    assert sorted(sql.case_variants("i0")) == ["I0", "i0"]
+    assert set(sql.case_variants("ss")) == {
+        *(a + b for a in "sSſ" for b in "sSſ"),
+        "ß",
+        "ẞ",
+    }
+    assert sql.case_variants("k") is not None and "K" in sql.case_variants("k")
+    assert sql.case_variants("abcdefghijk") is None
+    assert sql.case_variants("") == [""]
@@ -9,6 +9,7 @@ from gramps.gen.db.utils import make_database
 from gramps.gen.dbstate import DbState
 from gramps.gen.lib import Note, Person, Tag
 
+from gramps_ql import sql
 from gramps_ql.gql import GQLQuery
 
 
@@ -82,3 +83,36 @@ def test_tag(db):
     assert len(list(q.iter_objects())) == 1
     q = GQLQuery("class=tag and name=othertag", db=db)
     assert len(list(q.iter_objects())) == 0
+
+
+def test_only_target_tables(db, monkeypatch):
+    monkeypatch.setattr(sql, "connect", lambda db: None)
+
+    def fail():
+        raise AssertionError("table should not be read")
+
+    monkeypatch.setattr(db, "get_person_cursor", fail)
+    monkeypatch.setattr(db, "get_note_cursor", fail)
+    q = GQLQuery("class=tag or class=family", db=db)
+    assert len(list(q.iter_objects())) == 1
+
+
+def test_as_dict(db):
+    q = GQLQuery("class=note or class=person", db=db)
+    objects = list(q.iter_objects(as_dict=True))
+    assert [obj["class"] for obj in objects] == ["person", "note"]
+    assert objects[0]["gramps_id"] == "person001"
+    assert objects[1]["text"]["string"] == "Hello world"
+    assert [obj["_class"] for _obj, obj in q._matches_python()] == [
+        "Person",
+        "Note",
+    ]
+
+
+def test_objects_from_raw_data(db, monkeypatch):
+    monkeypatch.setattr(sql, "connect", lambda db: None)
+    q = GQLQuery("class=note", db=db)
+    (note,) = q.iter_objects()
+    assert isinstance(note, Note)
+    assert note.get() == "Hello world"
+    assert note.serialize() == db.get_note_from_handle(note.handle).serialize()
@@ -0,0 +1,143 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+from gramps.cli.clidbman import CLIDbManager
+from gramps.gen.db import DbTxn
+from gramps.gen.db.utils import make_database
+from gramps.gen.dbstate import DbState
+from gramps.gen.lib import Family, Note, Person
+
+from gramps_ql import sql
+from gramps_ql.live import Delta, LiveQuery
+
+
+@pytest.fixture
+def db():
+    """Return Gramps Database."""
+    TEST_GRAMPSHOME = tempfile.mkdtemp()
+    os.environ["GRAMPSHOME"] = TEST_GRAMPSHOME
+    dbman = CLIDbManager(DbState())
+    path, _name = dbman.create_new_db_cli("GQL Test", dbid="sqlite")
+    db = make_database("sqlite")
+    db.load(path)
+    with DbTxn("Add test objects", db) as trans:
+        for i, text in enumerate(["farmer", "baker"]):
+            note = Note()
+            note.set_handle(f"note{i}")
+            note.set(text)
+            db.add_note(note, trans)
+        for i in range(3):
+            person = Person()
+            person.set_handle(f"person{i}")
+            person.set_gender(i % 2)
+            if i < 2:
+                person.add_note(f"note{i}")
+            db.add_person(person, trans)
+    yield db
+    db.close()
+    shutil.rmtree(TEST_GRAMPSHOME)
+
+
+def commit(db, obj):
+    with DbTxn("Edit", db) as trans:
+        getattr(db, f"commit_{obj.__class__.__name__.lower()}")(obj, trans)
+
+
+def test_changes(db):
+    deltas = []
+    live = LiveQuery("class = person and gender = 1", db, deltas.append)
+    live.connect()
+    assert live.matches == {("person", "person1")}
+    for handle, gender in [("person0", 1), ("person1", 0)]:
+        person = db.get_person_from_handle(handle)
+        person.set_gender(gender)
+        commit(db, person)
+    with DbTxn("Edit", db) as trans:
+        db.remove_person("person0", trans)
+        db.add_family(Family(), trans)
+    assert deltas == [
+        # the initial matches
+        Delta(frozenset({("person", "person1")}), frozenset()),
+        Delta(frozenset({("person", "person0")}), frozenset()),
+        Delta(frozenset(), frozenset({("person", "person1")})),
+        Delta(frozenset(), frozenset({("person", "person0")})),
+    ]
+    assert len(live) == 0
+    live.disconnect()
+    person = db.get_person_from_handle("person2")
+    person.set_gender(1)
+    commit(db, person)
+    assert len(deltas) == 4
+    assert live.refresh() == Delta(frozenset({("person", "person2")}), frozenset())
+
+
+@pytest.mark.parametrize("use_sql", [True, False])
+def test_lookups(db, monkeypatch, use_sql):
+    if not use_sql:
+        monkeypatch.setattr(sql, "connect", lambda db: None)
+    deltas = []
+    live = LiveQuery("note_list.any.get_note.text.string ~ farm", db, deltas.append)
+    live.connect()
+    assert live.matches == {("person", "person0")}
+    assert live._dependents == {
+        ("note", "note0"): {("person", "person0")},
+        ("note", "note1"): {("person", "person1")},
+    }
+    note = db.get_note_from_handle("note1")
+    note.set("farm")
+    commit(db, note)
+    assert ("person", "person1") in live
+    with DbTxn("Edit", db) as trans:
+        db.remove_note("note0", trans)
+    assert ("person", "person0") not in live
+    # the removed note is still watched
+    note = Note()
+    note.set_handle("note0")
+    note.set("farmhouse")
+    with DbTxn("Add", db) as trans:
+        db.add_note(note, trans)
+    assert ("person", "person0") in live
+    # a changed reference replaces the looked up objects
+    person = db.get_person_from_handle("person1")
+    person.set_note_list(["note2"])
+    commit(db, person)
+    assert ("person", "person1") not in live
+    assert ("note", "note1") not in live._dependents
+    assert deltas == [
+        Delta(frozenset({("person", "person0")}), frozenset()),
+        Delta(frozenset({("person", "person1")}), frozenset()),
+        Delta(frozenset(), frozenset({("person", "person0")})),
+        Delta(frozenset({("person", "person0")}), frozenset()),
+        Delta(frozenset(), frozenset({("person", "person1")})),
+    ]
+
+
+@pytest.mark.parametrize("use_sql", [True, False])
+def test_backlinks(db, monkeypatch, use_sql):
+    if not use_sql:
+        monkeypatch.setattr(sql, "connect", lambda db: None)
+    deltas = []
+    live = LiveQuery("class = note and backlinks.any.gender = 1", db, deltas.append)
+    live.connect()
+    assert live.matches == {("note", "note1")}
+    # a new reference adds a backlink to the referred object
+    person = db.get_person_from_handle("person2")
+    person.set_gender(1)
+    person.add_note("note0")
+    commit(db, person)
+    assert ("note", "note0") in live
+    # a removed reference removes it
+    person.set_note_list([])
+    commit(db, person)
+    assert ("note", "note0") not in live
+    with DbTxn("Edit", db) as trans:
+        db.remove_person("person1", trans)
+    assert len(live) == 0
+    assert deltas == [
+        Delta(frozenset({("note", "note1")}), frozenset()),
+        Delta(frozenset({("note", "note0")}), frozenset()),
+        Delta(frozenset(), frozenset({("note", "note0")})),
+        Delta(frozenset(), frozenset({("note", "note1")})),
+    ]
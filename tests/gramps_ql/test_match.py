@@ -1,3 +1,4 @@
+import pytest
 from gramps.gen.lib import Note, Person, Tag
 
 from gramps_ql import match
@@ -93,6 +94,28 @@ def test_array_not_contains():
     assert not q.match({"array": [1, 2, 3]})
 
 
+def test_in():
+    q = GQLQuery("value in (abc, 'Straße', 2)")
+    assert q.match({"value": "ABC"})
+    assert q.match({"value": "STRASSE"})
+    assert q.match({"value": 2})
+    assert q.match({"value": "2"})
+    assert not q.match({"value": "ab"})
+    assert not q.match({"value": [2]})
+    assert not q.match({"value": {"abc": 1}})
+    assert not q.match({})
+
+
+def test_regex():
+    q = GQLQuery("value =~ '^jo(hn|e)$'")
+    assert q.match({"value": "John"})
+    assert q.match({"value": "JOE"})
+    assert not q.match({"value": "Johnny"})
+    assert not q.match({"value": ["John"]})
+    assert GQLQuery("value =~ 2").match({"value": "x2"})
+    assert not GQLQuery("value =~ 2").match({"value": 2})
+
+
 def test_any():
     q = GQLQuery("array.any = 2")
     assert not q.match({"array": []})
@@ -166,3 +189,52 @@ def test_match_tag():
     tag.set_name("mytag")
     assert match("name = mytag", tag)
     assert not match("name = othertag", tag)
+
+
+def test_backlinks_without_db():
+    q = GQLQuery("backlinks.length = 0")
+    assert q.match({"class": "note"})
+    with pytest.raises(ValueError):
+        q.match({"class": "note", "handle": "n1"})
+
+
+class CountingDb:
+    """Fake database that records handle lookups."""
+
+    def __init__(self):
+        self.lookups = []
+
+    def get_note_from_handle(self, handle):
+        self.lookups.append(handle)
+        note = Note()
+        note.set_handle(handle)
+        note.set("Hello world")
+        return note
+
+
+def test_and_short_circuit():
+    db = CountingDb()
+    q = GQLQuery("note_list.any.get_note.text.string ~ hello and class = tag", db=db)
+    assert not q.match({"class": "person", "note_list": ["n1", "n2"]})
+    assert db.lookups == []
+    assert q.match({"class": "tag", "note_list": ["n1", "n2"]})
+    # any stops at the first matching item
+    assert db.lookups == ["n1"]
+
+
+def test_or_short_circuit():
+    db = CountingDb()
+    q = GQLQuery("note_list.any.get_note.text.string ~ bye or private", db=db)
+    assert q.match({"private": True, "note_list": ["n1"]})
+    assert db.lookups == []
+    assert not q.match({"private": False, "note_list": ["n1"]})
+    assert db.lookups == ["n1"]
+
+
+def test_all_short_circuit():
+    db = CountingDb()
+    q = GQLQuery("array.all.value = a")
+    assert not q.match({"array": [{"value": "b"}, {"value": "a"}, 1]})
+    q = GQLQuery("note_list.all.get_note.text.string ~ bye", db=db)
+    assert not q.match({"note_list": ["n1", "n2"]})
+    assert db.lookups == ["n1"]
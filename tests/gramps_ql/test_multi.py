@@ -0,0 +1,160 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+
+import pytest
+from gramps.cli.clidbman import CLIDbManager
+from gramps.gen.db import DbTxn
+from gramps.gen.db.utils import make_database
+from gramps.gen.dbstate import DbState
+from gramps.gen.lib import ChildRef, Event, EventRef, Family, Person, Tag
+from gramps.gen.proxy import PrivateProxyDb
+
+import gramps_ql as gql
+from gramps_ql import sql
+from gramps_ql.gql import GQLQuery
+from gramps_ql.multi import MultiQuery
+
+QUERIES = [
+    "class = person",
+    "gender = 1",
+    "class = person and gender = 1",
+    "private or description ~ farm",
+    "event_ref_list.any.ref.get_event.description ~ farm",
+    "gender = 1 and event_ref_list.any.ref.get_event.description ~ farm",
+    "class = family and child_ref_list.all.ref.get_person.gender = 0",
+    "class = tag",
+    "class = citation",
+]
+
+
+@pytest.fixture(scope="module")
+def db():
+    """Return Gramps Database."""
+    TEST_GRAMPSHOME = tempfile.mkdtemp()
+    os.environ["GRAMPSHOME"] = TEST_GRAMPSHOME
+    dbman = CLIDbManager(DbState())
+    path, _name = dbman.create_new_db_cli("GQL Test", dbid="sqlite")
+    db = make_database("sqlite")
+    db.load(path)
+    with DbTxn("Add test objects", db) as trans:
+        tag = Tag()
+        tag.set_handle("tag0000")
+        tag.set_name("mytag")
+        db.add_tag(tag, trans)
+        for i in range(10):
+            event = Event()
+            event.set_handle(f"event{i:04d}")
+            event.set_description(["farmer", "baker"][i % 2])
+            db.add_event(event, trans)
+        for i in range(30):
+            person = Person()
+            person.set_handle(f"person{i:04d}")
+            person.set_gender(i % 3)
+            person.set_privacy(i % 7 == 0)
+            for j in range(i % 4):
+                ref = EventRef()
+                ref.set_reference_handle(f"event{(i + j) % 10:04d}")
+                person.add_event_ref(ref)
+            db.add_person(person, trans)
+        for i in range(5):
+            family = Family()
+            family.set_handle(f"family{i:04d}")
+            for j in range(i % 3 + 1):
+                ref = ChildRef()
+                ref.set_reference_handle(f"person{3 * i + j:04d}")
+                family.add_child_ref(ref)
+            db.add_family(family, trans)
+    yield db
+    db.close()
+    shutil.rmtree(TEST_GRAMPSHOME)
+
+
+def expected_matches(queries, db):
+    """Return the IDs of the matching queries by handle, one query at a time."""
+    matches = {}
+    for query_id, query in queries.items():
+        for obj in GQLQuery(query, db=db).iter_objects(as_dict=True):
+            matches.setdefault(obj["handle"], []).append(query_id)
+    return {handle: tuple(ids) for handle, ids in matches.items()}
+
+
+def test_same_as_separate(db):
+    queries = dict(enumerate(QUERIES))
+    matches = {obj.handle: ids for obj, ids in gql.iter_matches(QUERIES, db)}
+    assert matches == expected_matches(queries, db)
+
+
+def test_same_as_separate_python(db, monkeypatch):
+    monkeypatch.setattr(sql, "connect", lambda db: None)
+    queries = dict(enumerate(QUERIES))
+    matches = {obj.handle: ids for obj, ids in gql.iter_matches(QUERIES, db)}
+    assert matches == expected_matches(queries, db)
+
+
+def test_proxy(db):
+    proxy = PrivateProxyDb(db)
+    queries = {"private": "private", "female": "gender = 0"}
+    matches = {
+        obj["handle"]: ids
+        for obj, ids in gql.iter_matches(queries, proxy, as_dict=True)
+    }
+    assert matches == expected_matches(queries, proxy)
+    assert matches
+
+
+def test_ids(db):
+    queries = {"men": "class = person and gender = 1", "tags": "class = tag"}
+    matches = list(gql.iter_matches(queries, db, as_dict=True))
+    assert [ids for _obj, ids in matches] == [("men",)] * 10 + [("tags",)]
+    assert matches[-1][0]["name"] == "mytag"
+    assert [ids for _obj, ids in gql.iter_matches(["class = tag"] * 2, db)] == [(0, 1)]
+
+
+def test_skip_tables(db, monkeypatch):
+    tables = []
+    iter_rows_many = sql.iter_rows_many
+
+    def spy(connection, plans):
+        tables.append(plans[0].class_name)
+        return iter_rows_many(connection, plans)
+
+    monkeypatch.setattr(sql, "iter_rows_many", spy)
+    list(gql.iter_matches(["class = tag", "class = person and private"], db))
+    assert tables == ["person", "tag"]
+
+
+def test_shared_nodes(db):
+    multi = MultiQuery(
+        ["gender = 1 and private", "private or gender = 1", "gender = 2"], db
+    )
+    assert multi.roots[0].operands[0] is multi.roots[1].operands[1]
+    assert len(multi.shared_nodes) == 2
+    assert multi.shared_paths == {("gender",)}
+
+
+def test_rows_many_evaluates_once():
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE person (handle TEXT, json_data TEXT)")
+    connection.executemany(
+        "INSERT INTO person VALUES (?, '{}')", [(f"p{i}",) for i in range(10)]
+    )
+    calls = []
+    connection.create_function("flag", 1, lambda x: calls.append(x) or x)
+    plans = [sql.TablePlan("person", "flag(?)", (value,), None) for value in (1, 0)]
+    with connection:
+        rows = list(sql.iter_rows_many(connection, plans))
+    assert [flags for _handle, _json, *flags in rows] == [[1, 0]] * 10
+    assert len(calls) == 20
+    connection.close()
+
+
+def test_no_db():
+    with pytest.raises(ValueError):
+        list(gql.iter_matches(["class = person"], None))
+
+
+def test_order_by(db):
+    with pytest.raises(ValueError):
+        gql.iter_matches(["class = person", "class = note order by gramps_id"], db)
@@ -0,0 +1,179 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+from gramps.cli.clidbman import CLIDbManager
+from gramps.gen.db import DbTxn
+from gramps.gen.db.utils import make_database
+from gramps.gen.dbstate import DbState
+from gramps.gen.lib import ChildRef, Event, EventRef, Family, Person
+from gramps.gen.proxy import PrivateProxyDb
+
+from gramps_ql import parallel, sql
+from gramps_ql.cache import HandleCache, ResultCache
+from gramps_ql.gql import GRAMPS_OBJECT_NAMES, GQLQuery
+
+QUERIES = [
+    "class = person",
+    "gender = 1",
+    "private or description ~ farm",
+    "event_ref_list.any.ref.get_event.description ~ farm",
+    "class = family and child_ref_list.all.ref.get_person.gender = 0",
+    "class = tag",
+    "backlinks[0].class = family",
+    "class = note or backlinks[0].gramps_id = x",
+    "(class = person or backlinks[0].class = family) and gender = 1",
+    "backlinks.length > 2",
+]
+
+
+@pytest.fixture(scope="module")
+def db():
+    """Return Gramps Database."""
+    TEST_GRAMPSHOME = tempfile.mkdtemp()
+    os.environ["GRAMPSHOME"] = TEST_GRAMPSHOME
+    dbman = CLIDbManager(DbState())
+    path, _name = dbman.create_new_db_cli("GQL Test", dbid="sqlite")
+    db = make_database("sqlite")
+    db.load(path)
+    with DbTxn("Add test objects", db) as trans:
+        for i in range(20):
+            event = Event()
+            event.set_handle(f"event{i:04d}")
+            event.set_description(["farmer", "baker"][i % 2])
+            db.add_event(event, trans)
+        # handles are not inserted in order
+        for i in reversed(range(50)):
+            person = Person()
+            person.set_handle(f"person{i:04d}")
+            person.set_gender(i % 3)
+            person.set_privacy(i % 7 == 0)
+            for j in range(i % 4):
+                ref = EventRef()
+                ref.set_reference_handle(f"event{(i + j) % 20:04d}")
+                person.add_event_ref(ref)
+            db.add_person(person, trans)
+        for i in range(10):
+            family = Family()
+            family.set_handle(f"family{i:04d}")
+            for j in range(i % 3 + 1):
+                ref = ChildRef()
+                ref.set_reference_handle(f"person{3 * i + j:04d}")
+                family.add_child_ref(ref)
+            db.add_family(family, trans)
+    yield db
+    db.close()
+    shutil.rmtree(TEST_GRAMPSHOME)
+
+
+def ordered_handles(q):
+    """Return the handles of the matching objects by table and handle."""
+    tables = list(GRAMPS_OBJECT_NAMES)
+    objects = q.iter_objects(as_dict=True)
+    return [
+        obj["handle"]
+        for obj in sorted(
+            objects, key=lambda obj: (tables.index(obj["class"]), obj["handle"])
+        )
+    ]
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_same_as_serial(db, query):
+    q = GQLQuery(query, db=db)
+    expected = ordered_handles(q)
+    objects = list(parallel.iter_objects_parallel(q, workers=2, chunk_size=7))
+    assert [obj.handle for obj in objects] == expected
+    objects = parallel.iter_objects_parallel(
+        q, workers=2, ordered=False, as_dict=True, chunk_size=7
+    )
+    assert sorted(obj["handle"] for obj in objects) == sorted(expected)
+
+
+def test_method(db):
+    q = GQLQuery("class = person and gender = 2", db=db)
+    objects = list(q.iter_objects_parallel(workers=2))
+    assert [obj.handle for obj in objects] == ordered_handles(q)
+
+
+def test_close_early(db):
+    q = GQLQuery("class = person", db=db)
+    objects = parallel.iter_objects_parallel(q, workers=2, chunk_size=5)
+    assert next(objects).handle == "person0000"
+    objects.close()
+
+
+def test_fallback(db):
+    q = GQLQuery("class = person and private", db=PrivateProxyDb(db))
+    assert list(parallel.iter_objects_parallel(q, workers=2)) == []
+
+
+def test_order_by(db):
+    q = GQLQuery("class = person and gender = 2 order by gramps_id desc", db=db)
+    objects = list(parallel.iter_objects_parallel(q, workers=2))
+    assert [obj.handle for obj in objects] == [obj.handle for obj in q.iter_objects()]
+
+
+def test_handle_ranges(db):
+    connection = sql.connect(db)
+    ranges = sql.handle_ranges(connection, "person", 20)
+    assert ranges == [
+        (None, "person0020"),
+        ("person0020", "person0040"),
+        ("person0040", None),
+    ]
+    assert sql.handle_ranges(connection, "tag", 20) == [(None, None)]
+    connection.close()
+
+
+def test_worker_residual(db, monkeypatch):
+    monkeypatch.setattr(sql.Translator, "translate_lookup", lambda *args: None)
+    query = "class = person and event_ref_list.any.ref.get_event.description = baker"
+    q = GQLQuery(query, db=db)
+    assert sql.plan(q.root, "person", q._evaluate).residual is not None
+    for columnar in [False, True]:
+        parallel._init_worker(sql.database_file(db), query, 10, columnar)
+        try:
+            assert parallel._worker.query.columnar == columnar
+            assert parallel._worker.query.cache.maxsize == 10
+            handles = parallel._match_range("person", "person0010", "person0020")
+        finally:
+            parallel._worker.connection.close()
+            parallel._worker = None
+        assert handles == [
+            handle
+            for handle in ordered_handles(q)
+            if "person0010" <= handle < "person0020"
+        ]
+
+
+def test_options(db, monkeypatch):
+    initargs = []
+    executor = parallel.ProcessPoolExecutor
+
+    def recording_executor(**kwargs):
+        initargs.append(kwargs["initargs"][2:])
+        return executor(**kwargs)
+
+    monkeypatch.setattr(parallel, "ProcessPoolExecutor", recording_executor)
+    q = GQLQuery("gender = 1", db=db, cache=HandleCache(5), columnar=True)
+    objects = list(parallel.iter_objects_parallel(q, workers=2))
+    assert [obj.handle for obj in objects] == ordered_handles(q)
+    assert initargs == [(5, True)]
+
+
+def test_result_cache(db, tmp_path, monkeypatch):
+    results = ResultCache(str(tmp_path / "results.sqlite"))
+    query = "class = person and gender = 1"
+    q = GQLQuery(query, db=db, results=results)
+    expected = ordered_handles(GQLQuery(query, db=db))
+    objects = parallel.iter_objects_parallel(q, workers=2, chunk_size=7)
+    assert [obj.handle for obj in objects] == expected
+    key = q._result_key()
+    assert key in results
+    assert [handle for _class, handle in results.get(*key)] == expected
+    # served without workers
+    monkeypatch.setattr(parallel, "_match_range", None)
+    objects = parallel.iter_objects_parallel(q, workers=2, as_dict=True)
+    assert [obj["handle"] for obj in objects] == expected
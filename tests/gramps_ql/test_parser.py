@@ -0,0 +1,171 @@
+import random
+import subprocess
+import sys
+
+import pyparsing as pp
+import pytest
+
+from gramps_ql import parse
+from gramps_ql.parser import parse_query
+
+QUERIES = [
+    "class=person",
+    "class=person or date.year > 2021",
+    "class=person or name='John Doe' and date.year > 2021",
+    "(((((((((((class=person or name='John Doe')))) and date.year > 2021)))))))",
+    "(a or b) and (c or d) and e",
+    "a=b and c=d or e",
+    "a AND b Or c",
+    "(a)and(b)",
+    "a = b = c",
+    "a=and",
+    "a or or",
+    "and",
+    "a[007].b",
+    "äb = x",
+    "a= 'x''y'",
+    'a="x\\"y"',
+    "a=x.y_z",
+    " a\n=\nb ",
+    "",
+    "  ",
+    "=x",
+    "1a",
+    "a=b c",
+    "a=<b",
+    "a and",
+    "a and$ b",
+    "a and1 b",
+    "a.b [0]",
+    "a .b",
+    "a.0",
+    "a[x]",
+    "a = ä",
+    "a = 'x",
+    'a="x""',
+    "(a",
+    "a)",
+    "(a b)",
+    "((a and (b)",
+    "(a = 'x)",
+    "a and (b c)",
+    "a = b or (",
+    "a order by b",
+    "(a or b) and c ORDER  BY x[007].y DESC , z",
+    "a=b order by c,",
+    "a order by",
+    "a order",
+    "a order by b descx",
+    "a order by b asc desc",
+    "a order by b c",
+    "a and order by b",
+    "order = 1 order by order",
+    "a = order by b",
+    "a orderby b",
+    "a order by b.any, c",
+    "a =~ '^x.*y$'",
+    "a=~b",
+    "a = ~b",
+    "a in (x, 'y z', 1)",
+    'a IN(x)and b in ( "c" )',
+    "a in ()",
+    "a in (x,)",
+    "a in (x y)",
+    "a in x",
+    "a in (x",
+    "a in (x) = y",
+    "in in (in, and)",
+    "ain (x)",
+    "a[0]in(x)",
+    "a in (x) order by b",
+]
+
+WORDS = [
+    *("a", "b.c", "x[0]", "y[007].z", "ä", "ß", "_", "andx", "ora", "1", "2021"),
+    *("=", "!=", "<=", "<", "~", "!~", "=~", "and", "AND", "or", "Or", "(", ")"),
+    *("in", "IN", "(x, y)", "('a', 1)"),
+    *("'q s'", '"d"', "'", '"', "$", ".", "[", "]", "\n"),
+    *("order", "by", "ORDER BY", "asc", "Desc", ","),
+]
+
+
+def pyparsing_result(query):
+    try:
+        return parse(query).as_list()
+    except pp.ParseException as exc:
+        return exc.loc, exc.msg
+
+
+def parser_result(query):
+    try:
+        return parse_query(query)
+    except pp.ParseException as exc:
+        return exc.loc, exc.msg
+
+
+def random_condition(rng):
+    lhs = rng.choice(["a", "b.c", "x[0]", "and", "or", "é.ß"])
+    if rng.random() < 0.3:
+        return lhs
+    if rng.random() < 0.2:
+        rhs = rng.choice(["(x)", "( 'a b' ,1)", "(x, and)", "(x,)", "()"])
+        return lhs + rng.choice([" in ", " IN", " in"]) + rhs
+    operator = rng.choice(["=", "!=", "<=", "~", ">", "=~"])
+    rhs = rng.choice(["x", "'a b'", '"c"', "1", "and", "a.b"])
+    return lhs + rng.choice(["", " "]) + operator + rng.choice(["", " "]) + rhs
+
+
+def random_query(rng, depth=0):
+    r = rng.random()
+    if depth > 4 or r < 0.3:
+        return random_condition(rng)
+    if r < 0.5:
+        return "(" + random_query(rng, depth + 1) + rng.choice(["", " "]) + ")"
+    logical = rng.choice(["and", "or", "AND", "Or"])
+    return f"{random_query(rng, depth + 1)} {logical} {random_query(rng, depth + 1)}"
+
+
+def random_queries(seed, number):
+    rng = random.Random(seed)
+    for _ in range(number):
+        query = random_query(rng)
+        if rng.random() < 0.3:
+            # make it invalid (most of the time)
+            i = rng.randrange(len(query) + 1)
+            query = query[:i] + rng.choice(["(", ")", " and", "=", "'"]) + query[i:]
+        yield query
+        if rng.random() < 0.2:
+            keys = rng.choices(["a", "b.c desc", "x[0] ASC", "and", "1"], k=2)
+            yield f"{query} order by {', '.join(keys)}"
+        yield "".join(
+            rng.choice(WORDS) + rng.choice(["", " "]) for _ in range(rng.randint(1, 8))
+        )
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_same_as_pyparsing(query):
+    assert parser_result(query) == pyparsing_result(query)
+
+
+def test_random_same_as_pyparsing():
+    for query in random_queries(seed=42, number=500):
+        assert parser_result(query) == pyparsing_result(query), query
+
+
+def test_error():
+    with pytest.raises(pp.ParseException) as exc_info:
+        parse_query("class = person and (")
+    assert str(exc_info.value) == (
+        "Expected end of text, found 'and'  (at char 15), (line:1, col:16)"
+    )
+
+
+def test_no_pyparsing_import():
+    code = (
+        "import sys, gramps_ql; gramps_ql.match('a = b', {'a': 'b'}); "
+        "print('pyparsing' in sys.modules)"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert output.strip() == "False"
@@ -0,0 +1,563 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+from gramps.cli.clidbman import CLIDbManager
+from gramps.gen.db import DbTxn
+from gramps.gen.db.utils import make_database
+from gramps.gen.dbstate import DbState
+from gramps.gen.lib import (
+    Attribute,
+    ChildRef,
+    Date,
+    Event,
+    EventRef,
+    EventType,
+    Family,
+    Name,
+    Note,
+    Person,
+    Surname,
+    Tag,
+)
+from gramps.gen.proxy import PrivateProxyDb
+from pyparsing import ParseException
+
+import gramps_ql as gql
+from gramps_ql import sql
+from gramps_ql.cache import HandleCache
+from gramps_ql.gql import GRAMPS_OBJECT_NAMES, GQLQuery, from_dict, to_dict
+from gramps_ql.views import ObjectView
+
+QUERIES = [
+    "class = person",
+    "class != person",
+    "class = tag or class = note",
+    "private",
+    "gender = 0",
+    "gender != 1",
+    "gender < 1",
+    "gender > 0",
+    "gramps_id = I0001",
+    "gramps_id = i0001",
+    "gramps_id != I0001",
+    "gramps_id > I0001",
+    "gramps_id <= 'I0001'",
+    "gramps_id ~ 000",
+    "gramps_id !~ 000",
+    "gramps_id = 0",
+    "gramps_id < 1",
+    "gramps_id.length = 5",
+    "primary_name.first_name = 'ä'",
+    "primary_name.first_name ~ NN",
+    "primary_name.surname_list[0].surname = STRASSE",
+    "primary_name.surname_list[0].surname ~ 'straß'",
+    "primary_name.surname_list[1].surname",
+    "primary_name.surname_list.length > 1",
+    "primary_name.surname_list.length",
+    "primary_name.surname_list = x",
+    "primary_name.surname_list != x",
+    "primary_name = x",
+    "primary_name != x",
+    "primary_name ~ first_name",
+    "primary_name !~ first_name",
+    "primary_name ~ 1",
+    "primary_name.length > 5",
+    "primary_name",
+    "primary_name.first_name",
+    "primary_name.length.x = 1",
+    "tag_list ~ tag0001",
+    "tag_list !~ tag0001",
+    "tag_list",
+    "tag_list.length = 0",
+    "tag_list.any = TAG0001",
+    "tag_list.any = tag0001",
+    "tag_list.all ~ 0001",
+    "event_ref_list.any.role.value = 1",
+    "event_ref_list.all.role.value = 1",
+    "event_ref_list.any.ref.get_event.description ~ farmer",
+    "event_ref_list.all.ref.get_event.description ~ farmer",
+    "event_ref_list.any.ref.get_event.class = event",
+    "event_ref_list.any.ref.get_event.class = person",
+    "event_ref_list.any.ref.get_person",
+    "event_ref_list.any.ref.get_foo",
+    "event_ref_list.any.get_event",
+    "event_ref_list.any.attribute_list.any.value ~ x",
+    "class = event and date.dateval[2] > 1900",
+    "class = event and date.modifier = 0 and date.dateval[2] >= 1900",
+    "date.sortval > 0",
+    "description",
+    "description = ''",
+    "class = family and child_ref_list.length = 2",
+    "class = family and child_ref_list.all.ref.get_person.gender = 0",
+    "class = family and child_ref_list.any.ref.get_person.gender = 1",
+    "father_handle.get_person.primary_name.first_name = anna",
+    "class = note and text.string ~ hello",
+    "class = note and text.string !~ hello",
+    "text.tags.length = 0",
+    "name = mytag or name = Other",
+    "color",
+    "gramps_id.any = I",
+    "change > 0",
+    "family_list.any.get_family.child_ref_list.any.ref.get_person.private",
+    "(class = person or class = family) and (private or gramps_id ~ 2)",
+    "class = person and not_a_property",
+    "class = person and not_a_property != x",
+    "_class = Person",
+    "handle = person0001",
+    "gramps_id in (I0001, i0002, x)",
+    "gramps_id in (0, 'I0003')",
+    "gender in (0, 2)",
+    "gender in (x, 1)",
+    "gramps_id.length in (5, 6)",
+    "class in (person, NOTE)",
+    "primary_name.surname_list[0].surname in ('STRASSE', 'müller')",
+    "primary_name in (x)",
+    "tag_list in (tag0000)",
+    "tag_list.any in (TAG0000, x)",
+    "gramps_id =~ '^i000[12]$'",
+    "description =~ 'farm|bak'",
+    "primary_name.first_name =~ '^ä$'",
+    "gender =~ 1",
+    "primary_name =~ first",
+    "tag_list =~ tag",
+    "backlinks",
+    "backlinks.length",
+    "backlinks.length > 1",
+    "backlinks.length in (1, 3)",
+    "backlinks.length = x",
+    "backlinks.any.class = family",
+    "backlinks.any.gender = 1",
+    "backlinks.all.class = person",
+    "backlinks.all.private",
+    "class = event and backlinks.any.primary_name.first_name = anna",
+    "backlinks.any.backlinks.any.class = family",
+    "backlinks.any.event_ref_list.any.ref.get_event.description ~ farm",
+    "father_handle.get_person.backlinks.length = 1",
+    "class = tag and backlinks.length = 0",
+    "handle.get_person.gender = 1",
+    "event_ref_list.any.ref.get_event.description ~ farm and gender = 1",
+    "child_ref_list.all.ref.get_person.tag_list.any.get_tag.name = other",
+    "gramps_id[0] = i",
+    "gramps_id[1] = 0",
+    "description[0] = f",
+    "description[0]",
+    "text.string[0] ~ h",
+    "primary_name.surname_list[0].surname[0] = s",
+    "primary_name.any = first_name",
+    "event_ref_list.any.ref[0] = e",
+    "event_ref_list.any.ref.get_event.description[0] = f",
+]
+
+# queries matched in Python: integer steps and any/all on strings or objects,
+# which SQLite's JSON functions only support for arrays
+RESIDUAL = {
+    "gramps_id.any = I",
+    "gramps_id[0] = i",
+    "gramps_id[1] = 0",
+    "description[0] = f",
+    "description[0]",
+    "text.string[0] ~ h",
+    "primary_name.surname_list[0].surname[0] = s",
+    "primary_name.any = first_name",
+    "event_ref_list.any.ref[0] = e",
+    "event_ref_list.any.ref.get_event.description[0] = f",
+}
+
+
+@pytest.fixture(scope="module")
+def db():
+    """Return Gramps Database."""
+    TEST_GRAMPSHOME = tempfile.mkdtemp()
+    os.environ["GRAMPSHOME"] = TEST_GRAMPSHOME
+    dbman = CLIDbManager(DbState())
+    path, _name = dbman.create_new_db_cli("GQL Test", dbid="sqlite")
+    db = make_database("sqlite")
+    db.load(path)
+    with DbTxn("Add test objects", db) as trans:
+        for i, (name, color) in enumerate([("mytag", "#000"), ("other", "")]):
+            tag = Tag()
+            tag.set_handle(f"tag{i:04d}")
+            tag.set_name(name)
+            tag.set_color(color)
+            db.add_tag(tag, trans)
+        for i, description in enumerate(["Farmer", "farmer's son", "", "Baker"]):
+            event = Event()
+            event.set_handle(f"event{i:04d}")
+            event.set_gramps_id(f"E{i:04d}")
+            event.set_type(EventType.OCCUPATION)
+            event.set_description(description)
+            event.set_date_object(Date(1850 + 30 * i, 1, 1))
+            db.add_event(event, trans)
+        people = [
+            ("Anna", ["Straße"], 0, False, ["tag0001"], [0, 1]),
+            ("Ä", ["Müller", "Schmidt"], 1, True, [], [2]),
+            ("Johann", [], 1, False, ["tag0000", "tag0001"], [3, 0]),
+            ("", ["Doe"], 2, True, [], []),
+        ]
+        for i, (first, surnames, gender, private, tags, events) in enumerate(people):
+            person = Person()
+            person.set_handle(f"person{i:04d}")
+            person.set_gramps_id(f"I{i:04d}")
+            name = Name()
+            name.set_first_name(first)
+            for surname in surnames:
+                s = Surname()
+                s.set_surname(surname)
+                name.add_surname(s)
+            person.set_primary_name(name)
+            person.set_gender(gender)
+            person.set_privacy(private)
+            person.set_tag_list(tags)
+            for event in events:
+                ref = EventRef()
+                ref.set_reference_handle(f"event{event:04d}")
+                if event == 1:
+                    attribute = Attribute()
+                    attribute.set_value("x")
+                    ref.add_attribute(attribute)
+                person.add_event_ref(ref)
+            if i < 3:
+                person.add_family_handle("family0000")
+            db.add_person(person, trans)
+        family = Family()
+        family.set_handle("family0000")
+        family.set_gramps_id("F0000")
+        family.set_father_handle("person0000")
+        for child in ["person0001", "person0002"]:
+            ref = ChildRef()
+            ref.set_reference_handle(child)
+            family.add_child_ref(ref)
+        db.add_family(family, trans)
+        for i, text in enumerate(["Hello world", "Bye"]):
+            note = Note()
+            note.set_handle(f"note{i:04d}")
+            note.set_gramps_id(f"N{i:04d}")
+            note.set(text)
+            db.add_note(note, trans)
+    yield db
+    db.close()
+    shutil.rmtree(TEST_GRAMPSHOME)
+
+
+def handles(objects):
+    return sorted(obj.handle for obj in objects)
+
+
+def reference(q):
+    """Match all Gramps objects of the database in Python."""
+    for objects_name in GRAMPS_OBJECT_NAMES.values():
+        for obj in getattr(q.db, f"iter_{objects_name}")():
+            if q.match(to_dict(obj)):
+                yield obj
+
+
+def python_objects(q, prefetch=0):
+    """Match all candidates of the query in Python."""
+    for obj, obj_dict in q._matches_python(prefetch):
+        yield obj if obj is not None else from_dict(obj_dict)
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_same_as_python(db, query):
+    q = GQLQuery(query, db=db)
+    expected = handles(reference(q))
+    assert handles(q.iter_objects()) == expected
+    assert handles(python_objects(q)) == expected
+    q = GQLQuery(query, db=db, cache=HandleCache())
+    assert handles(python_objects(q, prefetch=3)) == expected
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_columnar_same_as_python(db, query):
+    pytest.importorskip("numpy")
+    expected = handles(reference(GQLQuery(query, db=db)))
+    q = GQLQuery(query, db=db, columnar=True)
+    assert handles(python_objects(q)) == expected
+    assert handles(python_objects(q, prefetch=3)) == expected
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_views_same_as_dicts(db, query):
+    q = GQLQuery(query, db=db)
+    for objects_name in GRAMPS_OBJECT_NAMES.values():
+        for obj in getattr(db, f"iter_{objects_name}")():
+            assert q.match(ObjectView(obj)) == q.match(to_dict(obj))
+
+
+@pytest.mark.parametrize("query", [q for q in QUERIES if q not in RESIDUAL])
+def test_fully_translated(db, query):
+    q = GQLQuery(query, db=db)
+    for class_name in q.target_classes:
+        assert sql.plan(q.root, class_name, q._evaluate).residual is None
+
+
+@pytest.mark.parametrize("query", sorted(RESIDUAL))
+def test_residual_for_non_arrays(db, query):
+    q = GQLQuery(query, db=db)
+    assert any(
+        sql.plan(q.root, class_name, q._evaluate).residual is not None
+        for class_name in q.target_classes
+    )
+
+
+def test_queries_match_something(db):
+    # make sure the test data is meaningful for most queries
+    matching = [q for q in QUERIES if list(GQLQuery(q, db=db).iter_objects())]
+    assert len(matching) > 0.75 * len(QUERIES)
+
+
+def test_plan_class():
+    q = GQLQuery("class = person and private")
+    assert sql.plan(q.root, "person", q._evaluate).where.startswith("1 AND")
+    assert sql.plan(q.root, "family", q._evaluate).where.startswith("0 AND")
+
+
+def test_residual(db, monkeypatch):
+    # conditions that cannot be translated are matched in Python
+    translate_lookup = sql.Translator.translate_lookup
+    monkeypatch.setattr(sql.Translator, "translate_lookup", lambda *args: None)
+    q = GQLQuery(
+        "gender = 0 and event_ref_list.any.ref.get_event.description ~ farmer", db=db
+    )
+    table_plan = sql.plan(q.root, "person", q._evaluate)
+    assert table_plan.residual == q.root.operands[1]
+    assert handles(q.iter_objects()) == ["person0000"]
+    monkeypatch.setattr(sql.Translator, "translate_lookup", translate_lookup)
+    assert handles(q.iter_objects()) == ["person0000"]
+
+
+def test_plan_backlinks(db):
+    # lookups are only inverted with an index
+    q = GQLQuery("event_ref_list.any.ref.get_event.description = farmer", db=db)
+    assert "reference" not in sql.plan(q.root, "person", q._evaluate).where
+    indexes = {"event": {"$.description": "gql_event_description"}}
+    table_plan = sql.plan(q.root, "person", q._evaluate, indexes)
+    assert table_plan.where.startswith("t0.handle IN (SELECT r")
+    assert "Person" in table_plan.params
+    # but not the lookup of the object itself, which has no reference
+    q = GQLQuery("handle.get_person.gramps_id = x", db=db)
+    indexes = {"person": {"$.gramps_id": "person_gramps_id"}}
+    assert "reference" not in sql.plan(q.root, "person", q._evaluate, indexes).where
+    # backlinks by position are matched in Python
+    q = GQLQuery("backlinks[0].class = person", db=db)
+    table_plan = sql.plan(q.root, "event", q._evaluate)
+    assert table_plan.residual == q.root
+    assert handles(q.iter_objects()) == handles(python_objects(q))
+
+
+def test_fallback_without_sql(db):
+    proxy = PrivateProxyDb(db)
+    assert sql.connect(proxy) is None
+    q = GQLQuery("class = person", db=proxy)
+    assert handles(q.iter_objects()) == ["person0000", "person0002"]
+    assert list(q.iter_objects(as_dict=True)) == [
+        to_dict(obj) for obj in q.iter_objects()
+    ]
+    assert (
+        q.iter_values(["primary_name"]).__next__()[0]
+        == to_dict(proxy.get_person_from_handle("person0000"))["primary_name"]
+    )
+
+
+def test_fallback_in_transaction(db):
+    assert sql.connect(db) is not None
+    with DbTxn("Edit", db) as trans:
+        assert sql.connect(db) is None
+        person = db.get_person_from_handle("person0000")
+        person.set_gramps_id("I9999")
+        db.commit_person(person, trans)
+        q = GQLQuery("gramps_id = I9999", db=db)
+        assert handles(q.iter_objects()) == ["person0000"]
+        person.set_gramps_id("I0000")
+        db.commit_person(person, trans)
+
+
+@pytest.mark.parametrize("mode", ["sql", "residual", "python"])
+@pytest.mark.parametrize("query", QUERIES)
+def test_count_exists_limit_offset(db, query, mode, monkeypatch):
+    if mode == "residual":
+        monkeypatch.setattr(sql.Translator, "translate_lookup", lambda *args: None)
+        monkeypatch.setattr(sql.Translator, "translate_comparison", lambda *args: None)
+    elif mode == "python":
+        monkeypatch.setattr(sql, "connect", lambda db: None)
+    q = GQLQuery(query, db=db)
+    expected = [obj.handle for obj in q.iter_objects()]
+    assert q.count() == len(expected)
+    assert q.exists() == bool(expected)
+    for limit, offset in [(None, 1), (2, 0), (1, 3), (0, 0), (3, 2), (None, 100)]:
+        objects = q.iter_objects(as_dict=True, limit=limit, offset=offset)
+        end = None if limit is None else offset + limit
+        assert [obj["handle"] for obj in objects] == expected[offset:end]
+
+
+def test_count_sql(db, monkeypatch):
+    def fail(*args):
+        raise AssertionError("rows are counted in SQLite")
+
+    monkeypatch.setattr(sql, "iter_rows", fail)
+    assert gql.count("class = person or class = tag", db) == 6
+    assert gql.count("class = note and private", db) == 0
+
+
+def test_limit_stops_reading(db, monkeypatch):
+    read = []
+    row_candidates = GQLQuery._row_candidates
+
+    def spy(rows, class_name):
+        for candidate in row_candidates(rows, class_name):
+            read.append(candidate[1]["handle"])
+            yield candidate
+
+    monkeypatch.setattr(GQLQuery, "_row_candidates", staticmethod(spy))
+    q = GQLQuery("class = person or class = event", db=db)
+    assert gql.exists("class = person", db)
+    assert len(read) == 1
+    read.clear()
+    assert len(list(q.iter_objects(limit=2, offset=5))) == 2
+    # the people are skipped by counting them in SQLite
+    assert [handle[:5] for handle in read] == ["event", "event"]
+
+
+def test_invalid_limit_offset(db):
+    q = GQLQuery("class = person", db=db)
+    with pytest.raises(ValueError):
+        list(q.iter_objects(limit=-1))
+    with pytest.raises(ValueError):
+        list(q.iter_objects(offset=-1))
+    with pytest.raises(ValueError):
+        GQLQuery("class = person").count()
+
+
+@pytest.mark.parametrize("python", [False, True])
+def test_iter_values(db, python, monkeypatch):
+    if python:
+        monkeypatch.setattr(sql, "connect", lambda db: None)
+    fields = [
+        "gramps_id",
+        "primary_name.surname_list[0].surname",
+        "primary_name.surname_list.length",
+        "family_list[0].get_family.gramps_id",
+        "family_list[0].get_family.father_handle.get_person.primary_name",
+        "not_a_property",
+    ]
+    father_name = to_dict(db.get_person_from_handle("person0000"))["primary_name"]
+    q = GQLQuery("class = person and gender = 1", db=db)
+    assert list(q.iter_values(fields)) == [
+        ("I0001", "Müller", 2, "F0000", father_name, None),
+        ("I0002", None, 0, "F0000", father_name, None),
+    ]
+    assert list(q.iter_values(["gramps_id"], as_dict=True, offset=1)) == [
+        {"gramps_id": "I0002"}
+    ]
+
+
+def test_iter_values_without_objects(db, monkeypatch):
+    def fail(*args):
+        raise AssertionError("no objects are created")
+
+    monkeypatch.setattr(gql.gql, "from_dict", fail)
+    monkeypatch.setattr(gql.gql, "object_to_dict", fail)
+    values = gql.iter_values("class = note", db, ["gramps_id", "text.string"])
+    assert list(values) == [("N0000", "Hello world"), ("N0001", "Bye")]
+
+
+def test_iter_values_invalid(db):
+    q = GQLQuery("class = person", db=db)
+    for field in ["gramps_id = I0001", "a and b", "event_ref_list.any.ref", ""]:
+        with pytest.raises((ValueError, ParseException)):
+            list(q.iter_values([field]))
+
+
+ORDERS = [
+    "class = person order by gramps_id desc",
+    "class = person order by gender, primary_name.first_name desc",
+    "handle order by class, gramps_id",
+    "handle order by change desc, handle",
+    "private order by primary_name.surname_list[0].surname",
+    "class = person and gender = 1 order by tag_list",
+    "class = person order by event_ref_list.length desc, handle desc",
+    "class = person order by family_list[0].get_family.gramps_id, gramps_id",
+    "class = event order by date.sortval desc",
+    "class = event and description ~ farmer order by description",
+    "gramps_id order by not_a_property, handle",
+    "class != person order by private desc, name, handle",
+    "class = event order by description[1], handle desc",
+]
+
+
+@pytest.mark.parametrize("mode", ["sql", "residual", "python"])
+@pytest.mark.parametrize("query", ORDERS)
+def test_order_by(db, query, mode, monkeypatch):
+    q = GQLQuery(query, db=db)
+    expected = [(obj["class"], obj["handle"]) for obj in q.iter_objects(as_dict=True)]
+    assert len(expected) == q.count()
+    reference = GQLQuery(query.split(" order by ")[0], db=db)
+    assert sorted(expected) == sorted(
+        (obj["class"], obj["handle"]) for obj in reference.iter_objects(as_dict=True)
+    )
+    if mode == "residual":
+        monkeypatch.setattr(sql.Translator, "translate_lookup", lambda *args: None)
+        monkeypatch.setattr(sql.Translator, "translate_comparison", lambda *args: None)
+    elif mode == "python":
+        monkeypatch.setattr(sql, "connect", lambda db: None)
+    q = GQLQuery(query, db=db)
+    for limit, offset in [(None, 0), (None, 1), (2, 0), (1, 3), (3, 2), (1, 100)]:
+        objects = q.iter_objects(as_dict=True, limit=limit, offset=offset)
+        end = None if limit is None else offset + limit
+        assert [(obj["class"], obj["handle"]) for obj in objects] == expected[
+            offset:end
+        ]
+
+
+def test_order_by_values(db):
+    def ids(query, **kwargs):
+        return [
+            values[0] for values in gql.iter_values(query, db, ["gramps_id"], **kwargs)
+        ]
+
+    assert ids("class = person order by gramps_id desc") == [
+        "I0003",
+        "I0002",
+        "I0001",
+        "I0000",
+    ]
+    assert ids("class = person order by gender desc, gramps_id desc", limit=3) == [
+        "I0003",
+        "I0002",
+        "I0001",
+    ]
+    assert ids("class = event ORDER BY date.sortval DESC", offset=1, limit=2) == [
+        "E0002",
+        "E0001",
+    ]
+    # missing values come first, then numbers, strings and other values
+    assert ids("class = person order by primary_name.surname_list[0].surname") == [
+        "I0002",
+        "I0003",
+        "I0001",
+        "I0000",
+    ]
+    # lists and objects are sorted by their JSON text
+    assert ids("class = person order by tag_list, gramps_id") == [
+        "I0002",
+        "I0000",
+        "I0001",
+        "I0003",
+    ]
+
+
+def test_order_by_limit(db, monkeypatch):
+    sorted_rows = sql.iter_sorted_rows
+    limits = []
+
+    def spy(connection, table_plan, keys, limit=None):
+        limits.append(limit)
+        return sorted_rows(connection, table_plan, keys, limit)
+
+    monkeypatch.setattr(sql, "iter_sorted_rows", spy)
+    q = GQLQuery("class = person or class = note order by change desc", db=db)
+    assert len(list(q.iter_objects(limit=2, offset=1))) == 2
+    # only the first offset + limit rows of each table are sorted
+    assert limits == [3, 3]
@@ -0,0 +1,86 @@
+from gramps.gen.lib import Date, Event, EventRef, Name, Person, Surname
+
+import gramps_ql as gql
+from gramps_ql.gql import from_dict, to_dict
+from gramps_ql.views import ObjectView, materialize
+
+
+def make_person():
+    person = Person()
+    person.set_handle("person0000")
+    person.set_gramps_id("I0000")
+    name = Name()
+    name.set_first_name("Anna")
+    surname = Surname()
+    surname.set_surname("Straße")
+    name.add_surname(surname)
+    person.set_primary_name(name)
+    ref = EventRef()
+    ref.set_reference_handle("event0000")
+    person.add_event_ref(ref)
+    return person
+
+
+def test_same_as_dict():
+    person = make_person()
+    obj_dict = to_dict(person)
+    view = ObjectView(person)
+    assert view == obj_dict
+    assert obj_dict == view
+    assert view.to_dict() == obj_dict
+    assert materialize(view) == obj_dict
+    assert len(view) == len(obj_dict)
+    assert list(view) == list(obj_dict)
+    assert view["class"] == "person"
+    assert view["_class"] == "Person"
+    assert "class" in view
+    assert "foo" not in view
+
+
+def test_nested():
+    view = ObjectView(make_person())
+    name = view["primary_name"]
+    assert isinstance(name, ObjectView)
+    assert "class" not in name
+    assert name["first_name"] == "Anna"
+    assert name["surname_list"][0]["surname"] == "Straße"
+    assert isinstance(view["event_ref_list"], list)
+    assert (
+        materialize(view["event_ref_list"]) == to_dict(make_person())["event_ref_list"]
+    )
+    # tuples become lists like in the dictionary representation
+    event = Event()
+    event.set_date_object(Date(1900, 2, 3))
+    assert ObjectView(event)["date"]["dateval"] == [3, 2, 1900, False]
+
+
+def test_lazy():
+    view = ObjectView(make_person())
+    assert view["class"] == "person"
+    assert view._state is None
+    name = view["primary_name"]
+    assert view["primary_name"] is name
+    assert name._state is None
+
+
+def test_match():
+    person = make_person()
+    view = ObjectView(person)
+    for query in [
+        "class = person and primary_name.first_name = anna",
+        "primary_name.surname_list[0].surname ~ 'straß'",
+        "event_ref_list.any.ref = event0000",
+        "event_ref_list.length = 1",
+        "primary_name.length > 5",
+        "primary_name = x",
+        "primary_name ~ first_name",
+        "private",
+    ]:
+        expected = gql.match(query, to_dict(person))
+        assert gql.match(query, view) == expected
+        assert gql.match(query, person) == expected
+
+
+def test_from_dict():
+    person = make_person()
+    assert from_dict(ObjectView(person)) is person